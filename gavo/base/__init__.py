@@ -70,6 +70,7 @@ from gavo.base.sqlsupport import (getDBConnection,
 	NullConnection,
 	getTableConn, getAdminConn, getUntrustedConn,
 	getWritableTableConn, getWritableAdminConn, getWritableUntrustedConn,
+	closeConnectionPools, getPoolStats,
 	setDBMeta, getDBMeta)
 
 from gavo.base.structure import (Structure, ParseableStructure, 
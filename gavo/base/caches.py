@@ -18,6 +18,10 @@ This can return True if the resource is out of date and should be reloaded.
 
 An alternative interface to registering caches is the registerCache function
 (see there).
+
+To keep a cache from growing without bounds, pass LRUCache arguments
+(maxItems, maxBytes, ttl, sizeOf) to makeCache.  All LRUCaches share
+a global memory limit that can be set using setMemoryLimit.
 """
 
 #c Copyright 2008-2017, the GAVO project
@@ -26,6 +30,206 @@ An alternative interface to registering caches is the registerCache function
 #c COPYING file in the source distribution.
 
 
+import collections
+import itertools
+import sys
+import threading
+import time
+import weakref
+
+
+class MemoryBudget(object):
+	"""a limit on the total size of the items in a set of LRUCaches.
+
+	When an item added to one of the caches makes the total size exceed
+	limit bytes, the least recently used items of all caches are evicted
+	until the total fits again.  A limit of None means no limit.
+	"""
+	def __init__(self, limit=None):
+		self.limit = limit
+		self.caches = weakref.WeakSet()
+		self.lock = threading.Lock()
+
+	def register(self, cache):
+		self.caches.add(cache)
+
+	def getTotalBytes(self):
+		return sum(cache.currentBytes for cache in list(self.caches))
+
+	def enforce(self):
+		"""evicts items until the total size of the items in our caches
+		is within limit.
+		"""
+		if self.limit is None:
+			return
+		with self.lock:
+			while self.getTotalBytes()>self.limit:
+				candidates = [c for c in list(self.caches) if len(c)]
+				if not candidates:
+					break
+				min(candidates, key=lambda c: c.getOldestUse()).evictOldest()
+
+
+_globalBudget = MemoryBudget()
+
+# a global sequence to order uses of items in different LRUCaches
+_useSequence = itertools.count()
+
+
+def setMemoryLimit(limit):
+	"""sets the maximum number of bytes all LRUCaches may hold together
+	(None for no limit).
+	"""
+	_globalBudget.limit = limit
+	_globalBudget.enforce()
+
+
+def _estimateSize(ob):
+	"""returns a rough estimate of the memory ob occupies.
+
+	This is the default sizeOf function of LRUCaches.
+	"""
+	if isinstance(ob, basestring):
+		return len(ob)
+	return sys.getsizeof(ob)
+
+
+class LRUCache(object):
+	"""a dictionary-like cache with size accounting and LRU eviction.
+
+	maxItems and maxBytes limit the number of items and their total size,
+	where the size of an item is what sizeOf(item) returns.  When
+	an insertion exceeds a limit, the least recently used items are evicted.
+	Items older than ttl seconds are treated as absent.  Pass None
+	for any of these to not limit in this respect.
+
+	In addition, each LRUCache counts against a MemoryBudget, by default
+	the global one (see setMemoryLimit).
+
+	The cache keeps hits, misses, and evictions counters; lookups through
+	in count as misses only when they fail, such that the common
+	"if key in cache: return cache[key]" idiom is counted correctly.
+	"""
+	def __init__(self, name="anonymous", maxItems=None, maxBytes=None, 
+			ttl=None, sizeOf=_estimateSize, budget=_globalBudget):
+		self.name = name
+		self.maxItems, self.maxBytes, self.ttl = maxItems, maxBytes, ttl
+		self.sizeOf = sizeOf
+		self.budget = budget
+		# key -> [value, size, creation time, sequence number of last use]
+		self.items = collections.OrderedDict()
+		self.currentBytes = 0
+		self.hits = self.misses = self.evictions = 0
+		self.lock = threading.RLock()
+		if budget is not None:
+			budget.register(self)
+
+	def __len__(self):
+		return len(self.items)
+
+	def _getEntry(self, key):
+		"""returns the entry for key, marking it as recently used, or
+		None if key is not in the cache or has expired.
+		"""
+		with self.lock:
+			entry = self.items.pop(key, None)
+			if entry is None:
+				return None
+			if self.ttl is not None and time.time()-entry[2]>self.ttl:
+				self.currentBytes -= entry[1]
+				return None
+			entry[3] = next(_useSequence)
+			self.items[key] = entry
+			return entry
+
+	def __contains__(self, key):
+		if self._getEntry(key) is None:
+			self.misses += 1
+			return False
+		return True
+
+	def __getitem__(self, key):
+		entry = self._getEntry(key)
+		if entry is None:
+			self.misses += 1
+			raise KeyError(key)
+		self.hits += 1
+		return entry[0]
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __setitem__(self, key, value):
+		size = self.sizeOf(value)
+		now = time.time()
+		with self.lock:
+			if key in self.items:
+				self.currentBytes -= self.items.pop(key)[1]
+			self.items[key] = [value, size, now, next(_useSequence)]
+			self.currentBytes += size
+
+			while self.items and (
+					(self.maxItems is not None and len(self.items)>self.maxItems)
+					or (self.maxBytes is not None and self.currentBytes>self.maxBytes)):
+				self.evictOldest()
+
+		# enforce the budget only after releasing our lock, as the
+		# budget may evict from other caches
+		if self.budget is not None:
+			self.budget.enforce()
+
+	def __delitem__(self, key):
+		with self.lock:
+			self.currentBytes -= self.items.pop(key)[1]
+
+	def keys(self):
+		return list(self.items.keys())
+
+	def clear(self):
+		with self.lock:
+			self.items.clear()
+			self.currentBytes = 0
+
+	def getOldestUse(self):
+		"""returns a number ordering the last use of our least recently
+		used item relative to those of other LRUCaches.
+		"""
+		with self.lock:
+			for entry in self.items.itervalues():
+				return entry[3]
+		return float("inf")
+
+	def evictOldest(self):
+		"""removes the least recently used item.
+		"""
+		with self.lock:
+			if self.items:
+				_, entry = self.items.popitem(last=False)
+				self.currentBytes -= entry[1]
+				self.evictions += 1
+
+	def getStats(self):
+		"""returns a dictionary with some statistics on this cache.
+		"""
+		return {
+			"name": self.name,
+			"items": len(self.items),
+			"bytes": self.currentBytes,
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions}
+
+
+def getCacheStats():
+	"""returns a list of statistics dictionaries (see LRUCache.getStats)
+	for all LRUCaches under the global memory budget.
+	"""
+	return [c.getStats() for c in list(_globalBudget.caches)]
+
+
 class CacheRegistry:
 	"""is a registry for caches kept to be able to clear them.
 
@@ -53,7 +257,7 @@ clearCaches = _cacheRegistry.clearall
 clearForName = _cacheRegistry.clearForName
 
 
-def _makeCache(creator, isDirty):
+def _makeCache(creator, isDirty, cache=None):
 	"""returns a callable that memoizes the results of creator.
 
 	The creator has to be a function taking an id and returning the 
@@ -69,24 +273,30 @@ def _makeCache(creator, isDirty):
 	isDirty can be a function returning true when the cache should be
 	cleared.  The function is passed the current resource.  If isDirty
 	is None, no such check is performed.
+
+	cache is the dictionary-like object the results are kept in; it
+	defaults to a new dictionary.
 	"""
-	cache = {}
+	if cache is None:
+		cache = {}
 	_cacheRegistry.register(cache)
 
 	def func(id):
 		if isDirty is not None and id in cache and isDirty(cache[id]):
 			clearForName(id)
 
-		if not id in cache:
+		try:
+			res = cache[id]
+		except KeyError:
 			try:
-				cache[id] = creator(id)
+				res = cache[id] = creator(id)
 			except Exception, exc:
 				cache[id] = exc
 				raise
-		if isinstance(cache[id], Exception):
-			raise cache[id]
+		if isinstance(res, Exception):
+			raise res
 		else:
-			return cache[id]
+			return res
 
 	return func
 
@@ -108,10 +318,17 @@ def registerCache(name, cacheDict, creationFunction):
 	_cacheRegistry.register(cacheDict)
 	
 
-def makeCache(name, callable, isDirty=None):
+def makeCache(name, callable, isDirty=None, **lruArgs):
 	"""creates a new function name to cache results to calls to callable.
 
 	isDirty can be a function returning true when the cache should be
 	cleared.  The function is passed the current resource.
+
+	If you pass any lruArgs (maxItems, maxBytes, ttl, sizeOf), the results
+	are kept in an LRUCache with these parameters rather than in a dictionary
+	growing without bounds.
 	"""
-	globals()[name] = _makeCache(callable, isDirty)
+	cache = None
+	if lruArgs:
+		cache = LRUCache(name=name, **lruArgs)
+	globals()[name] = _makeCache(callable, isDirty, cache)
@@ -424,6 +424,9 @@ _config = Configuration(
 			"Default timeout for db queries via the web"),
 		WebRelativeConfigItem("previewCache", "previewcache",
 			"Webdir-relative directory to store cached previews in"),
+		IntConfigItem("previewCacheSize", "0", "Maximum number of bytes"
+			" the preview cache may take up; beyond that, the least recently"
+			" used previews are removed.  0 means no limit."),
 		WebRelativeConfigItem("favicon", "None",
 			"Webdir-relative path to a favicon"),
 		BooleanConfigItem("enableTests", "False",
@@ -441,6 +444,18 @@ _config = Configuration(
 		ListConfigItem("preloadRDs", "", "RD ids to preload at the server"
 			" start (this is mainly for RDs that have execute children"
 			" that should run regularly)."),
+		IntConfigItem("cacheMemoryLimit", "200000000", "Maximum number"
+			" of bytes the server keeps in size-accounted in-memory caches"
+			" (e.g., the page cache) altogether; beyond that, the least recently"
+			" used items are dropped.  0 means no limit."),
+		IntConfigItem("pageCacheTTL", "0", "Seconds after which cached pages"
+			" are regenerated; 0 means they are kept until the RD is reloaded"
+			" (or the memory limit forces them out)."),
+		IntConfigItem("productsRowCacheSize", "5000", "Number of rows from"
+			" dc.products to keep in memory (0 to disable caching)."),
+		IntConfigItem("productsRowCacheTTL", "300", "Seconds after which"
+			" cached rows from dc.products are fetched again even if the"
+			" table they belong to has not been re-imported."),
 		BooleanConfigItem("jsSource", "False", "If True, Javascript"
 			" will not be minified on delivery (this is for debugging)"),
 		StringConfigItem("operatorCSS", "", "URL of an operator-specific"
@@ -455,6 +470,8 @@ _config = Configuration(
 	Section('adql', "Settings concerning the built-in ADQL core",
 		IntConfigItem("webDefaultLimit", "2000",
 			"Default match limit for ADQL queries via a web form"),
+		IntConfigItem("morphCacheSize", "500", "Number of translated"
+			" ADQL queries to keep in memory (0 to disable caching)"),
 	),
 
 	Section('async', "Settings concerning TAP, UWS, and friends",
@@ -464,6 +481,25 @@ _config = Configuration(
 			" for UWS jobs, in seconds"),
 		IntConfigItem("maxTAPRunning", "2", "Maximum number of"
 			" TAP jobs running at a time"),
+		EnumeratedConfigItem("queuePolicy", "destruction", "How to pick"
+			" the next queued UWS job to run: destruction (earliest destruction"
+			" time first) or fairshare (alternate between submitters, cheaper"
+			" jobs first)", options=["destruction", "fairshare"]),
+		IntConfigItem("maxRunningPerSubmitter", "0", "With the fairshare"
+			" queue policy, the maximum number of jobs of a single submitter"
+			" (owner or, for anonymous jobs, client IP) running at a time"
+			" (0 for no limit)"),
+		IntConfigItem("tapWorkerPoolSize", "0", "Number of pre-forked"
+			" TAP workers with all of DaCHS already loaded the server keeps"
+			" around for async jobs (0 means start a new process for each job)"),
+		BooleanConfigItem("directSyncTAP", "True", "Run sync TAP queries"
+			" without uploads directly and stream their results rather than"
+			" going through a UWS job."),
+		IntConfigItem("resultCacheSize", "0", "Bytes of disk space"
+			" (in cacheDir/tapresults) to use for caching TAP results;"
+			" cached results are only discarded when the tables queried are"
+			" re-imported, so only enable this if your ADQL tables are not"
+			" changed otherwise (0 disables the cache)"),
 		IntConfigItem("maxUserUWSRunningDefault", "2", "Maximum number of"
 			" user UWS jobs running at a time"),
 		IntConfigItem("defaultLifetime", "172800", "Default"
@@ -499,6 +535,16 @@ _config = Configuration(
 		SetConfigItem("adqlProfiles", "untrustedquery", "Name(s) of profiles that"
 			" get access to tables opened for ADQL"),
 		IntConfigItem("defaultLimit", "100", "Default match limit for DB queries"),
+		IntConfigItem("poolWaitTimeout", "30", "Seconds to wait for a"
+			" pooled database connection to become free before giving up"),
+		IntConfigItem("poolValidateAfter", "30", "Pooled database"
+			" connections idle for longer than this many seconds are checked"
+			" before they are handed out"),
+		IntConfigItem("poolMaxUses", "10000", "Pooled database connections"
+			" are closed after having been handed out this many times"
+			" (0 for no limit)"),
+		IntConfigItem("poolMaxAge", "3600", "Pooled database connections"
+			" are closed when older than this many seconds (0 for no limit)"),
 		ListConfigItem("managedExtensions", 
 			"pg_sphere",
 			"Name(s) of postgres extensions gavo upgrade -e should watch"),
@@ -528,6 +574,12 @@ _config = Configuration(
 			"Version of the spectral data model we generate our spectra"
 			" as (unless someone asks for another version explicitly).",
 			options=["1", "2"]),
+		BooleanConfigItem("materializeObscore", "False",
+			"Base ivoa.obscore on a materialised table with its own indices"
+			" rather than a union of queries against all published tables."
+			" After changing this, run dachs imp //obscore materialize"
+			" (when switching it on) or dachs imp //obscore create (when"
+			" switching it off)."),
 	),
 )
 
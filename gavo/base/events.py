@@ -194,6 +194,15 @@ class EventDispatcher(object):
 		self.lastRow = row
 		return row
 
+	def notifyIncomingChunk(self, chunk):
+		"""is called when grammars yield a rscdef.ColumnChunk to the DC's belly.
+
+		This is notifyIncomingRow's equivalent for vectorised imports;
+		totalRead is bumped up by the number of rows in the chunk.
+		"""
+		self.totalRead += chunk.nRows
+		return chunk
+
 	def notifyIndexCreation(self, indexName):
 		"""is called when an index on a DB table is created.
 
@@ -19,6 +19,7 @@ import os
 import random
 import re
 import threading
+import time
 import warnings
 import weakref
 
@@ -209,30 +210,102 @@ class DebugCursor(psycopg2.extensions.cursor):
 		return res
 
 
+def _getTimeoutSetting(timeout):
+	"""returns a postgres statement_timeout value for timeout in seconds.
+	"""
+	if timeout==-12: # Special instrumentation for testing
+		return "1"
+	return str(int(float(timeout)*1000))
+
+
+def _getSettingLiteral(value):
+	"""returns a string suitable as a value for set_config for a python
+	value.
+	"""
+	if isinstance(value, bool):
+		return value and "on" or "off"
+	return str(value)
+
+
 class GAVOConnection(psycopg2.extensions.connection):
 	"""A psycopg2 connection with some additional methods.
 
 	This derivation is also done so we can attach the getDBConnection
 	arguments to the connection; it is used when recovering from
 	a database restart.
+
+	The connection remembers the session-level run-time parameters set
+	through setRuntimeValues (and hence setTimeout and 
+	connectionConfiguration); setting them again to the values they already
+	have does not cause a database round trip.  Don't change run-time 
+	parameters with plain SET statements on such connections.
 	"""
-	def setTimeout(self, timeout):
-		"""sets a timeout on queries.
+	def __init__(self, *args, **kwargs):
+		psycopg2.extensions.connection.__init__(self, *args, **kwargs)
+		# parameter name -> value set for the session
+		self._sessionSettings = {}
 
-		timeout is in seconds; timeout=0 disables timeouts (this is what
-		postgres does, too)
+	def rollback(self):
+		# session-level settings made in the transaction are reverted, too
+		self._sessionSettings = {}
+		return psycopg2.extensions.connection.rollback(self)
+
+	def setRuntimeValues(self, settings, isLocal=False):
+		"""sets postgres run-time parameters in one statement.
+
+		settings is a sequence of (name, value) pairs; python booleans are
+		translated to on and off, other values are stringified.
+
+		With isLocal=False, parameters already set to the value requested
+		are skipped.
+
+		This returns a dictionary mapping the names of the parameters changed
+		to the values they had before.
 		"""
-		# don't use query here since query may call setTimeout
+		settings = [(name, _getSettingLiteral(value)) 
+			for name, value in settings]
+		if not isLocal:
+			settings = [(name, value) for name, value in settings
+				if self._sessionSettings.get(name)!=value]
+		if not settings:
+			return {}
+
+		selectList, args = [], {"isLocal": isLocal}
+		for index, (name, value) in enumerate(settings):
+			args["n%d"%index], args["v%d"%index] = name, value
+			# postgres evaluates select lists left to right, so
+			# current_setting sees the value before set_config.
+			selectList.append("current_setting(%%(n%d)s)"%index)
+			selectList.append("set_config(%%(n%d)s, %%(v%d)s, %%(isLocal)s)"%(
+				index, index))
+
 		cursor = self.cursor()
 		try:
-			if timeout==-12: # Special instrumentation for testing
-				cursor.execute("SET statement_timeout TO 1")
-			elif timeout is not None:
-				cursor.execute(
-					"SET statement_timeout TO %d"%(int(float(timeout)*1000)))
+			cursor.execute("SELECT "+", ".join(selectList), args)
+			row = cursor.fetchone()
 		finally:
 			cursor.close()
 
+		oldValues = {}
+		for index, (name, value) in enumerate(settings):
+			oldValues[name] = row[2*index]
+			if isLocal:
+				# we don't know what this will be after the transaction
+				self._sessionSettings.pop(name, None)
+			else:
+				self._sessionSettings[name] = value
+		return oldValues
+
+	def setTimeout(self, timeout):
+		"""sets a timeout on queries.
+
+		timeout is in seconds; timeout=0 disables timeouts (this is what
+		postgres does, too)
+		"""
+		if timeout is not None:
+			self.setRuntimeValues([
+				("statement_timeout", _getTimeoutSetting(timeout))])
+
 	def getTimeout(self):
 		"""returns the current timeout setting.
 
@@ -255,17 +328,17 @@ class GAVOConnection(psycopg2.extensions.connection):
 		"""a contextmanager to have a timeout set in the controlled 
 		section.
 		"""
+		oldValues = {}
 		if timeout is not None:
-			oldTimeout = self.getTimeout()
-			self.setTimeout(timeout)
+			oldValues = self.setRuntimeValues([
+				("statement_timeout", _getTimeoutSetting(timeout))])
 
 		yield
 
 		# don't try to restore the timeout on an exception; presumably
 		# things are hosed enough that we'll discard the connection,
 		# and we can't talk to the DB anyway until a rollback.
-		if timeout is not None:
-			self.setTimeout(oldTimeout)
+		self.setRuntimeValues(oldValues.items())
 
 	def queryToDicts(self, query, args={}, timeout=None, caseFixer=None):
 		"""iterates over dictionary rows for query.
@@ -326,6 +399,7 @@ class GAVOConnection(psycopg2.extensions.connection):
 		try:
 			yield
 		except:
+			self._sessionSettings = {}
 			self.execute("ROLLBACK TO SAVEPOINT %s"%savepointName)
 			raise
 		finally:
@@ -830,11 +904,20 @@ class QuerierMixin(PostgresQueryMixin, StandardQueryMixin):
 	# _reconnecting is used in query
 	_reconnecting = False
 
-	def configureConnection(self, settings):
-		cursor = self.connection.cursor()
-		for key, val in settings:
-			cursor.execute("SET %s=%%(val)s"%key, {"val": val})
-		cursor.close()
+	def configureConnection(self, settings, timeout=None):
+		"""sets the postgres run-time parameters given as (name, value) pairs
+		in settings for our connection's session.
+
+		If you pass timeout, statement_timeout is set, too.  Everything
+		is done in a single database round trip, if one is necessary at all.
+		The function returns a dictionary of the previous values of the
+		parameters changed, which you can pass to configureConnection to 
+		restore them.
+		"""
+		settings = list(settings)
+		if timeout is not None:
+			settings.append(("statement_timeout", _getTimeoutSetting(timeout)))
+		return self.connection.setRuntimeValues(settings)
 
 	def enableAutocommit(self):
 		self.connection.set_isolation_level(
@@ -999,28 +1082,17 @@ def connectionConfiguration(conn, isLocal=True, timeout=None, **runtimeVals):
 
 	Since it's so frequent, you can pass timeout to give a statement_timeout
 	in seconds.
-	"""
-	cursor = conn.cursor()
 
+	Setting and resetting takes one statement each (see
+	GAVOConnection.setRuntimeValues).
+	"""
 	if timeout is not None:
-		runtimeVals["statement_timeout"] = int(float(timeout)*1000)
+		runtimeVals["statement_timeout"] = _getTimeoutSetting(timeout)
 
-	oldVals = {}
-	for parName, parVal in runtimeVals.iteritems():
-		parVal = str(parVal)
-		cursor.execute("SELECT current_setting(%(parName)s)", locals())
-		oldVals[parName] = list(cursor)[0][0]
-		cursor.execute(
-			"SELECT set_config(%(parName)s, %(parVal)s, %(isLocal)s)", locals())
-	cursor.close()
+	oldVals = conn.setRuntimeValues(runtimeVals.items(), isLocal)
 
 	def resetAll(isLocal):
-		cursor = conn.cursor()
-		for parName, parVal in oldVals.iteritems():
-			cursor.execute(
-				"SELECT set_config(%(parName)s, %(parVal)s, %(isLocal)s)", 
-				locals())
-		cursor.close()
+		conn.setRuntimeValues(oldVals.items(), isLocal)
 		
 	try:
 		yield
@@ -1095,9 +1167,37 @@ def _initPsycopg():
 	_PSYCOPG_INITED = True
 
 
-class CustomConnectionPool(psycopg2.pool.ThreadedConnectionPool):
-	"""A threaded connection pool that returns connections made via
+class _PooledConnection(object):
+	"""bookkeeping for a connection managed by a CustomConnectionPool.
+	"""
+	def __init__(self, conn):
+		self.conn = conn
+		self.created = self.lastReturned = time.time()
+		self.uses = 0
+
+
+# upper bounds (in seconds) of the bins of the wait time histograms
+# of connection pools
+POOL_WAIT_BINS = (0.001, 0.01, 0.1, 1, 10, float("inf"))
+
+
+class CustomConnectionPool(object):
+	"""A thread-safe connection pool that returns connections made via
 	profileName.
+
+	Unlike psycopg2's pools, when all maxconn connections are in use,
+	getconn waits for one to become free rather than failing at once;
+	it only raises a PoolError after [db]poolWaitTimeout seconds.
+
+	When taking a connection that has been idle for longer than
+	[db]poolValidateAfter seconds, it is first checked with a trivial
+	query.  If that fails, all idle connections are discarded, as this
+	usually means the server was restarted.  Connections that have been
+	used [db]poolMaxUses times or are older than [db]poolMaxAge seconds
+	are closed rather than put back into the pool (zero for either
+	disables the respective limit).
+
+	Pools keep counters on their use; see getStats.
 	"""
 	# we keep weak references to pools we've created so we can invalidate
 	# them all on a server restart to avoid having stale connections
@@ -1105,13 +1205,30 @@ class CustomConnectionPool(psycopg2.pool.ThreadedConnectionPool):
 	knownPools = []
 
 	def __init__(self, minconn, maxconn, profileName, autocommitted=True):
-# make sure no additional arguments come in, since we don't
-# support them.
+		self.minconn, self.maxconn = minconn, maxconn
 		self.profileName = profileName
 		self.autocommitted = autocommitted
-		self.stale = False
-		psycopg2.pool.ThreadedConnectionPool.__init__(
-			self, minconn, maxconn)
+		self.stale = self.closed = False
+
+		self.waitTimeout = config.get("db", "poolWaitTimeout")
+		self.validateAfter = config.get("db", "poolValidateAfter")
+		self.maxUses = config.get("db", "poolMaxUses")
+		self.maxAge = config.get("db", "poolMaxAge")
+
+		self._cond = threading.Condition(threading.Lock())
+		# id(conn) -> _PooledConnection for all connections we manage
+		self._managed = {}
+		self._idle = []
+		# the number of connections handed out (or being opened for that)
+		self._nInUse = 0
+
+		self._nWaiting = 0
+		self._counters = dict.fromkeys(["connects", "recycled", 
+			"unhealthy", "timeouts"], 0)
+		self._waitHistogram = [0]*len(POOL_WAIT_BINS)
+
+		for i in range(self.minconn):
+			self._idle.append(self._connect())
 		self.knownPools.append(weakref.ref(self))
 	
 	@classmethod
@@ -1129,12 +1246,24 @@ class CustomConnectionPool(psycopg2.pool.ThreadedConnectionPool):
 		# shouldn't matter.
 		cls.knownPools = []
 
-	def _connect(self, key=None):
-		"""creates a new trustedquery connection and assigns it to
-		key if not None.
+	@classmethod
+	def closeAll(cls):
+		"""closes the connections of all known pools and marks the pools
+		stale, such that new ones are created on the next request.
+
+		Processes that fork off children using the database (e.g., the
+		TAP worker pool) must call this before forking.
+		"""
+		for pool in cls.knownPools:
+			pool = pool()
+			if pool is not None and not pool.closed:
+				pool.closeall()
+				pool.stale = True
+		cls.knownPools = []
 
-		This is an implementation detail of psycopg2's connection
-		pools.
+	def _connect(self):
+		"""returns a new connection through our profile and starts managing
+		it.
 		"""
 		conn = getDBConnection(self.profileName)
 
@@ -1151,31 +1280,194 @@ class CustomConnectionPool(psycopg2.pool.ThreadedConnectionPool):
 					" investigate and fix")
 				conn.commit()
 
+		with self._cond:
+			self._managed[id(conn)] = _PooledConnection(conn)
+			self._counters["connects"] += 1
+		return conn
 
-		if key is not None:
-			self._used[key] = conn
-			self._rused[id(conn)] = key
-		else:
-			self._pool.append(conn)
+	def _discard(self, conn):
+		"""closes conn and stops managing it.
+
+		This must be called with the pool lock held.
+		"""
+		self._managed.pop(id(conn), None)
+		try:
+			if not conn.closed:
+				conn.close()
+		except InterfaceError:
+			# already closed
+			pass
+
+	def _isExpired(self, record):
+		"""returns true if the connection described by the _PooledConnection
+		record should not be used any more.
+		"""
+		return ((self.maxUses and record.uses>=self.maxUses)
+			or (self.maxAge and time.time()-record.created>self.maxAge))
+
+	def _isHealthy(self, conn):
+		"""returns False if a trivial query on conn fails.
+		"""
+		try:
+			cursor = conn.cursor()
+			try:
+				cursor.execute("SELECT 1")
+			finally:
+				cursor.close()
+			conn.rollback()
+			return True
+		except (OperationalError, InterfaceError):
+			return False
+
+	def _checkOut(self, conn):
+		"""returns conn if it can be handed out, a new connection otherwise.
+
+		conn may be None, in which case a new connection is returned, too.
+		"""
+		if conn is not None:
+			with self._cond:
+				record = self._managed.get(id(conn))
+				if record is None or conn.closed or self._isExpired(record):
+					self._discard(conn)
+					self._counters["recycled"] += 1
+					conn = None
+
+		if conn is not None and time.time()-record.lastReturned>self.validateAfter:
+			if not self._isHealthy(conn):
+				with self._cond:
+					self._counters["unhealthy"] += 1+len(self._idle)
+					for idleConn in [conn]+self._idle:
+						self._discard(idleConn)
+					self._idle = []
+				conn = None
+
+		if conn is None:
+			conn = self._connect()
 		return conn
 
+	def _recordWait(self, waitTime):
+		for index, upper in enumerate(POOL_WAIT_BINS):
+			if waitTime<=upper:
+				self._waitHistogram[index] += 1
+				break
+
+	def getconn(self):
+		"""returns a connection from the pool.
+
+		This blocks until a connection is available; after waitTimeout
+		seconds, it raises a PoolError.
+		"""
+		startTime = time.time()
+		with self._cond:
+			self._nWaiting += 1
+			try:
+				while not self.closed and not self._idle and (
+						self._nInUse>=self.maxconn):
+					remaining = startTime+self.waitTimeout-time.time()
+					if remaining<=0:
+						self._counters["timeouts"] += 1
+						raise psycopg2.pool.PoolError("No %s connection became"
+							" available within %s seconds"%(
+								self.profileName, self.waitTimeout))
+					self._cond.wait(remaining)
+			finally:
+				self._nWaiting -= 1
+
+			if self.closed:
+				raise psycopg2.pool.PoolError("connection pool is closed")
+			self._recordWait(time.time()-startTime)
+			self._nInUse += 1
+			conn = None
+			if self._idle:
+				conn = self._idle.pop()
+
+		try:
+			return self._checkOut(conn)
+		except:
+			with self._cond:
+				self._nInUse -= 1
+				self._cond.notify()
+			raise
+
+	def putconn(self, conn, close=False):
+		"""returns conn to the pool.
+
+		With close=True, or if conn is expired, conn is closed instead.
+		"""
+		if not close and not conn.closed:
+			status = conn.get_transaction_status()
+			if status==psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+				close = True
+			elif status!=psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+				conn.rollback()
+
+		with self._cond:
+			record = self._managed.get(id(conn))
+			if record is None:
+				# not ours (any more); just make sure it's gone
+				self._discard(conn)
+				return
+
+			self._nInUse -= 1
+			record.uses += 1
+			record.lastReturned = time.time()
+
+			if (close or conn.closed or self.closed or self.stale
+					or (len(self._idle)>=self.minconn and not self._nWaiting)):
+				self._discard(conn)
+			elif self._isExpired(record):
+				self._discard(conn)
+				self._counters["recycled"] += 1
+			else:
+				self._idle.append(conn)
+			self._cond.notify()
 
-def _cleanupAfterDBError(ex, conn, pool, poolLock):
-	"""removes conn from pool after an error occurred.
+	def closeall(self):
+		"""closes all connections of this pool, including those in use.
+
+		After this, getconn will fail.
+		"""
+		with self._cond:
+			for record in self._managed.values():
+				self._discard(record.conn)
+			self._idle = []
+			self.closed = True
+			self._cond.notify_all()
+
+	def getStats(self):
+		"""returns a dictionary with counters describing the state and the
+		history of this pool.
+
+		waitHistogram is a list of (upper bound in seconds, count) pairs
+		for the times getconn had to wait for a connection.
+		"""
+		with self._cond:
+			stats = {
+				"profile": self.profileName,
+				"autocommitted": self.autocommitted,
+				"inUse": self._nInUse,
+				"idle": len(self._idle),
+				"waiting": self._nWaiting,
+				"maxconn": self.maxconn,
+				"waitHistogram": zip(POOL_WAIT_BINS, self._waitHistogram)}
+			stats.update(self._counters)
+		return stats
+
+
+def _cleanupAfterDBError(ex, conn, connPool):
+	"""removes conn from connPool after an error occurred.
 
 	This is a helper for getConnFromPool below.
 	"""
 	if isinstance(ex, OperationalError) and ex.pgcode is None:
 		# this is probably a db server restart.  Invalidate all connections
 		# immediately.
-		with poolLock:
-			if pool:
-				pool[0].serverRestarted()
+		connPool.serverRestarted()
 
 	# Make sure the connection is closed; something bad happened
 	# in it, so we don't want to re-use it
 	try:
-		pool[0].putconn(conn, close=True)
+		connPool.putconn(conn, close=True)
 	except InterfaceError:  
 		# Connection already closed
 		pass
@@ -1184,6 +1476,11 @@ def _cleanupAfterDBError(ex, conn, pool, poolLock):
 			"Disaster: %s while force-closing connection"%msg)
 
 
+# the connection pools currently used by the connection managers; this
+# is (profile name, autocommitted) -> pool.
+_activePools = {}
+
+
 def _makeConnectionManager(profileName, minConn=5, maxConn=20,
 		autocommitted=True):
 	"""returns a context manager for a connection pool for profileName
@@ -1200,28 +1497,34 @@ def _makeConnectionManager(profileName, minConn=5, maxConn=20,
 		if imp.lock_held():
 			raise OperationalError(
 				"Attempt to make a pool with the import lock held")
-		with poolLock:
-			pool.append(CustomConnectionPool(minConn, maxConn, profileName,
-				autocommitted))
+		newPool = CustomConnectionPool(minConn, maxConn, profileName,
+			autocommitted)
+		pool.append(newPool)
+		_activePools[profileName, autocommitted] = newPool
 
-	def getConnFromPool():
+	def getPool():
 		# we delay pool creation since these functions are built during
 		# sqlsupport import.  We probably don't have profiles ready
 		# at that point.
-		if not pool:
-			makePool()
-
-		if pool[0].stale:
-			pool[0].closeall()
-			pool.pop()
-			makePool()
+		with poolLock:
+			if pool and pool[0].stale:
+				if not pool[0].closed:
+					pool[0].closeall()
+				pool.pop()
+			if not pool:
+				makePool()
+			return pool[0]
 
-		conn = pool[0].getconn()
+	def getConnFromPool():
+		# hold on to the pool we got the connection from; another thread
+		# might replace pool[0] while we're using the connection.
+		connPool = getPool()
+		conn = connPool.getconn()
 		try:
 			yield conn
 		except Exception, ex:
 			# controlled block bombed out, do error handling
-			_cleanupAfterDBError(ex, conn, pool, poolLock)
+			_cleanupAfterDBError(ex, conn, connPool)
 			raise
 
 		else:
@@ -1230,7 +1533,7 @@ def _makeConnectionManager(profileName, minConn=5, maxConn=20,
 				conn.commit()
 		
 		try:
-			pool[0].putconn(conn, close=conn.closed)
+			connPool.putconn(conn, close=conn.closed)
 		except InterfaceError:
 			# Connection already closed
 			pass
@@ -1238,6 +1541,23 @@ def _makeConnectionManager(profileName, minConn=5, maxConn=20,
 	return contextlib.contextmanager(getConnFromPool)
 
 
+def getPoolStats():
+	"""returns a list of statistics dictionaries (see 
+	CustomConnectionPool.getStats) for the pools behind getTableConn
+	and friends.
+	"""
+	return [p.getStats() for p in _activePools.values() if not p.closed]
+
+
+def closeConnectionPools():
+	"""closes all pooled connections.
+
+	The pools will re-connect on the next request.  See
+	CustomConnectionPool.closeAll.
+	"""
+	CustomConnectionPool.closeAll()
+
+
 getUntrustedConn = _makeConnectionManager("untrustedquery")
 getTableConn = _makeConnectionManager("trustedquery")
 getAdminConn = _makeConnectionManager("admin")
@@ -23,6 +23,9 @@ down in utils.typeconversions.
 #c COPYING file in the source distribution.
 
 
+import datetime
+import struct
+
 import numpy
 
 from gavo import utils
@@ -363,6 +366,107 @@ class ToPgTypeValidatorConverter(FromSQLConverter):
 		return check
 
 
+class ToPgBinaryConverter(FromSQLConverter):
+	"""returns a function serialising python values into postgres'
+	binary COPY representation of the respective type.
+
+	The functions return the field data without the length prefix and
+	must not be called with None.  For types we cannot serialise
+	(e.g., pgsphere's; these have no binary I/O functions), the converter
+	raises a ConversionError.
+	"""
+	typeSystem = "Postgres binary COPY"
+
+	pgEpoch = datetime.datetime(2000, 1, 1)
+	pgEpochOrdinal = pgEpoch.toordinal()
+
+	def packText(val):
+		if isinstance(val, unicode):
+			return val.encode("utf-8")
+		return str(val)
+
+	def packBoolean(val):
+		if val:
+			return "\x01"
+		return "\x00"
+
+	def packDate(val, pgEpochOrdinal=pgEpochOrdinal):
+		return struct.pack("!i", val.toordinal()-pgEpochOrdinal)
+
+	def packTimestamp(val, pgEpoch=pgEpoch):
+		if not isinstance(val, datetime.datetime):
+			val = datetime.datetime(val.year, val.month, val.day)
+		delta = val-pgEpoch
+		return struct.pack("!q", 
+			(delta.days*86400+delta.seconds)*1000000+delta.microseconds)
+
+	def makeStructPacker(fmt, cast):
+		def pack(val):
+			return struct.pack(fmt, cast(val))
+		return pack
+
+	simpleMap = {
+		"smallint": makeStructPacker("!h", int),
+		"integer": makeStructPacker("!i", int),
+		"bigint": makeStructPacker("!q", long),
+		"real": makeStructPacker("!f", float),
+		"double precision": makeStructPacker("!d", float),
+		"boolean": packBoolean,
+		"text": packText,
+		"unicode": packText,
+		"char": packText,
+		"date": packDate,
+		"timestamp": packTimestamp,
+		"bytea": str,
+	}
+
+	# element type oids for array serialisation
+	elementOIDs = {
+		"smallint": 21,
+		"integer": 23,
+		"bigint": 20,
+		"real": 700,
+		"double precision": 701,
+		"boolean": 16,
+		"text": 25,
+		"unicode": 25,
+	}
+
+	def mapComplex(self, type, length):
+		if type in self._charTypes:
+			return self.simpleMap["text"]
+		if type not in self.elementOIDs:
+			return None
+
+		packElement, oid = self.simpleMap[type], self.elementOIDs[type]
+
+		def packArray(val):
+			parts = []
+			hasNull = 0
+			for item in val:
+				if item is None:
+					hasNull = 1
+					parts.append(struct.pack("!i", -1))
+				else:
+					packed = packElement(item)
+					parts.append(struct.pack("!i", len(packed))+packed)
+			if parts:
+				header = struct.pack("!iiiii", 1, hasNull, oid, len(parts), 1)
+			else:
+				header = struct.pack("!iii", 0, 0, oid)
+			return header+"".join(parts)
+
+		return packArray
+
+	def convert(self, sqlType):
+		# FromSQLConverter lets "raw" through as such; we have no encoder
+		# for it (nor for anything else that doesn't give us a function).
+		res = FromSQLConverter.convert(self, sqlType)
+		if not callable(res):
+			raise ConversionError("No %s type for %s"%(self.typeSystem, sqlType))
+		return res
+
+
 sqltypeToADQL = ToADQLConverter().convert
 sqltypeToXSD = ToXSDConverter().convert
 sqltypeToNumpy = ToNumpyConverter().convert
@@ -370,6 +474,7 @@ sqltypeToPython = ToPythonConverter().convert
 sqltypeToPythonCode = ToPythonCodeConverter().convert
 sqltypeToPgValidator = ToPgTypeValidatorConverter().convert
 pythonToLiteral = ToLiteralConverter().convert
+sqltypeToPgBinary = ToPgBinaryConverter().convert
 
 
 def _test():
@@ -382,4 +487,4 @@ if __name__=="__main__":
 __all__ = ["sqltypeToVOTable", "sqltypeToXSD", "sqltypeToNumpy",
 	"sqltypeToPython", "sqltypeToPythonCode", "voTableToSQLType",
 	"ConversionError", "FromSQLConverter", "pythonToLiteral",
-	"sqltypeToPgValidator"]
+	"sqltypeToPgValidator", "sqltypeToPgBinary"]
@@ -144,6 +144,45 @@ class SerManager(utils.IdManagerMixin):
 		funDef.append("\t)")
 		return self._compileMapFunction(funDef)
 
+	def _makeTupleFromTupleFactory(self):
+		"""returns a function that returns a tuple of mapped values
+		for a row tuple as returned by a table's iterTuples.
+		"""
+		if set(self.mappers)==set([utils.identity]):
+			return utils.identity
+		funDef = ["def buildRec(row):", "\treturn ("]
+		for index in range(len(self.mappers)):
+			if self.mappers[index] is utils.identity:
+				funDef.append("\t\trow[%d],"%index)
+			else:
+				funDef.append("\t\tmap%d(row[%d]),"%(index, index))
+		funDef.append("\t)")
+		return self._compileMapFunction(funDef)
+
+	def canIterTuples(self):
+		"""returns true if the table can deliver its rows as tuples
+		without going through row dictionaries.
+
+		That is the case for tables having an iterTuples method (e.g.,
+		QueryTables).
+		"""
+		return bool(self.annCols) and hasattr(self.table, "iterTuples")
+
+	def getUnmappedTuples(self):
+		"""iterates over the table's rows as tuples with unmapped values.
+
+		This is for serialisers that apply self.mappers themselves (e.g.,
+		compiled into a VOTable row encoder); with tables that
+		canIterTuples, no per-row dictionaries are built.
+		"""
+		if self.canIterTuples():
+			return self.table.iterTuples()
+		funDef = ["def buildRec(rowDict):", "\treturn ("]
+		for cd in self:
+			funDef.append("\t\trowDict[%r],"%cd["name"])
+		funDef.append("\t)")
+		return self._iterWithMaps(self._compileMapFunction(funDef))
+
 	def _iterWithMaps(self, buildRec):
 		"""helps getMapped(Values|Tuples).
 		"""
@@ -162,6 +201,11 @@ class SerManager(utils.IdManagerMixin):
 	def getMappedTuples(self):
 		"""iterates over the table's rows as tuples with mapped values.
 		"""
+		if self.canIterTuples():
+			buildRec = self._makeTupleFromTupleFactory()
+			if buildRec is utils.identity:
+				return self.table.iterTuples()
+			return (buildRec(row) for row in self.table.iterTuples())
 		return self._iterWithMaps(self._makeTupleFactory())
 
 
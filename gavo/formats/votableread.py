@@ -12,6 +12,7 @@ should access this module through formats.votable.
 
 
 import gzip
+import itertools
 
 from gavo import base
 from gavo import rsc
@@ -226,14 +227,22 @@ def _getRowMaker(table):
 	for table.
 
 	This is mainly just building a row dictionary, except we also
-	parse xtyped columns.
+	parse xtyped columns the VOTable library leaves alone (this is
+	necessary for binary COPY, where postgres won't parse for us).
 	"""
 	from gavo.base.literals import parseDefaultDatetime #noflake: code gen
 	from gavo.stc import parseSimpleSTCS, simpleSTCSToPolygon #noflake: code gen
 
+	def toDatetime(val): #noflake: code gen
+		if isinstance(val, basestring):
+			return parseDefaultDatetime(val)
+		return val
+
 	parts = []
 	for colInd, col in enumerate(table.tableDef):
 		valCode = "row[%d]"%colInd
+		if col.type=="timestamp":
+			valCode = "toDatetime(%s)"%valCode
 		parts.append("%s: %s"%(repr(col.key), valCode))
 
 	return utils.compileFunction(
@@ -242,14 +251,58 @@ def _getRowMaker(table):
 		locals())
 
 
+def _feedRows(tuples, feeder, makeRow, batchSize):
+	"""feeds the VOTable rows from tuples to feeder in chunks of 
+	batchSize.
+	"""
+	tuples = iter(tuples)
+	while True:
+		rows = [makeRow(tuple) 
+			for tuple in itertools.islice(tuples, batchSize)]
+		if not rows:
+			break
+		feeder.addChunk(rows)
+
+
+def _feedBlocks(tuples, feeder, makeRow):
+	"""feeds the blocks of records from tuples (a votable Rows instance) 
+	to a feeder for binary COPY.
+
+	The records without NULLs go to the feeder's addColumns as they
+	come from the decoder; only the (hopefully few) records with NULLs
+	are turned into rows.
+	"""
+	for records, nullMask in tuples.iterBlocks():
+		names = [name for name in records.dtype.names if name!="_nullFlags"]
+		hasNulls = nullMask.any(axis=1)
+
+		complete = records[~hasNulls]
+		feeder.addColumns([complete[name] for name in names])
+
+		if hasNulls.any():
+			incomplete = records[hasNulls]
+			feeder.addChunk([
+				makeRow([None if isNull else value
+					for value, isNull in zip(values, nulls)])
+				for values, nulls in zip(
+					zip(*[incomplete[name].tolist() for name in names]),
+					nullMask[hasNulls])])
+
+
 def uploadVOTable(tableId, srcFile, connection, gunzip=False, 
-		rd=None, **tableArgs):
+		rd=None, batchSize=10000, **tableArgs):
 	"""creates a temporary table with tableId containing the first
 	table in the VOTable in srcFile.
 
 	The function returns a DBTable instance for the new file.
 
 	srcFile must be an open file object (or some similar object).
+
+	Where the column types permit, the rows are fed using binary COPY
+	in batches of batchSize rows; indices (e.g., the q3c index added by
+	addQ3CIndex) are only created after all rows are in, and the table
+	is analyzed afterwards.  Purely numeric BINARY(2) tables are passed
+	to the feeder in whole columns (see _feedBlocks).
 	"""
 	if gunzip:
 		srcFile = gzip.GzipFile(fileobj=srcFile, mode="r")
@@ -265,7 +318,12 @@ def uploadVOTable(tableId, srcFile, connection, gunzip=False,
 
 	table = rsc.TableForDef(td, connection=connection, create=True)
 	makeRow = _getRowMaker(table)
-	with table.getFeeder() as feeder:
-		for tuple in tuples:
-			feeder.add(makeRow(tuple))
+	with table.getFeeder(bulkCopy=True, batchSize=batchSize) as feeder:
+		if (hasattr(feeder, "addColumns")
+				and feeder.canAddColumns(td)
+				and not table.validateRows
+				and tuples.canIterBlocks()):
+			_feedBlocks(tuples, feeder, makeRow)
+		else:
+			_feedRows(tuples, feeder, makeRow, batchSize)
 	return table
@@ -641,9 +641,10 @@ def makeTable(ctx, table):
 
 
 		return votable.DelayedTable(result,
-			sm.getMappedTuples(),
+			sm.getUnmappedTuples(),
 			tableEncoders[ctx.tablecoding],
-			overflowElement=ctx.overflowElement)
+			overflowElement=ctx.overflowElement,
+			mappers=sm.mappers)
 
 
 def _makeResource(ctx, data):
@@ -11,7 +11,10 @@ A grammar reading from (fixed-record) binary files.
 import re
 import struct
 
+import numpy
+
 from gavo import base
+from gavo import rscdef
 from gavo import utils
 from gavo.grammars.common import Grammar, FileRowIterator
 from gavo.imp import pyparsing
@@ -48,6 +51,30 @@ class BinaryRowIterator(FileRowIterator):
 				location="byte %s"%self.inputFile.tell(),
 				source=str(self.sourceToken)))
 
+	def canChunk(self):
+		return (self.grammar.armor is None
+			and self.grammar.fieldDefs.dtype is not None
+			and FileRowIterator.canChunk(self))
+
+	def _iterChunks(self):
+		fieldDefs = self.grammar.fieldDefs
+		dtype = fieldDefs.dtype
+		self.inputFile.read(self.grammar.skipBytes)
+
+		while True:
+			data = self.inputFile.read(fieldDefs.recordLength*self.chunkSize)
+			if not data:
+				return
+			if len(data)%fieldDefs.recordLength:
+				raise base.SourceParseError("Truncated record at end of file",
+					location="byte %s"%self.inputFile.tell(),
+					source=str(self.sourceToken))
+
+			records = numpy.frombuffer(data, dtype=dtype)
+			self.recNo += len(records)
+			yield rscdef.ColumnChunk(len(records),
+				[(name, records[name]) for name in fieldDefs.fieldNames])
+
 
 def _getFieldsGrammar():
 	with utils.pyparsingWhitechars(" \n\t\r"):
@@ -103,6 +130,19 @@ class BinaryRecordDef(base.Structure):
 		"big": ">",
 		"little": "<"}
 
+	_binfmtToNumpyOrder = {
+		"native": "=",
+		"packed": "=",
+		"big": ">",
+		"little": "<"}
+
+	_structCodeToNumpy = {
+		"b": "i1", "B": "u1",
+		"h": "i2", "H": "u2",
+		"i": "i4", "I": "u4",
+		"q": "i8", "Q": "u8",
+		"f": "f4", "d": "f8"}
+
 	def completeElement(self, ctx):
 		try:
 			parsedFields = utils.pyparseString(self._fieldsGrammar, self.content_)
@@ -116,8 +156,33 @@ class BinaryRecordDef(base.Structure):
 			str("".join(f["formatCode"] for f in parsedFields)))
 		self.recordLength = struct.calcsize(self.structFormat)
 		self.fieldNames = tuple(f["identifier"] for f in parsedFields)
+		self.formatCodes = tuple(str(f["formatCode"]) for f in parsedFields)
+		self.dtype = self._makeDtype()
 		self._completeElementNext(BinaryRecordDef, ctx)
 
+	def _makeDtype(self):
+		"""returns a numpy dtype for the records or None if the records
+		contain strings.
+
+		The field offsets are computed using the struct module, so alignment
+		should be the same as in the row-based parse.
+		"""
+		if [c for c in self.formatCodes if c not in self._structCodeToNumpy]:
+			return None
+
+		prefix = self._binfmtToStructCode[self.binfmt]
+		order = self._binfmtToNumpyOrder[self.binfmt]
+		offsets = [
+			struct.calcsize(prefix+"".join(self.formatCodes[:index+1]))
+				-struct.calcsize(prefix+code)
+			for index, code in enumerate(self.formatCodes)]
+
+		return numpy.dtype({
+			"names": list(self.fieldNames),
+			"formats": [order+self._structCodeToNumpy[c] for c in self.formatCodes],
+			"offsets": offsets,
+			"itemsize": self.recordLength})
+
 
 class BinaryGrammar(Grammar):
 	"""A grammar that builds rowdicts from binary data.
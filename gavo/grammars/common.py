@@ -314,8 +314,14 @@ class RowIterator(object):
 
 	_iterRows should arrange for the instance variable recNo to be incremented
 	by one for each item returned.
+
+	Row iterators for column-oriented sources can additionally define
+	a _iterChunks method yielding rscdef.ColumnChunks of about chunkSize
+	rows; clients then can use iterChunks (if canChunk() returns True) to
+	feed batch rowmakers.
 	"""
 	notify = True
+	chunkSize = 5000
 
 	def __init__(self, grammar, sourceToken, sourceRow=None):
 		self.grammar, self.sourceToken = grammar, sourceToken
@@ -363,6 +369,41 @@ class RowIterator(object):
 			if self.notify:
 				base.ui.notifySourceFinished()
 
+	def canChunk(self):
+		"""returns true if iterChunks can be used on this row iterator.
+
+		That requires a _iterChunks method and a grammar that does not need
+		to look at individual rows (for rowfilters, ignoreOn, or dispatching).
+		"""
+		return (hasattr(self, "_iterChunks")
+			and not hasattr(self, "rowfilter")
+			and not self.grammar.ignoreOn
+			and not self.grammar.isDispatching)
+
+	def iterChunks(self):
+		"""iterates over rscdef.ColumnChunks from the source.
+
+		This is an alternative to iterating over the row iterator itself;
+		only use it if canChunk returns True.
+		"""
+		if self.notify:
+			base.ui.notifyNewSource(self.sourceToken)
+
+		try:
+			try:
+				for chunk in self._iterChunks():
+					if self.sourceRow:
+						chunk.update(self.sourceRow)
+					chunk["parser_"] = self
+					yield chunk
+			except Exception:
+				base.ui.notifySourceError()
+				raise
+
+		finally:
+			if self.notify:
+				base.ui.notifySourceFinished()
+
 	def _filteredIter(self, baseIter):
 		for row in baseIter:
 			if not self.grammar.ignoreOn(row):
@@ -9,6 +9,7 @@ A grammar taking rows from a FITS table.
 
 
 from gavo import base
+from gavo import rscdef
 from gavo.grammars import common
 
 from gavo.utils import pyfits
@@ -24,6 +25,16 @@ class FITSTableIterator(common.RowIterator):
 			res = dict(zip(names, row))
 			yield res
 
+	def _iterChunks(self):
+		hdus = pyfits.open(self.sourceToken)
+		fitsTable = hdus[self.grammar.hdu].data
+		names = [n for n in fitsTable.dtype.names]
+		for start in range(0, len(fitsTable), self.chunkSize):
+			block = fitsTable[start:start+self.chunkSize]
+			self.recNo += len(block)
+			yield rscdef.ColumnChunk(len(block), 
+				[(name, block.field(name)) for name in names])
+
 
 class FITSTableGrammar(common.Grammar):
 	"""A grammar parsing from FITS tables.
@@ -34,6 +45,8 @@ class FITSTableGrammar(common.Grammar):
 
 	The keys of the result dictionaries are simpily the names given in
 	the FITS.
+
+	This grammar can feed vectorised rowmakers.
 	"""
 	name_ = "fitsTableGrammar"
 
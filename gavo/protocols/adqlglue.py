@@ -8,6 +8,7 @@ Code to bind the adql library to the data center software.
 #c COPYING file in the source distribution.
 
 
+import re
 import sys
 
 
@@ -263,10 +264,11 @@ def _addTableMeta(query, tree, table):
 			pass
 
 
-def morphADQL(query, metaProfile=None, tdsForUploads=[], 
-		externalLimit=None, hardLimit=None):
-	"""returns an postgres query and an (empty) result table for the
-	ADQL in query.
+def _morphADQL(query, metaProfile, tdsForUploads, externalLimit, hardLimit):
+	"""does the actual work for morphADQL.
+
+	In addition to the postgres query and the result table, this returns
+	the parsed tree.
 	"""
 	ctx, t = adql.parseAnnotating(query,
 		getFieldInfoGetter(metaProfile, tdsForUploads))
@@ -290,9 +292,110 @@ def morphADQL(query, metaProfile=None, tdsForUploads=[],
 	query = adql.flatten(morphedTree).replace("%", "%%")
 
 	table.tableDef.setLimit = t.setLimit and int(t.setLimit)
+	table.sourceTables = frozenset(t.getContributingNames())
 	_addTableMeta(query, t, table)
 
-	return query, table
+	return query, table, t
+
+
+_QUOTED_PARTS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+def _normalizeQuery(query):
+	"""returns query with runs of whitespace outside of string literals and
+	delimited identifiers collapsed.
+
+	Queries with comments are only stripped, as newlines end comments.
+	"""
+	parts = _QUOTED_PARTS.split(query.strip())
+	for index in range(0, len(parts), 2):
+		if "--" in parts[index]:
+			return query.strip()
+		parts[index] = re.sub(r"\s+", " ", parts[index])
+	return "".join(parts)
+
+
+def _getSourceTableDefs(tree):
+	"""returns a list of (name, tableDef) pairs for the tables contributing
+	to the parsed query tree that are known to dc.tablemeta.
+	"""
+	mth = base.caches.getMTH(None)
+	res = []
+	for name in tree.getContributingNames():
+		try:
+			res.append((name, mth.getTableDefForTable(name)))
+		except base.NotFoundError:
+			pass
+	return res
+
+
+def _sourceTablesUnchanged(sourceTDs):
+	"""returns true if the tables in a _getSourceTableDefs result are still
+	current.
+	"""
+	mth = base.caches.getMTH(None)
+	try:
+		for name, td in sourceTDs:
+			if mth.getTableDefForTable(name) is not td:
+				return False
+	except base.Error:
+		return False
+	return True
+
+
+_morphCache = None
+
+def _getMorphCache():
+	"""returns the LRUCache for morphADQL results, or None if caching
+	is disabled.
+	"""
+	global _morphCache
+	if _morphCache is None:
+		size = base.getConfig("adql", "morphCacheSize")
+		if size<1:
+			return None
+		_morphCache = base.caches.LRUCache("adqlMorph", maxItems=size)
+	return _morphCache
+
+
+def morphADQL(query, metaProfile=None, tdsForUploads=[], 
+		externalLimit=None, hardLimit=None):
+	"""returns an postgres query and an (empty) result table for the
+	ADQL in query.
+
+	The result table has a sourceTables attribute containing the names
+	of the tables the query draws from.
+
+	Results are cached (see [adql]morphCacheSize); cached results are
+	discarded when any of the tables queried has been changed or reloaded
+	since.  Hits and misses are reported by base.caches.getCacheStats
+	under adqlMorph.
+	"""
+	cache = _getMorphCache()
+	if cache is None:
+		return _morphADQL(
+			query, metaProfile, tdsForUploads, externalLimit, hardLimit)[:2]
+
+	key = (_normalizeQuery(query), metaProfile, 
+		tuple((td.getQName(), tuple((c.name, c.type) for c in td))
+			for td in tdsForUploads),
+		externalLimit, hardLimit)
+	cached = cache.get(key)
+	if cached is not None:
+		pgQuery, tableTemplate, sourceTDs = cached
+		if _sourceTablesUnchanged(sourceTDs):
+			table = rsc.TableForDef(tableTemplate.tableDef)
+			table.copyMetaFrom(tableTemplate)
+			table.sourceTables = tableTemplate.sourceTables
+			return pgQuery, table
+
+	pgQuery, table, tree = _morphADQL(
+		query, metaProfile, tdsForUploads, externalLimit, hardLimit)
+	tableTemplate = rsc.TableForDef(table.tableDef)
+	tableTemplate.copyMetaFrom(table)
+	tableTemplate.sourceTables = table.sourceTables
+	cache[key] = (pgQuery, tableTemplate, _getSourceTableDefs(tree))
+	return pgQuery, table
 
 
 def query(querier, query, timeout=15, metaProfile=None, tdsForUploads=[],
@@ -305,15 +408,14 @@ def query(querier, query, timeout=15, metaProfile=None, tdsForUploads=[],
 	query, table = morphADQL(query, metaProfile, tdsForUploads, externalLimit,
 		hardLimit=hardLimit)
 	addTuple = _getTupleAdder(table)
-	oldTimeout = querier.getTimeout()
-	querier.setTimeout(timeout)
 	# XXX Hack: this is a lousy fix for postgres' seqscan love with
 	# limit.  See if we still want this with newer postgres...
-	querier.configureConnection([("enable_seqscan", False)])
+	oldSettings = querier.configureConnection([("enable_seqscan", False)],
+		timeout=timeout)
 
 	for tuple in querier.query(query):
 		addTuple(tuple)
-	querier.setTimeout(oldTimeout)
+	querier.configureConnection(oldSettings.items())
 
 	if len(table)==int(table.tableDef.setLimit):
 		table.addMeta("_warning", "Query result probably incomplete due"
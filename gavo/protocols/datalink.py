@@ -10,10 +10,13 @@ More on this in "Datalink Cores" in the reference documentation.
 #c COPYING file in the source distribution.
 
 
+import contextlib
 import itertools
 import inspect
 import os
+import threading
 import urllib
+from multiprocessing import pool
 
 from gavo import base
 from gavo import rsc
@@ -24,6 +27,7 @@ from gavo.protocols import products
 from gavo.protocols import soda
 from gavo.protocols.soda import (FormatNow, DeliverNow, DatalinkFault,
 	DEFAULT_SEMANTICS)
+from gavo.svcs import streaming
 from gavo.formats import votablewrite
 from gavo.votable import V, modelgroups
 
@@ -32,10 +36,16 @@ from nevow import rend
 from nevow import static
 
 from twisted.internet import defer
+from zope.interface import implements
 
 
 MS = base.makeStruct
 
+# the maximal number of threads reading FITS headers in bulk requests
+HEADER_READER_THREADS = 8
+
+_prefetchedHeaders = threading.local()
+
 
 class ProductDescriptor(object):
 	"""An encapsulation of information about some "product" (i.e., file).
@@ -131,10 +141,10 @@ class FITSProductDescriptor(ProductDescriptor):
 	"""
 	def __init__(self, *args, **kwargs):
 		ProductDescriptor.__init__(self, *args, **kwargs)
-		with open(os.path.join(base.getConfig("inputsDir"), 
-				self.accessPath)) as f:
-			self.hdr = utils.readPrimaryHeaderQuick(f,
-				maxHeaderBlocks=100)
+		srcPath = os.path.join(base.getConfig("inputsDir"), self.accessPath)
+		self.hdr = getattr(_prefetchedHeaders, "headers", {}).pop(srcPath, None)
+		if self.hdr is None:
+			self.hdr = _readFITSHeader(srcPath)
 		self.slices = []
 		self.dataIsPristine = True
 		self._axesTouched = set()
@@ -185,6 +195,67 @@ def getFITSDescriptor(pubDID, accrefPrefix=None,
 	return cls.fromAccref(pubDID, accref, accrefPrefix)
 
 
+def _readFITSHeader(srcPath):
+	"""returns the primary header of the FITS file at srcPath.
+	"""
+	with open(srcPath) as f:
+		return utils.readPrimaryHeaderQuick(f, maxHeaderBlocks=100)
+
+
+def _readFITSHeaderOrNone(srcPath):
+	"""returns srcPath and its primary header, where the header is None
+	if it cannot be read.
+	"""
+	try:
+		return srcPath, _readFITSHeader(srcPath)
+	except Exception:
+		# let the descriptor generator produce a proper error later
+		return srcPath, None
+
+
+@contextlib.contextmanager
+def descriptorsPrefetched(pubDIDs):
+	"""a context manager fetching what is needed for the product
+	descriptors for pubDIDs in bulk.
+
+	This fetches the products rows for all standard pubDIDs in pubDIDs
+	in one database query (see products.productsRowsPrefetched) and
+	reads the headers of FITS files among them in parallel.  Within the 
+	controlled block, descriptors (e.g., from getFITSDescriptor) created in
+	the current thread use what was prefetched.
+	"""
+	accrefs = []
+	for pubDID in pubDIDs:
+		try:
+			accrefs.append(rscdef.getAccrefFromStandardPubDID(pubDID))
+		except ValueError:
+			# not a standard pubDID; the descriptor generator will deal with it
+			pass
+
+	with products.productsRowsPrefetched(accrefs) as rows:
+		inputsDir = base.getConfig("inputsDir")
+		fitsPaths = [os.path.join(inputsDir, row["accessPath"])
+			for row in rows.itervalues() if row["mime"]=="image/fits"]
+
+		headers = {}
+		if len(fitsPaths)>1:
+			readers = pool.ThreadPool(min(HEADER_READER_THREADS, len(fitsPaths)))
+			try:
+				headers = dict((srcPath, hdr)
+					for srcPath, hdr in readers.imap_unordered(
+						_readFITSHeaderOrNone, fitsPaths)
+					if hdr is not None)
+			finally:
+				readers.close()
+				readers.join()
+
+		_prefetchedHeaders.headers = headers
+		try:
+			yield
+		finally:
+			del _prefetchedHeaders.headers
+
+
 class _File(static.File):
 	"""A nevow static.File with a pre-determined type.
 	"""
@@ -209,6 +280,29 @@ class _TemporaryFile(_File):
 		return result
 
 
+class _StreamedFITS(object):
+	"""A nevow resource streaming out a fitstools.DirectCutout.
+
+	This is a helper class for DataFormatters, available there as 
+	StreamedFITS.
+	"""
+	implements(inevow.IResource)
+
+	type = "image/fits"
+
+	def __init__(self, cutout):
+		self.cutout = cutout
+
+	def _writeTo(self, destF):
+		for chunk in self.cutout.iterBytes():
+			destF.write(chunk)
+
+	def renderHTTP(self, ctx):
+		request = inevow.IRequest(ctx)
+		request.setHeader("content-type", self.type)
+		return streaming.streamOut(self._writeTo, request)
+
+
 class DescriptorGenerator(rscdef.ProcApp):
 	"""A procedure application for making product descriptors for PUBDIDs
 	
@@ -536,6 +630,8 @@ class DataFormatter(rscdef.ProcApp):
 	    its path and media type to File and return the result. 
 	  - TemporaryFile(path, type) -- as File, but the disk file is unlinked 
 	    after use
+	  - StreamedFITS(cutout) -- a resource streaming out a 
+	    fitstools.DirectCutout.
 	  - soda -- the protocols.soda module
 	"""
 	name_ = "dataFormatter"
@@ -547,6 +643,7 @@ class DataFormatter(rscdef.ProcApp):
 		"IRequest": inevow.IRequest,
 		"File": _File,
 		"TemporaryFile": _TemporaryFile, 
+		"StreamedFITS": _StreamedFITS,
 		"soda": soda,
 	}
 
@@ -651,6 +748,42 @@ class DatalinkCoreBase(svcs.Core, base.ExpansionDelegator):
 
 		return linkDefs, inputKeys, errors
 
+	def getDescriptors(self, pubDIDs, args, faultsForErrors=True):
+		"""returns a list of descriptors for pubDIDs from our 
+		descriptorGenerator.
+
+		Products rows and FITS headers for standard pubDIDs are fetched
+		in bulk before the descriptor generator is called (see
+		descriptorsPrefetched), so many pubDIDs do not mean many database
+		queries.
+
+		With faultsForErrors, exceptions from the descriptor generator are 
+		turned into DatalinkFaults; otherwise, they are propagated.
+		"""
+		descGen = self.descriptorGenerator.compile(self)
+		descriptors = []
+		with descriptorsPrefetched(pubDIDs):
+			for pubDID in pubDIDs:
+				try:
+					descriptors.append(descGen(pubDID, args))
+				except Exception, ex:
+					# non-dlmeta exception should go right through to let people 
+					# redirect (and also because messages might be better).
+					if not faultsForErrors:
+						raise
+					else:
+						if isinstance(ex, base.NotFoundError):
+							descriptors.append(DatalinkFault.NotFoundFault(pubDID,
+								utils.safe_str(ex)))
+						else:
+							if base.DEBUG:
+								base.ui.notifyError(
+									"Error in datalink descriptor generator: %s"%
+									utils.safe_str(ex))
+							descriptors.append(DatalinkFault.Fault(pubDID,
+								utils.safe_str(ex)))
+		return descriptors
+
 	def getDatalinksResource(self, ctx, service):
 		"""returns a VOTable RESOURCE element with the data links.
 
@@ -881,28 +1014,8 @@ class DatalinkCore(DatalinkCoreBase):
 			args = {"ID": []}
 
 		pubDIDs = self._getPubDIDs(args)
-		descGen = self.descriptorGenerator.compile(self)
-		descriptors = []
-		for pubDID in pubDIDs:
-			try:
-				descriptors.append(descGen(pubDID, args))
-			except Exception, ex:
-				# non-dlmeta exception should go right through to let people redirect
-				# (and also because messages might be better).
-				if renderer.name!="dlmeta":
-					raise
-				else:
-					if isinstance(ex, base.NotFoundError):
-						descriptors.append(DatalinkFault.NotFoundFault(pubDID,
-							utils.safe_str(ex)))
-					else:
-						if base.DEBUG:
-							base.ui.notifyError("Error in datalink descriptor generator: %s"%
-								utils.safe_str(ex))
-						descriptors.append(DatalinkFault.Fault(pubDID,
-							utils.safe_str(ex)))
-
-		return self.adaptForDescriptors(renderer, descriptors)
+		return self.adaptForDescriptors(renderer, 
+			self.getDescriptors(pubDIDs, args, renderer.name=="dlmeta"))
 	
 	def _iterAccessResources(self, ctx, service):
 		"""iterates over the VOTable RESOURCE elements necessary for
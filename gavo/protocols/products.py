@@ -32,10 +32,14 @@ in the forseeable future.
 
 from __future__ import with_statement
 
+import contextlib
 import datetime
 import gzip
+import multiprocessing
 import re
 import os
+import threading
+import time
 import urllib
 import urlparse
 from cStringIO import StringIO
@@ -109,10 +113,8 @@ def makePreviewFromFITS(product):
 		else:
 			inFile = product.getFile()
 
-		with utils.fitsLock():
-			pixels = numpy.array([row 
-				for row in fitstools.iterScaledRows(inFile, 
-					destSize=PREVIEW_SIZE)])
+		# readScaledImage takes the FITS lock itself if it needs pyfits
+		pixels = fitstools.readScaledImage(inFile, destSize=PREVIEW_SIZE)
 	else:
 		raise NotImplementedError("TODO: Fix fitstools.iterScaledRows"
 			" to be more accomodating to weird things")
@@ -169,61 +171,235 @@ class PreviewCacheManager(object):
 	a preview and determines whether it should be cached, in which case it does
 	so provided a preview has been generated successfully.
 
-	A cache file is touched when it is used, so you can clean up rarely used
-	cache files by deleting all files in the preview cache older than some 
-	limit.
+	A cache file is touched when it is used.  When the files in the cache
+	take up more than [web]previewCacheSize bytes, the least recently used 
+	ones are removed until the cache is at 90% of the limit.
+
+	The manager counts hits, misses, and the time spent generating previews;
+	see getStats.  Use precomputePreviews or dachs admin cacheprev to fill
+	the cache before the previews are first requested.
 	"""
 	cachePath = base.getConfig("web", "previewCache")
 
+	# the number of bytes in the cache as far as we know; None means
+	# we have not looked yet.
+	_cacheBytes = None
+	_lock = threading.Lock()
+	_stats = dict.fromkeys(["hits", "misses", "generated", "failed", 
+		"evictions", "generationTime", "maxGenerationTime"], 0)
+
 	@classmethod
 	def getCacheName(cls, accref):
 		"""returns the full path a preview for accref is be stored under.
 		"""
 		return os.path.join(cls.cachePath, rscdef.getFlatName(accref))
 
+	@classmethod
+	def _noteHit(cls, cacheName):
+		try:
+			os.utime(cacheName, None)
+		except os.error:
+			pass   # don't fail just because we can't touch
+		cls._stats["hits"] += 1
+
 	@classmethod
 	def getCachedPreviewPath(cls, accref):
 		"""returns the path to a cached preview if it exists, None otherwise.
 		"""
 		cacheName = cls.getCacheName(accref)
 		if os.path.exists(cacheName):
+			cls._noteHit(cacheName)
 			return cacheName
 		return None
 
 	@classmethod
-	def saveToCache(self, data, cacheName):
+	def computePreview(cls, product):
+		"""returns the preview for product, updating the generation statistics.
+		"""
+		startTime = time.time()
+		try:
+			res = computePreviewFor(product)
+		except:
+			with cls._lock:
+				cls._stats["failed"] += 1
+			raise
+
+		genTime = time.time()-startTime
+		with cls._lock:
+			cls._stats["generated"] += 1
+			cls._stats["generationTime"] += genTime
+			cls._stats["maxGenerationTime"] = max(genTime, 
+				cls._stats["maxGenerationTime"])
+		return res
+
+	@classmethod
+	def saveToCache(cls, data, cacheName, enforceLimit=True):
+		"""writes data to the cache file cacheName and returns data.
+
+		Unless enforceLimit is False, this then makes sure the cache
+		is within its size limit.
+		"""
 		try:
-			with open(cacheName, "w") as f:
+			with utils.safeReplaced(cacheName) as f:
 				f.write(data)
-		except IOError: # caching failed, don't care
-			pass
+		except (IOError, os.error): # caching failed, don't care
+			return data
+
+		with cls._lock:
+			if cls._cacheBytes is not None:
+				cls._cacheBytes += len(data)
+		if enforceLimit:
+			cls.enforceSizeLimit()
 		return data
 
+	@classmethod
+	def _getCacheFiles(cls):
+		"""returns a list of (mtime, size, path) for the previews in the cache.
+		"""
+		res = []
+		for name in os.listdir(cls.cachePath):
+			if name.endswith(".temp"):  # being written by safeReplaced
+				continue
+			path = os.path.join(cls.cachePath, name)
+			try:
+				stat = os.stat(path)
+			except os.error: # concurrently removed
+				continue
+			res.append((stat.st_mtime, stat.st_size, path))
+		return res
+
+	@classmethod
+	def enforceSizeLimit(cls):
+		"""removes least recently used previews if the cache is larger
+		than [web]previewCacheSize.
+		"""
+		limit = base.getConfig("web", "previewCacheSize")
+		if not limit:
+			return
+
+		with cls._lock:
+			if cls._cacheBytes is not None and cls._cacheBytes<=limit:
+				return
+			files = cls._getCacheFiles()
+			totalBytes = sum(size for _, size, _ in files)
+
+			if totalBytes>limit:
+				files.sort()
+				for _, size, path in files:
+					if totalBytes<=0.9*limit:
+						break
+					try:
+						os.unlink(path)
+					except os.error:
+						continue
+					totalBytes -= size
+					cls._stats["evictions"] += 1
+			cls._cacheBytes = totalBytes
+
+	@classmethod
+	def getStats(cls):
+		"""returns a dictionary of statistics on the preview cache.
+
+		Apart from the raw counters (hits, misses, generated, failed,
+		evictions, generationTime, and maxGenerationTime, times in seconds),
+		this contains hitRate and meanGenerationTime; these are None
+		if not defined yet.
+		"""
+		with cls._lock:
+			stats = cls._stats.copy()
+		stats["hitRate"] = stats["meanGenerationTime"] = None
+		if stats["hits"]+stats["misses"]:
+			stats["hitRate"] = stats["hits"]/float(stats["hits"]+stats["misses"])
+		if stats["generated"]:
+			stats["meanGenerationTime"] = (
+				stats["generationTime"]/stats["generated"])
+		return stats
+
 	@classmethod
 	def getPreviewFor(cls, product):
 		"""returns a deferred firing the data for a preview.
 		"""
 		if not product.rAccref.previewIsCacheable():
-			return threads.deferToThread(computePreviewFor, product)
+			return threads.deferToThread(cls.computePreview, product)
 
 		accref = product.rAccref.accref
 		cacheName = cls.getCacheName(accref)
 		if os.path.exists(cacheName):
 			# Cache hit
-			try:
-				os.utime(cacheName, None)
-			except os.error:
-				pass   # don't fail just because we can't touch
-
+			cls._noteHit(cacheName)
 			with open(cacheName) as f:
 				return defer.succeed(f.read())
 
 		else:
 			# Cache miss
-			return threads.deferToThread(computePreviewFor, product
+			cls._stats["misses"] += 1
+			return threads.deferToThread(cls.computePreview, product
 				).addCallback(cls.saveToCache, cacheName)
 
 
+def _precomputeInWorker(args):
+	"""computes and caches a preview for an (accref, products row) pair.
+
+	This is run in the worker processes of precomputePreviews.  It returns
+	a tuple of accref, the size of the preview, and an error message
+	(which is None on success).
+	"""
+	accref, productsRow = args
+	_stringifyProductsRow(productsRow)
+	rAccref = RAccref(accref)
+	rAccref._productsRowCache = productsRow
+	try:
+		preview = PreviewCacheManager.computePreview(
+			getProductForRAccref(rAccref))
+		PreviewCacheManager.saveToCache(preview,
+			PreviewCacheManager.getCacheName(accref), enforceLimit=False)
+		return accref, len(preview), None
+	except Exception, ex:
+		return accref, 0, utils.safe_str(ex) or ex.__class__.__name__
+
+
+def precomputePreviews(productsRows, nParallel=4, force=False):
+	"""computes previews for the products described by productsRows
+	and puts them into the preview cache.
+
+	productsRows is a sequence of dictionaries from //products#products.
+	Only products with a preview of AUTO are considered, and unless force 
+	is true, those already in the cache are skipped.
+
+	The previews are computed in nParallel processes.  The function
+	returns a pair of a list of accrefs for which previews were generated
+	and a list of (accref, error message) pairs for the failures.
+	"""
+	todo = [(row["accref"], row) for row in productsRows
+		if row["preview"]=="AUTO" and (force 
+			or not os.path.exists(PreviewCacheManager.getCacheName(row["accref"])))]
+	if not todo:
+		return [], []
+
+	utils.ensureDir(PreviewCacheManager.cachePath)
+	# the workers must not inherit our database connections
+	base.closeConnectionPools()
+	pool = multiprocessing.Pool(nParallel)
+	generated, failed = [], []
+	try:
+		for accref, size, errMsg in pool.imap_unordered(
+				_precomputeInWorker, todo):
+			if errMsg is None:
+				generated.append(accref)
+				with PreviewCacheManager._lock:
+					if PreviewCacheManager._cacheBytes is not None:
+						PreviewCacheManager._cacheBytes += size
+				PreviewCacheManager.enforceSizeLimit()
+			else:
+				failed.append((accref, errMsg))
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+
+	return generated, failed
+
+
 class ProductBase(object):
 	"""A base class for products returned by the product core.
 
@@ -606,8 +782,8 @@ class CutoutProduct(ProductBase):
 	This only works for local FITS files with two axes.  For everything 
 	else, use datalink.
 	
-	We assume the cutouts are smallish -- they are, right now, not
-	streamed, but accumulated in memory.
+	For plain FITS files, the cutouts are done through fitstools.DirectCutout
+	and are thus streamed; only compressed files are loaded through pyfits.
 	"""
 	def _makeName(self):
 		self.name = "<cutout-"+os.path.basename(self.pr["accessPath"])
@@ -624,8 +800,29 @@ class CutoutProduct(ProductBase):
 				and rAccref.productsRow["mime"]=="image/fits"):
 			return cls(rAccref)
 
-	def _getCutoutHDU(self):
+	def _getPixelCuts(self, header):
+		"""returns cutoutFITS-style cuts for our parameters on an image with
+		header.
+		"""
 		ra, dec, sra, sdec = [self.rAccref.params[k] for k in self._myKeys]
+		skyWCS = coords.getWCS(header)
+		pixelFootprint = numpy.asarray(
+			numpy.round(skyWCS.wcs_world2pix([
+				(ra-sra/2., dec-sdec/2.),
+				(ra+sra/2., dec+sdec/2.)], 1)), numpy.int32)
+		return [
+			(skyWCS.longAxis, min(pixelFootprint[:,0]), max(pixelFootprint[:,0])),
+			(skyWCS.latAxis, min(pixelFootprint[:,1]), max(pixelFootprint[:,1]))]
+
+	def _getCutoutHDU(self):
+		try:
+			cutout = fitstools.DirectCutout(self.rAccref.localpath)
+		except fitstools.FITSError:
+			# compressed or otherwise strange; let pyfits handle it
+			pass
+		else:
+			return cutout.cutout(*self._getPixelCuts(cutout.header))
+
 		with utils.fitsLock():
 			# The following memmap=False works around a weird bug in pyfits 3.3,
 			# where it performs a separate memmap for each call to section(),
@@ -635,14 +832,8 @@ class CutoutProduct(ProductBase):
 			hdus = pyfits.open(self.rAccref.localpath, do_not_scale_image_data=True,
 				memmap=False)
 			try:
-				skyWCS = coords.getWCS(hdus[0].header)
-				pixelFootprint = numpy.asarray(
-					numpy.round(skyWCS.wcs_world2pix([
-						(ra-sra/2., dec-sdec/2.),
-						(ra+sra/2., dec+sdec/2.)], 1)), numpy.int32)
 				res = fitstools.cutoutFITS(hdus[0], 
-					(skyWCS.longAxis, min(pixelFootprint[:,0]), max(pixelFootprint[:,0])),
-					(skyWCS.latAxis, min(pixelFootprint[:,1]), max(pixelFootprint[:,1])))
+					*self._getPixelCuts(hdus[0].header))
 			finally:
 				hdus.close()
 
@@ -650,10 +841,14 @@ class CutoutProduct(ProductBase):
 
 	def iterData(self):
 		res = self._getCutoutHDU()
-		bytes = StringIO()
-		res.writeto(bytes)
+		if isinstance(res, fitstools.DirectCutout):
+			for chunk in res.iterBytes(self.chunkSize):
+				yield chunk
 
-		yield bytes.getvalue()
+		else:
+			bytes = StringIO()
+			res.writeto(bytes)
+			yield bytes.getvalue()
 
 	def _writeStuffTo(self, destF):
 		for chunk in self.iterData():
@@ -846,6 +1041,127 @@ class ProductCore(svcs.DBCore):
 		return rsc.makeData(dd, forceSource=self._getRAccrefs(inputTable))
 
 
+def _stringifyProductsRow(productsRow):
+	"""makes sure whatever in productsRow can end up being written to 
+	something file-like is a str.
+
+	This changes productsRow in place and returns it.
+	"""
+	for key in ["mime", "accessPath", "accref"]:
+		productsRow[key] = str(productsRow[key])
+	return productsRow
+
+
+_sharedProductsRows = None
+
+def _getProductsRowCache():
+	"""returns the LRUCache for products rows, or None if caching is
+	disabled.
+	"""
+	global _sharedProductsRows
+	if _sharedProductsRows is None:
+		size = base.getConfig("web", "productsRowCacheSize")
+		if size<1:
+			return None
+		_sharedProductsRows = base.caches.LRUCache("productsRows", 
+			maxItems=size,
+			ttl=base.getConfig("web", "productsRowCacheTTL") or None)
+	return _sharedProductsRows
+
+
+def _clearProductsRowCache(fqName):
+	"""empties the products row cache if fqName is the products table.
+
+	This is subscribed to DBTableModified so rows written in this process
+	are never served from the cache.
+	"""
+	if fqName.lower()=="dc.products" and _sharedProductsRows is not None:
+		_sharedProductsRows.clear()
+
+base.ui.subscribeDBTableModified(_clearProductsRowCache)
+
+
+def _getImportStamp(sourceTable):
+	"""returns the mtime of the import timestamp of the RD defining
+	sourceTable, or None if it cannot be determined.
+
+	This changes whenever dachs imp has rewritten the products of sourceTable.
+	"""
+	try:
+		return os.path.getmtime(base.caches.getMTH(None).getTableDefForTable(
+			sourceTable).rd.getTimestampPath())
+	except (base.Error, os.error, AttributeError):
+		return None
+
+
+def _getCachedProductsRow(accref):
+	"""returns a copy of the cached products row for accref, or None if
+	there is no valid one.
+	"""
+	cache = _getProductsRowCache()
+	if cache is None:
+		return None
+
+	cached = cache.get(accref)
+	if cached is None:
+		return None
+	row, importStamp = cached
+	if _getImportStamp(row["sourceTable"])!=importStamp:
+		return None
+	return row.copy()
+
+
+def _cacheProductsRow(row):
+	"""enters row into the products row cache (if enabled).
+	"""
+	cache = _getProductsRowCache()
+	if cache is not None:
+		cache[row["accref"]] = (row.copy(), _getImportStamp(row["sourceTable"]))
+
+
+def getProductsRows(accrefs):
+	"""returns a dictionary mapping accrefs to their rows in dc.products.
+
+	Rows are taken from the products row cache where possible, the rest 
+	is fetched in a single database query.  Accrefs not in the products 
+	table are missing from the result.
+	"""
+	res, toFetch = {}, []
+	for accref in set(accrefs):
+		row = _getCachedProductsRow(accref)
+		if row is None:
+			toFetch.append(accref)
+		else:
+			res[accref] = row
+	if not toFetch:
+		return res
+
+	for row in base.resolveCrossId(PRODUCTS_TDID).doSimpleQuery(
+			fragments="accref = ANY(%(accrefs)s)", params={"accrefs": toFetch}):
+		_stringifyProductsRow(row)
+		_cacheProductsRow(row)
+		res[row["accref"]] = row
+	return res
+
+
+_prefetchedRows = threading.local()
+
+@contextlib.contextmanager
+def productsRowsPrefetched(accrefs):
+	"""a context manager fetching the products rows for accrefs in one go.
+
+	Within the controlled block, RAccrefs created in the current thread
+	for any of accrefs take their productsRow from what was fetched rather 
+	than querying the database.  The manager returns the dictionary
+	returned by getProductsRows.
+	"""
+	_prefetchedRows.rows = getProductsRows(accrefs)
+	try:
+		yield _prefetchedRows.rows
+	finally:
+		del _prefetchedRows.rows
+
+
 class RAccref(object):
 	"""A product key including possible modifiers.
 
@@ -944,10 +1260,25 @@ class RAccref(object):
 	def productsRow(self):
 		"""returns the row in dc.products corresponding to this RAccref's
 		accref, or raises a NotFoundError.
+
+		Rows are shared between RAccrefs through an LRU cache (see
+		[web]productsRowCacheSize); cached rows are discarded when the
+		table they belong to is re-imported.  You get a copy of the row,
+		so you can change it without affecting other RAccrefs.
 		"""
 		try:
 			return self._productsRowCache
 		except AttributeError:
+			prefetched = getattr(_prefetchedRows, "rows", {})
+			if self.accref in prefetched:
+				self._productsRowCache = prefetched[self.accref].copy()
+				return self._productsRowCache
+
+			cached = _getCachedProductsRow(self.accref)
+			if cached is not None:
+				self._productsRowCache = cached
+				return self._productsRowCache
+
 			res = base.resolveCrossId(PRODUCTS_TDID).doSimpleQuery(
 				fragments="accref=%(accref)s", params={"accref": self.accref})
 			if not res:
@@ -956,13 +1287,8 @@ class RAccref(object):
 					" not.  If you have an IVOID (pubDID) for the file you are trying to"
 					" locate, you may still find it by querying the ivoa.obscore table"
 					" using TAP and ADQL.")
-			self._productsRowCache = res[0]
-		
-			# make sure whatever can end up being written to something
-			# file-like
-			for key in ["mime", "accessPath", "accref"]:
-				self._productsRowCache[key] = str(self._productsRowCache[key])
-
+			self._productsRowCache = _stringifyProductsRow(res[0])
+			_cacheProductsRow(self._productsRowCache)
 			return self._productsRowCache
 
 	def __str__(self):
@@ -190,6 +190,9 @@ class SIAPCutoutCore(svcs.DBCore):
 	# compress the stuff or have images with bytes per pixel != 2
 	bytesPerPixel = 2
 
+	# we need to fix the records after the query
+	streamable = False
+
 	copiedCols = ["centerAlpha", "centerDelta", "imageTitle", "instId",
 		"dateObs", "nAxes", "pixelSize", "pixelScale", "mime",
 		"refFrame", "wcs_equinox", "wcs_projection", "wcs_refPixel",
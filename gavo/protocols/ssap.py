@@ -111,6 +111,9 @@ class SSAPCore(svcs.DBCore):
 
 	ssapVersion = "1.04"
 
+	# we add preview links and status info to the result table
+	streamable = False
+
 	outputTableXML = """
 		<outputTable verbLevel="30">
 			<property name="virtual">True</property>
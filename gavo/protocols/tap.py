@@ -12,6 +12,10 @@ from __future__ import with_statement
 
 import datetime
 import os
+import time
+
+from twisted.internet import protocol
+from twisted.internet import reactor
 
 from gavo import base
 from gavo import rsc
@@ -21,6 +25,7 @@ from gavo.imp.pyparsing import ParseException
 from gavo.protocols import uws
 from gavo.protocols import uwsactions
 from gavo.utils import codetricks
+from gavo.utils import pgexplain
 from gavo.utils import stanxml
 
 
@@ -199,19 +204,148 @@ def getAccessibleTables():
 ########################## Maintaining TAP jobs
 
 
+def estimateJobCost(job):
+	"""returns the query planner's estimate for the total cost of job's
+	query.
+
+	This returns None if no estimate can be obtained, e.g., for jobs with
+	uploads (which we do not want to ingest just for this) or invalid
+	queries.
+	"""
+	from gavo.protocols import adqlglue
+	from gavo.protocols import taprunner
+
+	parameters = job.parameters
+	if parameters.get("upload") or "query" not in parameters:
+		return None
+	try:
+		# use the same query and limit the job will run with
+		query, maxrec = taprunner._parseTAPParameters(job.jobId, parameters)
+		pgQuery, _ = adqlglue.morphADQL(query, externalLimit=maxrec)
+		with base.getUntrustedConn() as conn:
+			plan = pgexplain.parseQueryPlan(
+				conn.query("EXPLAIN "+pgQuery, timeout=5))
+		return plan[1]["cost"][1]
+	except Exception, ex:
+		base.ui.notifyInfo("No cost estimate for TAP job %s: %s"%(
+			job.jobId, ex))
+		return None
+
+
+
+class WorkerPoolProtocol(protocol.ProcessProtocol):
+	"""The protocol for talking to a pool of pre-forked TAP workers
+	(see taprunner.runWorkerPool).
+
+	The pool announces workers waiting for a job with "idle <pid>"
+	and exited workers with "ended <pid>"; we assign jobs by writing
+	"<pid> <jobId>".  Since we know the pid of the worker before it starts,
+	jobs handed to a pooled worker can be managed exactly like jobs
+	run in a process of their own.
+	"""
+	def __init__(self, workerSystem):
+		self.workerSystem = workerSystem
+		self.idlePIDs, self.jobsForPIDs = [], {}
+		self.inBuffer = ""
+		self.alive, self.endedAt = True, None
+
+	def outReceived(self, data):
+		self.inBuffer += data
+		while "\n" in self.inBuffer:
+			line, self.inBuffer = self.inBuffer.split("\n", 1)
+			self.lineReceived(line)
+	
+	def errReceived(self, data):
+		base.ui.notifyInfo("TAP worker pool produced an error message: %s"%
+			data)
+
+	def lineReceived(self, line):
+		try:
+			verb, pid = line.split()
+			pid = int(pid)
+		except ValueError:
+			base.ui.notifyError("Bad message from TAP worker pool: %s"%repr(line))
+			return
+
+		if verb=="idle":
+			self.idlePIDs.append(pid)
+		elif verb=="ended":
+			if pid in self.idlePIDs:
+				self.idlePIDs.remove(pid)
+			jobId = self.jobsForPIDs.pop(pid, None)
+			if jobId is not None:
+				uws.ensureJobFinished(self.workerSystem, jobId)
+				self.workerSystem.scheduleProcessQueueCheck()
+				self.workerSystem.checkProcessQueue()
+
+	def processEnded(self, statusObject):
+		base.ui.notifyError("TAP worker pool exited: %s"%statusObject.value)
+		self.alive, self.endedAt = False, time.time()
+		self.idlePIDs = []
+
+	def assignJob(self, jobId):
+		"""hands jobId to an idle worker and returns that worker's pid.
+
+		If no worker is available, None is returned.
+		"""
+		if not self.alive or not self.idlePIDs:
+			return None
+		pid = self.idlePIDs.pop(0)
+		self.jobsForPIDs[pid] = jobId
+		self.transport.write("%d %s\n"%(pid, jobId))
+		return pid
+
+
 class TAPTransitions(uws.ProcessBasedUWSTransitions):
 	"""The transition function for TAP jobs.
 
 	There's a hack here: After each transition, when you've released
 	your lock on the job, call checkProcessQueue (in reality, only
 	PhaseAction does this).
+
+	Within the server, if [async]tapWorkerPoolSize is non-zero, jobs
+	are preferably run by a pool of pre-forked workers (see 
+	WorkerPoolProtocol).  If no pooled worker is available, we fall
+	back to spawning a taprunner process for the job.
 	"""
+	# seconds to wait before re-starting a worker pool that has died
+	poolRespawnDelay = 60
+
 	def __init__(self):
 		uws.SimpleUWSTransitions.__init__(self, "TAP")
+		self.workerPool = None
 
 	def getCommandLine(self, wjob):
 		return "gavo", ["gavo", "--ui", "stingy", "tap", "--", str(wjob.jobId)]
 
+	def _getWorkerPool(self, wjob):
+		"""returns a WorkerPoolProtocol for a running worker pool, or None
+		if no pool is configured or available.
+
+		The pool is started on first use.
+		"""
+		poolSize = base.getConfig("async", "tapWorkerPoolSize")
+		if not poolSize:
+			return None
+
+		if self.workerPool is None or (not self.workerPool.alive
+				and time.time()-self.workerPool.endedAt>self.poolRespawnDelay):
+			self.workerPool = WorkerPoolProtocol(wjob.uws)
+			reactor.spawnProcess(self.workerPool, "gavo",
+				args=["gavo", "--ui", "stingy", "tap", "--pool", str(poolSize)],
+				env=os.environ)
+		return self.workerPool
+
+	def _startJobTwisted(self, wjob):
+		assert wjob.phase==uws.QUEUED
+		pool = self._getWorkerPool(wjob)
+		if pool is not None:
+			pid = pool.assignJob(wjob.jobId)
+			if pid is not None:
+				wjob.change(pid=pid, phase=uws.EXECUTING)
+				return
+		uws.ProcessBasedUWSTransitions._startJobTwisted(self, wjob)
+
 	def queueJob(self, newState, wjob, ignored):
 		"""puts a job on the queue.
 		"""
@@ -265,12 +399,18 @@ def parseUploadString(uploadString):
 				" i.e., basically only alphanumerics are allowed.")
 
 
+def validateLang(value):
+	"""raises a ValidationError if value is not a supported query language.
+	"""
+	if value not in SUPPORTED_LANGUAGES:
+		raise base.ValidationError("This service does not support the"
+			" query language %s"%value, "LANG")
+
+
 class LangParameter(uws.JobParameter):
 	@classmethod
 	def addPar(cls, name, value, job):
-		if value not in SUPPORTED_LANGUAGES:
-			raise base.ValidationError("This service does not support the"
-				" query language %s"%value, "LANG")
+		validateLang(value)
 		uws.JobParameter.updatePar(name, value, job)
 
 
@@ -368,14 +508,15 @@ class TAPJob(uws.UWSJobWithWD):
 		"""returns an estimation of the job completion.
 
 		This currently is very naive: we give each job that's going to run
-		before this one 10 minutes.
-
-		This method needs to be changed when the dequeueing algorithm
-		is changed.
+		before this one 10 minutes.  For queued jobs, the sequence is
+		what the UWS' scheduler says; for other jobs, we count the queued
+		jobs that will be destroyed before this one.
 		"""
-		with base.getTableConn() as conn:
-			nBefore = self.uws.runCanned('countQueuedBefore',
-				{'dt': self.destructionTime}, conn)[0]["count"]
+		nBefore = self.uws.getQueuePosition(self.jobId)
+		if nBefore is None:
+			with base.getTableConn() as conn:
+				nBefore = self.uws.runCanned('countQueuedBefore',
+					{'dt': self.destructionTime}, conn)[0]["count"]
 		return datetime.datetime.utcnow()+nBefore*EST_TIME_PER_JOB
 
 
@@ -476,6 +617,9 @@ class TAPUWS(uws.UWSWithQueueing):
 		"""
 		return "%s/%s/%s"%(self.baseURL, "async", jobId)
 
+	def estimateJobCost(self, jobId):
+		return estimateJobCost(self.getJob(jobId))
+
 WORKER_SYSTEM = TAPUWS()
 
 
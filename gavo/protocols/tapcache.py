@@ -0,0 +1,201 @@
+"""
+An on-disk cache for the results of TAP queries.
+
+Entries are keyed on the postgres query, the output format, and the
+match limit.  With each entry, we store a validity token made from the
+dc.tablemeta rows (their xmins, which change whenever dachs imp rewrites
+them) and the RD import timestamps of the tables the query draws from.
+Entries with a token different from the current one are ignored.
+
+Queries on tables not in dc.tablemeta (e.g., uploads) are never cached.
+
+The cache is opt-in; it is enabled by setting [async]resultCacheSize
+to the number of bytes it may use.  When it grows larger than that,
+the least recently used entries are removed.
+"""
+
+#c Copyright 2008-2017, the GAVO project
+#c
+#c This program is free software, covered by the GNU GPL.  See the
+#c COPYING file in the source distribution.
+
+
+from __future__ import with_statement
+
+import contextlib
+import hashlib
+import marshal
+import os
+import re
+import tempfile
+
+from gavo import base
+from gavo import utils
+
+
+# The INFO we add to VOTables served from the cache
+CACHE_INFO = ('<INFO name="DaCHS_RESULT_CACHE" value="HIT">This result'
+	' was served from a cache of earlier results.</INFO>')
+
+RESOURCE_START = re.compile("<RESOURCE[^>]*>")
+
+
+class ResultCache(object):
+	"""a directory of cached TAP results.
+
+	For each entry, there is a file <key>.dat with the serialised result
+	and a file <key>.token with the marshalled validity token.  The
+	mtime of the .dat file is used for LRU bookkeeping.
+	"""
+	def __init__(self, cacheDir, maxBytes):
+		self.cacheDir, self.maxBytes = cacheDir, maxBytes
+		utils.ensureDir(self.cacheDir)
+
+	def _getPaths(self, key):
+		stem = os.path.join(self.cacheDir, key)
+		return stem+".dat", stem+".token"
+
+	def getKeyAndToken(self, res, format):
+		"""returns a key and a validity token for caching the rsc.Data res
+		in format.
+
+		If res cannot be cached, (None, None) is returned.
+		"""
+		qTable = res.getPrimaryTable()
+		sourceTables = getattr(qTable, "sourceTables", None)
+		if not sourceTables or not hasattr(qTable, "query"):
+			return None, None
+
+		key = hashlib.md5("\0".join([
+			qTable.query, format, str(res.setLimit)])).hexdigest()
+
+		names = set(n.lower() for n in sourceTables)
+		with base.getTableConn() as conn:
+			tableStates = dict((row[0], row[1:]) for row in conn.query(
+				"SELECT lower(tablename), sourcerd, xmin::text"
+				" FROM dc.tablemeta WHERE lower(tablename) IN %(names)s",
+				{"names": tuple(names)}))
+		if len(tableStates)!=len(names):
+			# some table is unknown, presumably an upload
+			return None, None
+
+		token = []
+		for name in sorted(tableStates):
+			sourceRD, xmin = tableStates[name]
+			try:
+				importStamp = os.path.getmtime(
+					base.caches.getRD(sourceRD).getTimestampPath())
+			except (os.error, base.Error):
+				importStamp = None
+			token.append((name, xmin, importStamp))
+		return key, tuple(token)
+
+	def open(self, key, token):
+		"""returns an open file for the result stored under key if it
+		is valid for token, None otherwise.
+		"""
+		dataPath, tokenPath = self._getPaths(key)
+		try:
+			with open(tokenPath, "rb") as f:
+				if marshal.load(f)!=token:
+					return None
+			res = open(dataPath, "rb")
+			os.utime(dataPath, None)
+			return res
+		except (IOError, os.error, EOFError, ValueError, TypeError):
+			return None
+
+	@contextlib.contextmanager
+	def recording(self, key, token, destF):
+		"""returns a file that writes to destF and, if the controlled
+		block finishes without an exception, stores what was written under
+		key.
+		"""
+		handle, tempPath = tempfile.mkstemp(".temp", "", dir=self.cacheDir)
+		try:
+			with os.fdopen(handle, "wb") as cacheF:
+				yield _TeeFile(destF, cacheF)
+		except:
+			os.unlink(tempPath)
+			raise
+
+		dataPath, tokenPath = self._getPaths(key)
+		try:
+			with utils.safeReplaced(tokenPath) as f:
+				marshal.dump(token, f)
+			os.rename(tempPath, dataPath)
+		except (IOError, os.error):
+			base.ui.notifyWarning("Could not store TAP result in cache.")
+			if os.path.exists(tempPath):
+				os.unlink(tempPath)
+		self.enforceBudget()
+
+	def enforceBudget(self):
+		"""removes least recently used entries until the cache fits
+		into maxBytes.
+		"""
+		entries, totalBytes = [], 0
+		for name in os.listdir(self.cacheDir):
+			if name.endswith(".dat"):
+				try:
+					stat = os.stat(os.path.join(self.cacheDir, name))
+				except os.error: # concurrently removed
+					continue
+				entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+				totalBytes += stat.st_size
+
+		entries.sort()
+		while entries and totalBytes>self.maxBytes:
+			_, size, key = entries.pop(0)
+			for path in self._getPaths(key):
+				try:
+					os.unlink(path)
+				except os.error:
+					pass
+			totalBytes -= size
+
+
+class _TeeFile(object):
+	"""a minimal write-only file writing to two files.
+	"""
+	def __init__(self, f1, f2):
+		self.f1, self.f2 = f1, f2
+
+	def write(self, data):
+		self.f1.write(data)
+		self.f2.write(data)
+
+	def flush(self):
+		pass
+
+
+def copyFromCache(cachedF, format, destF):
+	"""copies a cached result from cachedF to destF.
+
+	For VOTables, an INFO telling the client that the result came from
+	the cache is added to the results RESOURCE.
+	"""
+	if format.startswith("votable"):
+		head = cachedF.read(2**16)
+		mat = RESOURCE_START.search(head)
+		if mat:
+			head = head[:mat.end()]+CACHE_INFO+head[mat.end():]
+		destF.write(head)
+	utils.cat(cachedF, destF)
+
+
+_resultCache = None
+
+def getResultCache():
+	"""returns the ResultCache configured, or None if result caching
+	is disabled.
+	"""
+	global _resultCache
+	maxBytes = base.getConfig("async", "resultCacheSize")
+	if maxBytes<1:
+		return None
+
+	if _resultCache is None:
+		_resultCache = ResultCache(
+			os.path.join(base.getConfig("cacheDir"), "tapresults"), maxBytes)
+	return _resultCache
@@ -22,6 +22,8 @@ ABORTED or ERROR.
 from __future__ import with_statement
 
 import datetime
+import os
+import select
 import sys
 import time
 
@@ -41,6 +43,7 @@ from gavo.formats import votableread
 from gavo.formats import votablewrite
 from gavo.protocols import adqlglue
 from gavo.protocols import tap
+from gavo.protocols import tapcache
 from gavo.protocols import uws
 
 
@@ -94,7 +97,7 @@ def _parseTAPParameters(jobId, parameters):
 		maxrec = min(base.getConfig("async", "hardMAXREC"),
 			int(parameters["maxrec"]))
 	except ValueError:
-		raise base.ui.logOldError(
+		raise base.ui.logOldExc(
 			uws.UWSError("Invalid MAXREC literal '%s'."%parameters["maxrec"]))
 	except KeyError:
 		maxrec = base.getConfig("async", "defaultMAXREC")
@@ -140,6 +143,47 @@ def writeResultTo(format, res, outF):
 		formats.formatData(format, res, outF, acquireSamples=False)
 
 
+def _isInResultCache(format, res):
+	"""returns true if the TAP result cache has a valid entry for res
+	in format.
+	"""
+	cache = tapcache.getResultCache()
+	if cache is None:
+		return False
+	key, token = cache.getKeyAndToken(res, format)
+	if key is None:
+		return False
+	cachedF = cache.open(key, token)
+	if cachedF is None:
+		return False
+	cachedF.close()
+	return True
+
+
+def writeResultCached(format, res, outF):
+	"""writes res like writeResultTo, going through the TAP result cache
+	if it is enabled.
+	"""
+	cache = tapcache.getResultCache()
+	if cache is None:
+		return writeResultTo(format, res, outF)
+
+	key, token = cache.getKeyAndToken(res, format)
+	if key is None:
+		return writeResultTo(format, res, outF)
+
+	cachedF = cache.open(key, token)
+	if cachedF is not None:
+		base.ui.notifyInfo("Serving TAP result from cache")
+		res.getPrimaryTable().cleanup()
+		with cachedF:
+			tapcache.copyFromCache(cachedF, format, outF)
+		return
+
+	with cache.recording(key, token, outF) as teeF:
+		writeResultTo(format, res, teeF)
+
+
 def runTAPQuery(query, timeout, connection, tdsForUploads, maxrec,
 		autoClose=True):
 	"""executes a TAP query and returns the result in a data instance.
@@ -154,12 +198,12 @@ def runTAPQuery(query, timeout, connection, tdsForUploads, maxrec,
 		result = rsc.QueryTable(tableTrunk.tableDef, pgQuery, connection,
 			autoClose=autoClose)
 		result.meta_ = tableTrunk.meta_
+		result.sourceTables = tableTrunk.sourceTables
 		# XXX Hack: this is a lousy fix for postgres' seqscan love with
 		# limit.  See if we still want this with newer postgres...
 		result.configureConnection([
 			("enable_seqscan", False),
-			("cursor_tuple_fraction", 1)])
-		result.setTimeout(timeout)
+			("cursor_tuple_fraction", 1)], timeout=timeout)
 	except:
 		adqlglue.mapADQLErrors(*sys.exc_info())
 
@@ -232,6 +276,49 @@ def getQTableFromJob(parameters, jobId, queryProfile, timeout):
 		tdsForUploads, maxrec)
 
 
+def _getDefaultFormat():
+	"""returns the format code for results when the client did not give
+	a FORMAT.
+	"""
+	if base.getConfig("ivoa", "votDefaultEncoding")=="td":
+		return "votable/td"
+	return "votable"
+
+
+def prepareSyncQuery(parameters, queryProfile="untrustedquery"):
+	"""returns a format and an rsc.Data instance for a sync TAP query
+	without uploads.
+
+	parameters is a dictionary like a TAP job's parameters.  The query
+	is already executing when this function returns, so errors in
+	the query are (mostly) raised here rather than while writing
+	the result.
+
+	This lets web.taprender stream results directly to the client without
+	going through UWS.
+	"""
+	format = normalizeTAPFormat(parameters.get("format", _getDefaultFormat()))
+	if "lang" in parameters:
+		tap.validateLang(parameters["lang"])
+	query, maxrec = _parseTAPParameters(None, parameters)
+	connection = base.getDBConnection(queryProfile)
+
+	try:
+		base.ui.notifyInfo("Sync TAP executing %s"%query)
+		result = runTAPQuery(query, 
+			base.getConfig("async", "defaultExecTimeSync"),
+			connection, [], maxrec)
+		res = _makeDataFor(result)
+		# don't bother the database if we'll serve the result from the cache
+		if not _isInResultCache(format, res):
+			result.execute()
+	except Exception:
+		connection.close()
+		svcs.mapDBErrors(*sys.exc_info())
+
+	return format, res
+
+
 def runTAPJobNoState(parameters, jobId, queryProfile, timeout):
 	"""executes a TAP job defined by parameters and writes the
 	result to the job's working directory.
@@ -242,11 +329,7 @@ def runTAPJobNoState(parameters, jobId, queryProfile, timeout):
 	# The following makes us bail out if a bad format was passed -- no
 	# sense spending the CPU on executing the query then, so we get the
 	# format here.
-	defaultFormat = "votable"
-	if base.getConfig("ivoa", "votDefaultEncoding")=="td":
-		defaultFormat = "votable/td"
-
-	format = normalizeTAPFormat(parameters.get("format", defaultFormat))
+	format = normalizeTAPFormat(parameters.get("format", _getDefaultFormat()))
 
 	res = _makeDataFor(getQTableFromJob(
 		parameters, jobId, queryProfile, timeout))
@@ -255,7 +338,7 @@ def runTAPJobNoState(parameters, jobId, queryProfile, timeout):
 		job = tap.WORKER_SYSTEM.getJob(jobId)
 		destF = job.openResult(
 			formats.getMIMEFor(format, job.parameters.get("format")), "result")
-		writeResultTo(format, res, destF)
+		writeResultCached(format, res, destF)
 		destF.close()
 	except Exception:
 		# DB errors can occur here since we're streaming directly from
@@ -339,43 +422,172 @@ def _runInThread(target, jobId):
 		raise
 
 
+############### Worker pool
+
+
+def _preloadForPool():
+	"""loads the resources most TAP jobs need.
+
+	This is run once in the pool process so forked workers start up warm.
+	Afterwards, the pooled database connections are closed so the workers
+	do not share them.  The metadata handler's connection stays open, as
+	the handler is cached; the workers reset it (see _runPooledWorker).
+	"""
+	base.caches.getRD("__system__/tap")
+	base.caches.getRD("__system__/adql")
+	mth = base.caches.getMTH(None)
+	for tableName in mth.getTAPTables():
+		try:
+			mth.getTableDefForTable(tableName)
+		except Exception, ex:
+			base.ui.notifyWarning("TAP worker pool could not preload %s: %s"%(
+				tableName, ex))
+	base.closeConnectionPools()
+
+
+def _runPooledWorker(jobFD, inheritedFDs):
+	"""waits for a job id on jobFD and executes that job.
+
+	This runs in a child forked by runWorkerPool and never returns.
+	inheritedFDs are the pool's pipes to the other workers.
+	"""
+	try:
+		try:
+			for fd in inheritedFDs:
+				os.close(fd)
+			nullFD = os.open(os.devnull, os.O_RDWR)
+			os.dup2(nullFD, 0)
+			os.dup2(nullFD, 1)
+			jobId = os.fdopen(jobFD).readline().strip()
+			if jobId:
+				# we must not use the connection inherited from the pool process
+				base.caches.getMTH(None).reset()
+				executeJob(jobId)
+		except:
+			base.ui.notifyError("Pooled taprunner failed")
+	finally:
+		os._exit(0)
+
+
+def _reapWorkers(idleWorkers, report):
+	"""collects exited workers and reports them as ended.
+	"""
+	while True:
+		try:
+			pid, _ = os.waitpid(-1, os.WNOHANG)
+		except os.error: # no children left
+			return
+		if pid==0:
+			return
+		if pid in idleWorkers:
+			os.close(idleWorkers.pop(pid))
+		report("ended", pid)
+
+
+def _assignJob(line, idleWorkers):
+	"""hands the job in a "<pid> <jobId>" line from the server to the
+	respective idle worker.
+	"""
+	try:
+		pid, jobId = line.split()
+		fd = idleWorkers.pop(int(pid))
+	except (ValueError, KeyError):
+		base.ui.notifyError("TAP worker pool: bad job assignment %s"%repr(line))
+		return
+	os.write(fd, jobId+"\n")
+	os.close(fd)
+
+
+def runWorkerPool(poolSize):
+	"""runs a pre-forking server for TAP jobs.
+
+	This keeps poolSize forked, warmed-up workers waiting for jobs.  The
+	protocol with the DaCHS server (see tap.WorkerPoolProtocol) is line
+	based: on stdout, we announce new workers with "idle <pid>" and
+	report exited ones with "ended <pid>"; on stdin, the server assigns
+	jobs with "<pid> <jobId>".  When stdin is closed, we exit; workers
+	already running jobs finish them.
+	"""
+	_preloadForPool()
+	idleWorkers, inBuffer = {}, ""
+
+	def report(verb, pid):
+		sys.stdout.write("%s %d\n"%(verb, pid))
+		sys.stdout.flush()
+
+	while True:
+		while len(idleWorkers)<poolSize:
+			readFD, writeFD = os.pipe()
+			pid = os.fork()
+			if pid==0:
+				os.close(writeFD)
+				_runPooledWorker(readFD, idleWorkers.values())
+			os.close(readFD)
+			idleWorkers[pid] = writeFD
+			report("idle", pid)
+
+		_reapWorkers(idleWorkers, report)
+		if select.select([0], [], [], 1)[0]:
+			data = os.read(0, 4096)
+			if not data: # the server has gone away
+				break
+			inBuffer += data
+			while "\n" in inBuffer:
+				line, inBuffer = inBuffer.split("\n", 1)
+				_assignJob(line, idleWorkers)
+
+	# idle workers exit when they see EOF on their pipes
+	for fd in idleWorkers.values():
+		os.close(fd)
+
+
 def parseCommandLine():
 	from optparse import OptionParser
-	parser = OptionParser(usage="%prog <jobid>",
+	parser = OptionParser(usage="%prog <jobid> | %prog --pool <n>",
 		description="runs the TAP job with <jobid> from the UWS table.")
+	parser.add_option("--pool", help="Rather than running a job, keep"
+		" N pre-forked workers and run the jobs the DaCHS server assigns"
+		" to them (this is used by the server itself)",
+		dest="poolSize", type="int", default=0, metavar="N")
 	opts, args = parser.parse_args()
-	if len(args)!=1:
+	if (opts.poolSize and args) or (not opts.poolSize and len(args)!=1):
 		parser.print_help(file=sys.stderr)
 		sys.exit(1)
-	return opts, args[0]
+	return opts, (args or [None])[0]
 
 
-def main():
-	"""causes the execution of the job with jobId sys.argv[0].
+def executeJob(jobId):
+	"""runs the job with jobId, managing its state on failures.
 	"""
 	# there's a problem in CLI behaviour in that if anything goes wrong in 
 	# main, a job that may have been created will remain QUEUED forever.
 	# There's little we can do about that, though, since we cannot put
 	# a job into ERROR when we don't know its id or cannot get it from the DB.
+	setINTHandler(jobId)
 	try:
-		base.DEBUG = False
-		opts, jobId = parseCommandLine()
-		setINTHandler(jobId)
-		try:
-			_runInThread(lambda: runTAPJob(jobId), jobId)
-			base.ui.notifyInfo("taprunner for %s finished"%jobId)
-		except SystemExit:
-			pass
-		except uws.JobNotFound: # someone destroyed the job before I was done
-			errmsg = "Giving up non-existing TAP job %s."%jobId
-			sys.stderr.write(errmsg+"\n")
-			base.ui.notifyInfo(errmsg)
-		except Exception, ex:
-			base.ui.notifyError("taprunner %s major failure"%jobId)
-			# try to push job into the error state -- this may well fail given
-			# that we're quite hosed, but it's worth the try
-			with tap.WORKER_SYSTEM.changeableJob(jobId) as wjob:
-				wjob.changeToPhase(uws.ERROR, ex)
-			raise
-	finally:
+		_runInThread(lambda: runTAPJob(jobId), jobId)
+		base.ui.notifyInfo("taprunner for %s finished"%jobId)
+	except SystemExit:
 		pass
+	except uws.JobNotFound: # someone destroyed the job before I was done
+		errmsg = "Giving up non-existing TAP job %s."%jobId
+		sys.stderr.write(errmsg+"\n")
+		base.ui.notifyInfo(errmsg)
+	except Exception, ex:
+		base.ui.notifyError("taprunner %s major failure"%jobId)
+		# try to push job into the error state -- this may well fail given
+		# that we're quite hosed, but it's worth the try
+		with tap.WORKER_SYSTEM.changeableJob(jobId) as wjob:
+			wjob.changeToPhase(uws.ERROR, ex)
+		raise
+
+
+def main():
+	"""causes the execution of the job with jobId sys.argv[0].
+	"""
+	base.DEBUG = False
+	opts, jobId = parseCommandLine()
+	if opts.poolSize:
+		runWorkerPool(opts.poolSize)
+	else:
+		executeJob(jobId)
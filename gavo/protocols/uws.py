@@ -11,8 +11,10 @@ Support classes for the universal worker service.
 from __future__ import with_statement
 
 import cPickle as pickle
+import collections
 import contextlib
 import datetime
+import math
 import os
 import shutil
 import signal
@@ -246,6 +248,7 @@ class UWS(object):
 			wjob.setParamsFromRequest(request)
 			if request.getUser():
 				wjob.change(owner=request.getUser())
+			wjob.change(submitter=request.getUser() or request.getClientIP())
 		return jobId
 
 	def _getJob(self, jobId, conn, writable=False):
@@ -355,10 +358,12 @@ class UWS(object):
 			return [r["jobId"] for r in self.runCanned('getAllIds', {}, conn)]
 
 	def getIdsAndPhases(self, owner=None, phase=None, last=None, after=None,
-			initFragments=None, initPars=None):
+			initFragments=None, initPars=None, columns=("jobId", "phase")):
 		"""returns pairs for id and phase for all jobs in the UWS.
 
 		phase, last, after are the respective parameters from UWS 1.1.
+		Pass other names of jobs table columns in columns to get different
+		tuples.
 		"""
 		pars = locals()
 		fragments = initFragments or []
@@ -381,7 +386,7 @@ class UWS(object):
 		td = self.jobClass.jobsTD
 
 		with base.getTableConn() as conn: 
-			return conn.query(td.getSimpleQuery(["jobId", "phase"],
+			return conn.query(td.getSimpleQuery(list(columns),
 				fragments=base.joinOperatorExpr("AND", fragments),
 				postfix=limits), pars)
 
@@ -435,6 +440,91 @@ class UWS(object):
 		raise NotImplementedError("Incomplete UWS (getURLForId not overridden).")
 
 
+class QueueScheduler(object):
+	"""The policy deciding which QUEUED jobs a UWSWithQueueing starts.
+
+	This default scheduler starts the jobs with the earliest destructionTime
+	first.  That's, of course, completely ad-hoc.
+
+	Schedulers are passed lists of rows (dictionaries) from the jobs table
+	for the QUEUED and the EXECUTING jobs.  These have the keys jobId,
+	submitter, costEstimate, destructionTime, and creationTime.
+
+	To define a new policy, override getStartOrder and add the class
+	to UWSWithQueueing.schedulers so it can be selected through
+	[async]queuePolicy.  If the policy needs cost estimates, set usesCost;
+	the UWS then fills the costEstimate column of queued jobs using its
+	estimateJobCost method before asking the scheduler.
+	"""
+	usesCost = False
+
+	def getStartOrder(self, queued, running, ignoreCaps=False):
+		"""returns the ids of the queued jobs in the sequence they should
+		be started in.
+
+		Jobs that must not be started right now (e.g., because their
+		submitter has too many jobs running) are left out unless ignoreCaps
+		is true; use that to estimate when a job will run.
+		"""
+		return [row["jobId"] for row in
+			sorted(queued, key=lambda row: row["destructionTime"])]
+
+
+class FairShareScheduler(QueueScheduler):
+	"""A scheduler sharing the running jobs between submitters.
+
+	A submitter is the authenticated owner of the job or, for anonymous
+	jobs, the host the job was created from.  The next job is taken from
+	the submitter with the fewest jobs running (or scheduled before).  
+	Among a submitter's jobs, those with a smaller estimated cost go first,
+	where costs only are compared by their order of magnitude; the creation 
+	time decides between jobs of comparable cost.
+
+	If maxPerSubmitter is non-zero, no submitter gets more than that
+	many jobs running at a time.
+	"""
+	usesCost = True
+	# the cost assumed for jobs we have no estimate for
+	defaultCost = 1e4
+
+	def __init__(self, maxPerSubmitter=0):
+		self.maxPerSubmitter = maxPerSubmitter
+
+	def _getJobKey(self, row):
+		cost = row["costEstimate"]
+		if cost is None:
+			cost = self.defaultCost
+		return (int(math.log10(max(cost, 1))), row["creationTime"])
+
+	def getStartOrder(self, queued, running, ignoreCaps=False):
+		runningCount = collections.defaultdict(int)
+		for row in running:
+			runningCount[row["submitter"]] += 1
+
+		pending = collections.defaultdict(list)
+		for row in queued:
+			pending[row["submitter"]].append(row)
+		for rows in pending.values():
+			# we pop the next job from the end
+			rows.sort(key=self._getJobKey, reverse=True)
+
+		order = []
+		while pending:
+			submitter = min(pending, key=lambda s: 
+				(runningCount[s], self._getJobKey(pending[s][-1])))
+			if (not ignoreCaps 
+					and self.maxPerSubmitter
+					and runningCount[submitter]>=self.maxPerSubmitter):
+				del pending[submitter]
+				continue
+
+			order.append(pending[submitter].pop()["jobId"])
+			runningCount[submitter] += 1
+			if not pending[submitter]:
+				del pending[submitter]
+		return order
+
+
 class UWSWithQueueing(UWS):
 	"""A UWS with support for queuing.
 
@@ -449,11 +539,21 @@ class UWSWithQueueing(UWS):
 	_processQueueDirty = False
 	# How many jobs will the UWS (try to) run at the same time?
 	runcountGoal = 1
+	# the queue policies operators can choose from in [async]queuePolicy
+	schedulers = {
+		"destruction": QueueScheduler,
+		"fairshare": lambda: FairShareScheduler(
+			base.getConfig("async", "maxRunningPerSubmitter")),
+	}
 
 	def __init__(self, jobClass, actions):
 		# processQueue shouldn't strictly need a lock.  The lock mainly
 		# protects against running more unqueuers than necessary
 		self._processQueueLock = threading.Lock()
+		# ids of queued jobs we have already tried to estimate
+		self._costsTried = set()
+		self.scheduler = self.schedulers[
+			base.getConfig("async", "queuePolicy")]()
 		UWS.__init__(self, jobClass, actions)
 
 	def _makeMoreStatements(self, statements, jobsTable):
@@ -469,10 +569,13 @@ class UWSWithQueueing(UWS):
 			"phase='QUEUED' and destructionTime<=%(dt)s",
 			{"dt": None})
 
-		statements["getIdsScheduledNext"] = jobsTable.getQuery(
-			[jobsTable.tableDef.getColumnByName("jobId")],
-			"phase='QUEUED'",
-			limits=('ORDER BY destructionTime ASC', {}))
+		schedulingColumns = [td.getColumnByName(name) for name in 
+			["jobId", "submitter", "costEstimate", 
+				"destructionTime", "creationTime"]]
+		statements["getQueuedForScheduling"] = jobsTable.getQuery(
+			schedulingColumns, "phase='QUEUED'")
+		statements["getRunningForScheduling"] = jobsTable.getQuery(
+			schedulingColumns, "phase='EXECUTING'")
 
 		statements["getHungCandidates"] = jobsTable.getQuery([
 			td.getColumnByName("jobId"),
@@ -499,14 +602,71 @@ class UWSWithQueueing(UWS):
 			self._processQueueDirty = False
 			self._processQueue()
 
+	def _getSchedulingRows(self, conn):
+		"""returns the rows of the queued and the running jobs
+		as expected by QueueScheduler.
+		"""
+		return (self.runCanned("getQueuedForScheduling", {}, conn),
+			self.runCanned("getRunningForScheduling", {}, conn))
+
+	def estimateJobCost(self, jobId):
+		"""returns an estimate for the cost of running the job jobId, or None.
+
+		This is called by the queue processing for queued jobs without a cost
+		estimate if the scheduler uses costs.  No job is locked while this
+		runs.  This default implementation always returns None; UWSes 
+		that can estimate costs override it.
+		"""
+		return None
+
+	def _fillCostEstimates(self, queued):
+		"""obtains cost estimates for the rows in queued that do not have
+		one yet.
+
+		Each job is only estimated once; when the estimate fails, its
+		costEstimate stays NULL.
+		"""
+		self._costsTried &= set(row["jobId"] for row in queued)
+		for row in queued:
+			if (row["costEstimate"] is not None 
+					or row["jobId"] in self._costsTried):
+				continue
+			self._costsTried.add(row["jobId"])
+
+			cost = self.estimateJobCost(row["jobId"])
+			if cost is not None:
+				row["costEstimate"] = cost
+				with self.changeableJob(row["jobId"]) as wjob:
+					wjob.change(costEstimate=cost)
+
+	def getStartOrder(self):
+		"""returns the ids of the queued jobs in the sequence the scheduler
+		will start them in.
+
+		Per-submitter caps are ignored here, so all queued jobs are returned.
+		"""
+		with base.getTableConn() as conn:
+			queued, running = self._getSchedulingRows(conn)
+		return self.scheduler.getStartOrder(queued, running, ignoreCaps=True)
+
+	def getQueuePosition(self, jobId):
+		"""returns the number of jobs the scheduler will start before jobId.
+
+		This will return None if jobId is not queued.
+		"""
+		try:
+			return self.getStartOrder().index(jobId)
+		except ValueError:
+			return None
+
 	def _processQueue(self):
 		"""tries to take jobs from the queue.
 
 		This function is called from checkProcessQueue when we think
 		from EXECUTING so somewhere else.
 
-		Currently, the jobs with the earliest destructionTime are processed
-		first.  That's, of course, completely ad-hoc.
+		Which jobs are started in which order is up to self.scheduler
+		(see QueueScheduler).
 		"""
 		if not self._processQueueLock.acquire(False):
 			# There's already an unqueuer running, don't need a second one
@@ -521,8 +681,10 @@ class UWSWithQueueing(UWS):
 				try:
 					started = 0
 					with base.getTableConn() as conn:
-						toStart = [row["jobId"] for row in
-							self.runCanned('getIdsScheduledNext', {}, conn)]
+						queued, running = self._getSchedulingRows(conn)
+					if self.scheduler.usesCost:
+						self._fillCostEstimates(queued)
+					toStart = self.scheduler.getStartOrder(queued, running)
 
 					while toStart:
 						if self.countRunningJobs()>=self.runcountGoal:
@@ -1421,15 +1583,23 @@ class _UWSBackendProtocol(protocol.ProcessProtocol):
 	def processEnded(self, statusObject):
 		"""tries to ensure the job is in an admitted end state.
 		"""
-		try:
-			job = self.workerSystem.getJob(self.jobId)
-			if job.phase==QUEUED or job.phase==EXECUTING:
-				try:
-					raise UWSError("Job hung in %s"%job.phase, job.jobId)
-				except UWSError, ex:
-					self.workerSystem.changeToPhase(self.jobId, ERROR, ex)
-		except JobNotFound: # job already deleted
-			pass
+		ensureJobFinished(self.workerSystem, self.jobId)
+
+
+def ensureJobFinished(workerSystem, jobId):
+	"""pushes the job jobId to ERROR if it is still QUEUED or EXECUTING.
+
+	This is for when the process executing jobId has exited.
+	"""
+	try:
+		job = workerSystem.getJob(jobId)
+		if job.phase==QUEUED or job.phase==EXECUTING:
+			try:
+				raise UWSError("Job hung in %s"%job.phase, job.jobId)
+			except UWSError, ex:
+				workerSystem.changeToPhase(jobId, ERROR, ex)
+	except JobNotFound: # job already deleted
+		pass
 
 
 class ProcessBasedUWSTransitions(SimpleUWSTransitions):
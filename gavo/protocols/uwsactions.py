@@ -118,8 +118,10 @@ class UWS(object):
 		_additionalPrefixes = frozenset(["xlink"])
 		_a_id = None
 		_a_href = None
+		_a_title = None
 		_a_type = None
 		_name_a_href = "xlink:href"
+		_name_a_title = "xlink:title"
 		_name_a_type = "xlink:type"
 
 	class parameter(UWSElement):
@@ -141,17 +143,42 @@ class UWS(object):
 		_mayBeEmpty = True
 
 
+def _getSchedulingTitle(queuePosition, costEstimate):
+	"""returns a human-readable note on a job's place in the queue and
+	its estimated cost, or None if we know neither.
+
+	UWS does not let us add elements to jobrefs, so this goes into their 
+	xlink:title.
+	"""
+	parts = []
+	if queuePosition is not None:
+		parts.append("queue position %d"%(queuePosition+1))
+	if costEstimate is not None:
+		parts.append("estimated cost %.3g"%costEstimate)
+	return ", ".join(parts) or None
+
+
 def getJobList(workerSystem, 
 		forOwner=None, 
 		phase=None, 
 		last=None, 
 		after=None):
 	result = UWS.jobs()
-	for jobId, phase in workerSystem.getIdsAndPhases(
-			forOwner, phase, last, after):
+	queuePositions = {}
+	if hasattr(workerSystem, "getStartOrder"):
+		queuePositions = dict((jobId, index) 
+			for index, jobId in enumerate(workerSystem.getStartOrder()))
+
+	for jobId, phase, owner, creationTime, costEstimate in \
+			workerSystem.getIdsAndPhases(forOwner, phase, last, after, 
+				columns=("jobId", "phase", "owner", "creationTime", "costEstimate")):
 		result[
-			UWS.jobref(id=jobId, href=workerSystem.getURLForId(jobId))[
-				UWS.phase[phase]]]
+			UWS.jobref(id=jobId, href=workerSystem.getURLForId(jobId),
+					title=_getSchedulingTitle(
+						queuePositions.get(jobId), costEstimate))[
+				UWS.phase[phase],
+				UWS.ownerId[owner],
+				creationTime and UWS.creationTime[utils.formatISODT(creationTime)]]]
 	return stanxml.xmlrender(result, workerSystem.joblistPreamble)
 
 
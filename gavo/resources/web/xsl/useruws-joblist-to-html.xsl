@@ -2,6 +2,7 @@
 
 <xsl:stylesheet
     xmlns:uws="http://www.ivoa.net/xml/UWS/v1.0"
+    xmlns:xlink="http://www.w3.org/1999/xlink"
     xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
 		xmlns="http://www.w3.org/1999/xhtml"
     version="1.0">
@@ -19,7 +20,19 @@
 					</xsl:attribute>
 					<xsl:value-of select="@id"/>
 				</a>
-				(<xsl:apply-templates/>)</li>
+				(<xsl:apply-templates/><xsl:if test="@xlink:title">
+					<xsl:text>; </xsl:text><xsl:value-of select="@xlink:title"/>
+				</xsl:if>)</li>
+		</xsl:template>
+
+		<xsl:template match="uws:ownerId[text()]">
+			<xsl:text>, owner </xsl:text><xsl:value-of select="."/>
+		</xsl:template>
+
+		<xsl:template match="uws:ownerId"/>
+
+		<xsl:template match="uws:creationTime">
+			<xsl:text>, created </xsl:text><xsl:value-of select="."/>
 		</xsl:template>
 	
 		<xsl:template match="/">
@@ -19,4 +19,4 @@ from gavo.rsc.data import (Data, makeData, wrapTable, makeDependentsFor,
 	makeCombinedData)
 from gavo.rsc.common import (getParseOptions, 
 	parseValidating, parseNonValidating)
-from gavo.rsc.metatable import MetaTableHandler
+from gavo.rsc.metatable import MetaTableHandler, notifyTablemetaChanged
@@ -133,7 +133,8 @@ class ParseOptions(object):
 def getParseOptions(validateRows=True, doTableUpdates=False,
 		batchSize=1024, maxRows=None, keepGoing=False, dropIndices=False,
 		dumpRows=False, metaOnly=False, buildDependencies=True,
-		systemImport=False, commitAfterMeta=False, dumpIngestees=False):
+		systemImport=False, commitAfterMeta=False, dumpIngestees=False,
+		parallel=None, bulkCopy=False):
 	"""returns an object with some attributes set.
 
 	This object is used in the parsing code in dddef.  It's a standin
@@ -150,6 +151,10 @@ def getParseOptions(validateRows=True, doTableUpdates=False,
 	builds of data (and thus here), but false when we need to manually
 	control when dependencies are built, as in user.importing and
 	while building the dependencies themselves.
+
+	parallel, if given, is the number of worker processes that parse
+	sources and run the rowmakers (see rsc.data.makeData).  bulkCopy
+	makes DB tables be fed using COPY where possible.
 	"""
 	po = ParseOptions()
 	po.validateRows = validateRows
@@ -164,6 +169,8 @@ def getParseOptions(validateRows=True, doTableUpdates=False,
 	po.buildDependencies = buildDependencies
 	po.commitAfterMeta = commitAfterMeta
 	po.dumpIngestees = dumpIngestees
+	po.parallel = parallel
+	po.bulkCopy = bulkCopy
 	return po
 
 
@@ -8,7 +8,9 @@ Making data out of descriptors and sources.
 #c COPYING file in the source distribution.
 
 
+import cPickle as pickle
 import itertools
+import multiprocessing
 import operator
 import sys
 
@@ -36,10 +38,15 @@ class _DataFeeder(table._Feeder):
 
 	If you pass in a connection, the data feeder will manage it (i.e.
 	commit if all went well, rollback otherwise).
+
+	With bulkCopy, all on-disk tables are fed using COPY where possible;
+	otherwise, this is controlled by the bulkCopy attribute of the makes.
 	"""
 	def __init__(self, data, batchSize=1024, dispatched=False,
-			runCommit=True, connection=None, dumpIngestees=False):
+			runCommit=True, connection=None, dumpIngestees=False,
+			bulkCopy=False):
 		self.data, self.batchSize = data, batchSize
+		self.bulkCopy = bulkCopy
 		self.runCommit = runCommit
 		self.nAffected = 0
 		self.connection = connection
@@ -52,6 +59,30 @@ class _DataFeeder(table._Feeder):
 		addersDict, parAddersDict, self.feeders = self._getAdders()
 		self.add, self.addParameters = makeAdders(addersDict, parAddersDict)
 
+	def _makeChunkAdder(self, feeder, makeRow, batchMakeRows, table):
+		"""returns a function adding rscdef.ColumnChunks to feeder.
+
+		If batchMakeRows is None, the chunk is run through makeRow row
+		by row.
+		"""
+		def addChunk(chunk):
+			if batchMakeRows is None:
+				procRows = []
+				for srcRow in chunk.iterRows():
+					try:
+						procRows.append(makeRow(srcRow, table))
+					except rscdef.IgnoreThisRow:
+						pass
+			else:
+				procRows = batchMakeRows(chunk, table)
+
+			if self.dumpIngestees:
+				for procRow in procRows:
+					print "PROCESSED ROW:", procRow
+			feeder.addChunk(procRows)
+
+		return addChunk
+
 	def _getAdders(self):
 		"""returns a triple of (rowAdders, parAdders, feeds) for the data we
 		feed to.
@@ -60,11 +91,19 @@ class _DataFeeder(table._Feeder):
 		parAdders the same for parameters returned by the grammar, and
 		feeds is a list containing all feeds the adders add to (this
 		is necessary to let us exit all of them.
+
+		As a side effect, this sets the chunkAdders attribute to a list
+		of functions adding rscdef.ColumnChunks to the tables fed from
+		rows, and vectorised to true if any of them has a batch rowmaker.
 		"""
 		adders, parAdders, feeders = {}, {}, []
+		self.chunkAdders, self.vectorised = [], False
 		for make in self.data.dd.makes:
 			table = self.data.tables[make.table.id]
-			feeder = table.getFeeder(batchSize=self.batchSize)
+			feederArgs = {"batchSize": self.batchSize}
+			if table.tableDef.onDisk and (make.bulkCopy or self.bulkCopy):
+				feederArgs["bulkCopy"] = True
+			feeder = table.getFeeder(**feederArgs)
 			makeRow = make.rowmaker.compileForTableDef(table.tableDef)
 
 			def addRow(srcRow, feeder=feeder, makeRow=makeRow, table=table):
@@ -80,6 +119,11 @@ class _DataFeeder(table._Feeder):
 				parAdders.setdefault(make.role, []).append(addRow)
 			else:
 				adders.setdefault(make.role, []).append(addRow)
+				batchMakeRows = make.rowmaker.compileBatchForTableDef(
+					table.tableDef)
+				self.vectorised = self.vectorised or batchMakeRows is not None
+				self.chunkAdders.append(self._makeChunkAdder(
+					feeder, makeRow, batchMakeRows, table))
 
 			if make.parmaker:
 				parAdders.setdefault(make.role, []).append(
@@ -122,6 +166,23 @@ class _DataFeeder(table._Feeder):
 
 		return add, addParameters
 
+	def addChunk(self, chunk):
+		"""adds an rscdef.ColumnChunk from a non-dispatching grammar.
+		"""
+		for addChunk in self.chunkAdders:
+			addChunk(chunk)
+
+	def addProcessed(self, makeIndex, procRow):
+		"""adds a row that has already been through the rowmaker of the
+		makeIndex-th make of our data descriptor.
+
+		This is used when the rowmakers run elsewhere (e.g., in the worker
+		processes of a parallel import).
+		"""
+		if self.dumpIngestees:
+			print "PROCESSED ROW:", procRow
+		self.feeders[makeIndex].add(procRow)
+
 	def flush(self):
 		for feeder in self.feeders:
 			feeder.flush()
@@ -139,6 +200,7 @@ class _DataFeeder(table._Feeder):
 		del self.feeders
 		del self.add
 		del self.addParameters
+		del self.chunkAdders
 
 	def _exitFailing(self, *excInfo):
 		"""calls all subordinate exit methods when there was an error in
@@ -349,6 +411,43 @@ def _pipeRows(srcIter, feeder, opts):
 				raise _EnoughRows
 
 
+def _pipeChunks(srcIter, feeder, opts):
+	"""is like _pipeRows, except it feeds whole ColumnChunks from srcIter.
+
+	This is used when the row iterator and the feeder can both deal
+	with chunks; see _canPipeChunks.
+	"""
+	pars = srcIter.getParameters()
+	if opts.dumpIngestees:
+		print "PROCESSED PARAMS:", pars
+	feeder.addParameters(pars)
+
+	for chunk in srcIter.iterChunks():
+		if opts.maxRows:
+			if base.ui.totalRead>=opts.maxRows:
+				raise _EnoughRows
+			chunk = chunk.getHead(opts.maxRows-base.ui.totalRead)
+
+		if srcIter.notify:
+			base.ui.notifyIncomingChunk(chunk)
+		if opts.dumpRows:
+			for srcRow in chunk.iterRows():
+				print srcRow
+
+		feeder.addChunk(chunk)
+		if opts.maxRows:
+			if base.ui.totalRead>=opts.maxRows:
+				raise _EnoughRows
+
+
+def _canPipeChunks(srcIter, feeder):
+	"""returns true if we should use _pipeChunks rather than _pipeRows.
+	"""
+	return (getattr(feeder, "vectorised", False)
+		and hasattr(srcIter, "canChunk")
+		and srcIter.canChunk())
+
+
 def _processSourceReal(data, source, feeder, opts):
 	"""helps processSource.
 	"""
@@ -359,7 +458,10 @@ def _processSourceReal(data, source, feeder, opts):
 	srcIter = data.dd.grammar.parse(source, data)
 	if hasattr(srcIter, "getParameters"):  # is a "normal" grammar
 		try:
-			_pipeRows(srcIter, feeder, opts)
+			if _canPipeChunks(srcIter, feeder):
+				_pipeChunks(srcIter, feeder, opts)
+			else:
+				_pipeRows(srcIter, feeder, opts)
 		except (base.Error,base.ExecutiveAction):
 			raise
 		except Exception, msg:
@@ -372,19 +474,61 @@ def _processSourceReal(data, source, feeder, opts):
 	data.runScripts("sourceDone", sourceToken=source)
 
 
-def processSource(data, source, feeder, opts, connection=None):
+def _feedParsedSource(data, source, parsed, feeder, opts):
+	"""feeds the result of _parseInWorker for source to feeder.
+
+	This is processSource's equivalent of _processSourceReal for parallel
+	imports; the newSource and sourceDone scripts are run here, i.e., in
+	the parent process, bracketing the ingestion of the source's rows.
+	"""
+	data.runScripts("newSource", sourceToken=source)
+	if parsed.error:
+		raise parsed.error
+
+	if opts.dumpIngestees:
+		print "PROCESSED PARAMS:", parsed.pars
+	feeder.addParameters(parsed.pars)
+
+	for procRows in parsed.rows:
+		if procRows is None:
+			feeder.flush()
+			continue
+
+		if parsed.notify:
+			base.ui.notifyIncomingRow(procRows)
+		for makeIndex, procRow in procRows:
+			feeder.addProcessed(makeIndex, procRow)
+		if opts.maxRows:
+			if base.ui.totalRead>=opts.maxRows:
+				raise _EnoughRows
+
+	data.runScripts("sourceDone", sourceToken=source)
+
+
+def processSource(data, source, feeder, opts, connection=None, 
+		parsed=None):
 	"""ingests source into the Data instance data.
 
 	If this builds database tables, you must pass in a connection object.
 
+	If parsed is given, it must be a _ParsedSource instance for source
+	as returned from a worker of a parallel import; the grammar and
+	the rowmakers are then not run again.
+
 	If opts.keepGoing is True,the system will continue importing 
 	even if a particular source has caused an error.  In that case, 
 	everything contributed by the bad source is rolled back (this will
 	only work when filling database tables).
 	"""
+	if parsed is None:
+		processor = _processSourceReal
+	else:
+		processor = lambda data, source, feeder, opts: _feedParsedSource(
+			data, source, parsed, feeder, opts)
+
 	if not opts.keepGoing:
 		# simple shortcut if we don't want to recover from bad sources
-		_processSourceReal(data, source, feeder, opts)
+		processor(data, source, feeder, opts)
 	
 	else: # recover from bad sources, be more careful
 		if connection is None:
@@ -395,7 +539,7 @@ def processSource(data, source, feeder, opts, connection=None):
 				" table has onDisk='True'.")
 		try:
 			with connection.savepoint():
-				_processSourceReal(data, source, feeder, opts)
+				processor(data, source, feeder, opts)
 				feeder.flush()
 		except Exception, ex:
 			feeder.reset()
@@ -407,6 +551,167 @@ def processSource(data, source, feeder, opts, connection=None):
 						utils.safe_str(ex)))
 
 
+class _ParsedSource(object):
+	"""the rows and parameters a worker of a parallel import has made
+	from a source.
+
+	rows has one entry per row the grammar yielded, a list of pairs 
+	(makeIndex, processed row), where makeIndex is the index of the make 
+	within the data descriptor the row is for; None entries in rows mean 
+	the grammar asked for a flush.  notify is the grammar's notify flag,
+	i.e., whether rows should be announced to base.ui.
+
+	If the worker failed, error contains the exception, and rows is empty.
+
+	These are pickled on their way back from the workers.
+	"""
+	def __init__(self):
+		self.rows, self.pars, self.notify = [], {}, True
+		self.error = None
+
+
+# the state of the worker processes of a parallel import; since we fork,
+# this is set up by _processSourcesParallel before creating the pool and
+# then inherited by the workers.
+_workerState = None
+
+
+def _getRowMakersForWorker(data):
+	"""returns a dictionary mapping roles to lists of 
+	(makeIndex, makeRow, destTable) triples for data's row-sourced makes.
+	"""
+	makers = {}
+	for makeIndex, make in enumerate(data.dd.makes):
+		if make.rowSource=="parameters":
+			continue
+		destTable = data.tables[make.table.id]
+		makers.setdefault(make.role, []).append((makeIndex,
+			make.rowmaker.compileForTableDef(destTable.tableDef), destTable))
+	return makers
+
+
+def _parseInWorker(source):
+	"""returns a _ParsedSource for source.
+
+	This runs within the worker processes of a parallel import and
+	uses the data and options from _workerState.
+	"""
+	data, opts, makers = _workerState
+	allMakers = reduce(operator.add, makers.values(), [])
+	dispatched = data.dd.grammar.isDispatching
+	res = _ParsedSource()
+	srcIter = None
+	nRead = 0
+
+	try:
+		srcIter = data.dd.grammar.parse(source, data)
+		res.notify = srcIter.notify
+		res.pars = srcIter.getParameters()
+		for srcRow in srcIter:
+			if srcRow is common.FLUSH:
+				res.rows.append(None)
+				continue
+			if opts.dumpRows:
+				print srcRow
+
+			if dispatched:
+				role, srcRow = srcRow
+				if role not in makers:
+					raise base.ReportableError("Grammar tries to feed to role '%s',"
+						" but there is no corresponding make"%role)
+				curMakers = makers[role]
+			else:
+				curMakers = allMakers
+
+			procRows = []
+			for makeIndex, makeRow, destTable in curMakers:
+				try:
+					procRows.append((makeIndex, makeRow(srcRow, destTable)))
+				except rscdef.IgnoreThisRow:
+					pass
+			res.rows.append(procRows)
+
+			# the parent won't take more than maxRows from a single source
+			nRead += 1
+			if opts.maxRows and nRead>=opts.maxRows:
+				break
+
+	except (base.Error, base.ExecutiveAction), ex:
+		res.error = ex
+	except Exception, ex:
+		res.error = _makeWorkerParseError(utils.safe_str(ex), source, srcIter)
+
+	if res.error is not None:
+		res.rows = []
+		try:
+			pickle.dumps(res.error, pickle.HIGHEST_PROTOCOL)
+		except Exception:
+			# the exception won't make it to the parent; send a message
+			# at least.
+			res.error = _makeWorkerParseError(
+				utils.safe_str(res.error) or res.error.__class__.__name__, 
+				source, srcIter)
+
+	return res
+
+
+def _makeWorkerParseError(msg, source, srcIter):
+	"""returns a SourceParseError for msg as _processSourceReal would
+	raise it.
+	"""
+	location = "unspecified location"
+	if srcIter is not None:
+		location = srcIter.getLocator()
+	return base.SourceParseError(msg,
+		source=utils.makeLeftEllipsis(repr(source), 80),
+		location=location)
+
+
+def _canParseInWorkers(data):
+	"""returns None if data can be parsed by _parseInWorker, a reason
+	why not otherwise.
+	"""
+	if data.dd.grammar is None:
+		return "data has no grammar"
+	if not hasattr(data.dd.grammar, "rowIterator"):
+		return "grammar does its own ingestion"
+	return None
+
+
+def _processSourcesParallel(data, sources, feeder, opts, connection):
+	"""parses sources in a pool of opts.parallel processes and feeds the 
+	results into feeder.
+
+	The workers run the grammar and the rowmakers; everything that touches
+	the database (including the newSource and sourceDone scripts and
+	the parmakers) happens in this process, in source order.  This means
+	that grammars and rowmakers used in parallel imports must not use the
+	database, and that newSource scripts cannot influence parsing.
+
+	Since the rows of an entire source are held in memory, this is
+	for many moderately sized sources rather than for a few huge ones.
+	"""
+	global _workerState
+	_workerState = (data, opts, _getRowMakersForWorker(data))
+	# the pool is fed from a separate thread, so we materialise sources
+	# (which might want the connection) here.
+	sources = list(sources)
+	pool = multiprocessing.Pool(opts.parallel)
+
+	try:
+		for source, parsed in itertools.izip(sources, 
+				pool.imap(_parseInWorker, sources)):
+			try:
+				processSource(data, source, feeder, opts, connection, parsed)
+			except base.SkipThis:
+				continue
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+		_workerState = None
+
+
 class _TableCornucopeia(object):
 	"""a scaffolding class instances of which return something (eventually 
 	table-like) for all keys it is asked for.
@@ -432,6 +737,10 @@ def makeData(dd, parseOptions=common.parseNonValidating,
 
 	You can pass in a data instance created by yourself in data.  This
 	makes sense if you want to, e.g., add some meta information up front.
+
+	If parseOptions.parallel is larger than one, the sources are parsed
+	in that many worker processes (see _processSourcesParallel for
+	the restrictions that entails).
 	"""
 	# Some proc setup does expensive things like actually building data.
 	# We don't want that when validating and return some empty data thing.
@@ -445,12 +754,28 @@ def makeData(dd, parseOptions=common.parseNonValidating,
 	res.recreateTables(connection)
 	
 	feederOpts = {"batchSize": parseOptions.batchSize, "runCommit": runCommit,
-		"dumpIngestees": parseOptions.dumpIngestees}
+		"dumpIngestees": parseOptions.dumpIngestees,
+		"bulkCopy": getattr(parseOptions, "bulkCopy", False)}
 	if dd.grammar and dd.grammar.isDispatching:
 		feederOpts["dispatched"] = True
 
+	parallel = getattr(parseOptions, "parallel", None)
+	if parallel and parallel>1 and forceSource is None:
+		whyNot = _canParseInWorkers(res)
+		if whyNot:
+			base.ui.notifyWarning("Not importing %s in parallel: %s"%(
+				dd.id, whyNot))
+			parallel = None
+
 	with res.getFeeder(connection=connection, **feederOpts) as feeder:
-		if forceSource is None:
+		if forceSource is None and parallel>1:
+			try:
+				_processSourcesParallel(res, dd.iterSources(connection), 
+					feeder, parseOptions, connection)
+			except _EnoughRows:
+				base.ui.notifyWarning("Source hit import limit, import aborted.")
+
+		elif forceSource is None:
 			for source in dd.iterSources(connection):
 				try:
 					processSource(res, source, feeder, parseOptions, connection)
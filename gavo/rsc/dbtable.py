@@ -10,13 +10,18 @@ Tables on disk
 
 from __future__ import with_statement
 
+import cStringIO
+import struct
 import sys
 
+import numpy
+
 from gavo import base
 from gavo import rscdef
 from gavo import utils
 from gavo.base import sqlsupport
 from gavo.rsc import common
+from gavo.rsc import metatable
 from gavo.rsc import table
 
 
@@ -74,6 +79,34 @@ class _Feeder(table._Feeder):
 		if len(self.batchCache)>=self.batchSize:
 			self.shipout()
 
+	def _iterValid(self, rows):
+		"""iterates over the rows that pass validation if the table
+		validates rows, over all rows otherwise.
+		"""
+		if not self.table.validateRows:
+			for row in rows:
+				yield row
+			return
+
+		validateRow = self.table.tableDef.validateRow
+		for row in rows:
+			try:
+				validateRow(row)
+			except rscdef.IgnoreThisRow:
+				continue
+			yield row
+
+	def addChunk(self, rows):
+		"""adds a sequence of rows.
+
+		The rows are shipped out with the current batch once it
+		contains at least batchSize rows.
+		"""
+		self._assertActive()
+		self.batchCache.extend(self._iterValid(rows))
+		if len(self.batchCache)>=self.batchSize:
+			self.shipout()
+
 	def flush(self):
 		self._assertActive()
 		self.shipout()
@@ -110,6 +143,161 @@ class _Feeder(table._Feeder):
 		return self.nAffected
 
 
+class _CopyFeeder(_Feeder):
+	"""A feeder shipping rows to the database using binary COPY.
+
+	This is much faster than the INSERT-based _Feeder for large batches,
+	but it only works if all columns of the table have types that
+	base.sqltypeToPgBinary can handle, and it bypasses any rules on the
+	table.  Use the table's getFeeder(bulkCopy=True) to get one when
+	possible.
+
+	Rows are serialised as they come in (after validation); a batch
+	is then shipped through the table's copyIn method.
+
+	For tables with only numeric columns, whole columns in numpy arrays
+	can be fed through addColumns; they are then serialised without
+	looking at individual rows.
+	"""
+	copyHeader = "PGCOPY\n\377\r\n\0"+struct.pack("!ii", 0, 0)
+	copyTrailer = struct.pack("!h", -1)
+
+	# numpy types of the binary COPY representation of the SQL types
+	# addColumns can serialise.
+	arrayTypes = {
+		"smallint": ">i2",
+		"integer": ">i4",
+		"bigint": ">i8",
+		"real": ">f4",
+		"double precision": ">f8",
+	}
+
+	def __init__(self, parent, batchSize=2000, notify=True):
+		_Feeder.__init__(self, parent, None, batchSize, notify)
+		self.encodeRow = self._makeRowEncoder(parent.tableDef)
+		# the number of rows in batchCache (which may contain blocks of rows)
+		self.rowsCached = 0
+
+	@classmethod
+	def canAddColumns(cls, tableDef):
+		"""returns true if addColumns can be used to feed tableDef.
+		"""
+		return all(col.type in cls.arrayTypes for col in tableDef)
+
+	def _getTupleType(self):
+		"""returns a numpy dtype for binary COPY tuples of our table without 
+		NULLs.
+		"""
+		dtype = [("nFields", ">i2")]
+		for index, col in enumerate(self.table.tableDef):
+			dtype.extend([
+				("len%d"%index, ">i4"),
+				("val%d"%index, self.arrayTypes[col.type])])
+		return numpy.dtype(dtype)
+
+	@staticmethod
+	def _makeRowEncoder(tableDef):
+		"""returns a function turning a row dict into a binary COPY tuple
+		for tableDef.
+
+		This raises a ConversionError if a column type cannot be serialised.
+		"""
+		packers = [(col.key, base.sqltypeToPgBinary(col.type))
+			for col in tableDef]
+		tupleHeader = struct.pack("!h", len(packers))
+		nullField = struct.pack("!i", -1)
+		packLength = struct.Struct("!i").pack
+
+		def encodeRow(row):
+			parts = [tupleHeader]
+			for key, pack in packers:
+				val = row[key]
+				if val is None:
+					parts.append(nullField)
+				else:
+					packed = pack(val)
+					parts.append(packLength(len(packed)))
+					parts.append(packed)
+			return "".join(parts)
+
+		return encodeRow
+
+	def shipout(self):
+		if self.batchCache:
+			buf = cStringIO.StringIO()
+			buf.write(self.copyHeader)
+			for encoded in self.batchCache:
+				buf.write(encoded)
+			buf.write(self.copyTrailer)
+			buf.seek(0)
+
+			try:
+				self.table.copyIn(buf)
+			except sqlsupport.IntegrityError:
+				base.ui.notifyInfo("One or more of the %d rows in this batch"
+					" clashed."%self.rowsCached)
+				raise
+			except sqlsupport.DataError:
+				base.ui.notifyInfo("Bad input.  Run without bulk copy to pin"
+					" down offending record.")
+				raise
+
+			self.nAffected += self.rowsCached
+			if self.notify:
+				base.ui.notifyShipout(self.rowsCached)
+			self.batchCache, self.rowsCached = [], 0
+
+	def add(self, data):
+		self._assertActive()
+		if self.table.validateRows:
+			try:
+				self.table.tableDef.validateRow(data)
+			except rscdef.IgnoreThisRow:
+				return
+		self.batchCache.append(self.encodeRow(data))
+		self.rowsCached += 1
+		if self.rowsCached>=self.batchSize:
+			self.shipout()
+
+	def addChunk(self, rows):
+		self._assertActive()
+		encodeRow = self.encodeRow
+		oldLength = len(self.batchCache)
+		self.batchCache.extend(encodeRow(row) for row in self._iterValid(rows))
+		self.rowsCached += len(self.batchCache)-oldLength
+		if self.rowsCached>=self.batchSize:
+			self.shipout()
+
+	def addColumns(self, columns):
+		"""adds rows given as numpy arrays, one per table column in the
+		sequence of the table definition.
+
+		This only works if canAddColumns(tableDef) is true.  The arrays
+		must not contain NULLs, as there is no way to represent them here
+		(NaNs end up as NaNs in the database); use add or addChunk for rows 
+		with NULLs.  Rows added through this method are not validated.
+		"""
+		self._assertActive()
+		if not columns or not len(columns[0]):
+			return
+
+		tuples = numpy.empty(len(columns[0]), dtype=self._getTupleType())
+		tuples["nFields"] = len(columns)
+		for index, column in enumerate(columns):
+			valField = "val%d"%index
+			tuples["len%d"%index] = tuples.dtype[valField].itemsize
+			tuples[valField] = column
+
+		self.batchCache.append(tuples.tostring())
+		self.rowsCached += len(tuples)
+		if self.rowsCached>=self.batchSize:
+			self.shipout()
+
+	def reset(self):
+		_Feeder.reset(self)
+		self.rowsCached = 0
+
+
 class _RaisingFeeder(_Feeder):
 	"""is a feeder that will bomb on any attempt to feed data to it.
 
@@ -118,6 +306,8 @@ class _RaisingFeeder(_Feeder):
 	def add(self, data):
 		raise base.DataError("Attempt to feed to a read-only table")
 
+	addChunk = add
+
 
 class MetaTableMixin(object):
 	"""is a mixin providing methods updating the dc_tables.
@@ -152,6 +342,7 @@ class MetaTableMixin(object):
 
 	def cleanFromMeta(self):
 		self._cleanFromSourceTable()
+		metatable.notifyTablemetaChanged(self.connection)
 
 
 class DBMethodsMixin(sqlsupport.QuerierMixin):
@@ -390,9 +581,37 @@ class DBTable(DBMethodsMixin, table.BaseTable, MetaTableMixin):
 	def exists(self):
 		return self.getTableType(self.tableDef.getQName()) is not None
 
+	def _canBulkCopy(self):
+		"""returns None if we can be fed through a _CopyFeeder, a
+		reason why not otherwise.
+		"""
+		if self.tableUpdates:
+			return "updating rows"
+		if self.tableDef.forceUnique and self.tableDef.dupePolicy!="dropOld":
+			return "COPY does not honour the rules enforcing the dupePolicy"
+		for col in self.tableDef:
+			try:
+				base.sqltypeToPgBinary(col.type)
+			except base.ConversionError:
+				return "cannot serialise column %s (type %s)"%(col.name, col.type)
+		return None
+
 	def getFeeder(self, **kwargs):
+		"""returns a feeder for this table.
+
+		If you pass bulkCopy=True, this will try to return a feeder
+		using binary COPY rather than INSERT statements; if that is
+		impossible, you will get a normal feeder (and a warning).
+		"""
 		if "notify" not in kwargs:
 			kwargs["notify"] = not self.tableDef.system or not self.tableDef.onDisk
+
+		if kwargs.pop("bulkCopy", False):
+			whyNot = self._canBulkCopy()
+			if whyNot is None:
+				return _CopyFeeder(self, **kwargs)
+			base.ui.notifyWarning("Not using COPY to feed %s: %s"%(
+				self.tableName, whyNot))
 		return _Feeder(self, self.addCommand, **kwargs)
 
 	def importFinished(self):
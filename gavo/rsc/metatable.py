@@ -13,18 +13,38 @@ and have the table->RD mapping stowed somewhere else.
 
 
 import functools
+import threading
 
 from gavo import base
 
 
+# the postgres notification channel telling MetaTableHandlers that
+# dc.tablemeta has changed.
+TABLEMETA_CHANNEL = "dachs_tablemeta"
+
+
+def notifyTablemetaChanged(connection):
+	"""tells MetaTableHandlers in all processes that dc.tablemeta has
+	changed.
+
+	The notification is delivered when connection's transaction is
+	committed.  Call this whenever you change dc.tablemeta.
+	"""
+	connection.execute("NOTIFY "+TABLEMETA_CHANNEL)
+
+
 
 def _retryProtect(m):
 	"""decorates m such that any function call is retried after self.reset
 	is called.
+
+	NotFoundErrors are not retried, as they are regular answers.
 	"""
 	def f(self, *args, **kwargs):
 		try:
 			return m(self, *args, **kwargs)
+		except base.NotFoundError:
+			raise
 		except:
 			self.reset()
 			return m(self, *args, **kwargs)
@@ -42,14 +62,21 @@ class MetaTableHandler(object):
 
 	Though you can construct MetaTableHandlers of your own, you should
 	use base.caches.getMTH(None) when reading.
+
+	To save database roundtrips, we keep an index of dc.tablemeta in memory.
+	It is refreshed when someone sends a notification on TABLEMETA_CHANNEL
+	(see notifyTablemetaChanged).
 	"""
 	def __init__(self):
 		self.rd = base.caches.getRD("__system__/dc_tables")
+		self.indexLock = threading.Lock()
 		self._createObjects()
 
 	def _createObjects(self):
 		self.readerConnection = base.getDBConnection(
 			"trustedquery", autocommitted=True)
+		self.readerConnection.execute("LISTEN "+TABLEMETA_CHANNEL)
+		self.tableIndex = None
 
 	def close(self):
 		try:
@@ -62,6 +89,25 @@ class MetaTableHandler(object):
 		self.close()
 		self._createObjects()
 
+	def _getTableIndex(self):
+		"""returns a dictionary mapping lowercased qualified table names
+		to (sourcerd, tablename, adql) tuples for all tables in dc.tablemeta.
+
+		The index is reloaded if notifications have come in; checking
+		for them does not involve a roundtrip to the database.
+		"""
+		with self.indexLock:
+			self.readerConnection.poll()
+			if self.readerConnection.notifies:
+				del self.readerConnection.notifies[:]
+				self.tableIndex = None
+
+			if self.tableIndex is None:
+				self.tableIndex = dict((row[1].lower(), row)
+					for row in self.readerConnection.query(
+						"select sourcerd, tablename, adql from dc.tablemeta"))
+			return self.tableIndex
+
 	@_retryProtect
 	def getTableDefForTable(self, tableName):
 		"""returns a TableDef for tableName.
@@ -74,26 +120,22 @@ class MetaTableHandler(object):
 		if not "." in tableName:
 			tableName = "public."+tableName
 		
-		for row in self.readerConnection.queryToDicts(
-				"select sourcerd, tablename from dc.tablemeta where"
-				"  lower(tableName)=%(tableName)s",
-				{"tableName": tableName.lower()}):
-			break
-		else:
+		try:
+			sourceRD, qName, _ = self._getTableIndex()[tableName.lower()]
+		except KeyError:
 			raise base.ui.logOldExc(
 				base.NotFoundError(tableName, "table", "dc_tables"))
 
-		return base.caches.getRD(row["sourcerd"]
-			).getById(row["tablename"].split(".")[-1])
+		return base.caches.getRD(sourceRD).getById(qName.split(".")[-1])
 
 	@_retryProtect
 	def getTAPTables(self):
 		"""returns a list of all names of tables accessible through TAP in
 		this data center.
 		"""
-		return [r["tablename"] for r in
-			self.readerConnection.queryToDicts(
-				"select tablename from dc.tablemeta where adql")]
+		return [qName 
+			for _, qName, adql in self._getTableIndex().itervalues()
+			if adql]
 
 
 def _getMetaTable(ignored):
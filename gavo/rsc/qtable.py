@@ -27,6 +27,14 @@ class QueryTable(table.BaseTable, dbtable.DBMethodsMixin):
 	autoClose=True, it will close this connection after the data is
 	delivered.
 
+	If the query has parameters, pass them in a dictionary as pars.
+
+	If you pass matchLimit, at most that many rows are delivered.  The
+	query should then return at most matchLimit+1 rows (queryMeta.asSQL
+	produces such a limit), and when the result set is exhausted, the
+	table's _queryStatus meta is Overflowed if there was an extra row,
+	Ok otherwise.  Without a matchLimit, _queryStatus is always OVERFLOW.
+
 	This funky semantics is for the benefit of taprunner; it needs a
 	connection up front for uploads.
 
@@ -42,6 +50,7 @@ class QueryTable(table.BaseTable, dbtable.DBMethodsMixin):
 			raise base.ReportableError("QueryTables cannot be constructed"
 				" with rows.")
 		self.matchLimit = kwargs.pop("matchLimit", None)
+		self.pars = kwargs.pop("pars", None)
 		self.query = query
 		table.BaseTable.__init__(self, tableDef, connection=connection,
 			**kwargs)
@@ -64,32 +73,93 @@ class QueryTable(table.BaseTable, dbtable.DBMethodsMixin):
 		return cls(base.makeStruct(rscdef.TableDef, columns=columns),
 			query, connection=connection, **kwargs)
 
+	cursor = None
+
+	def execute(self):
+		"""sends the query to the database and fetches the first batch
+		of rows.
+
+		You do not need to call this, as iterating will execute the query
+		when necessary.  Calling it beforehand, however, lets errors in
+		query execution (most of them, anyway) surface before any output is
+		generated.
+		"""
+		if self.cursor is not None:
+			return
+		if self.connection is None:
+			raise base.ReportableError("QueryTable already exhausted.")
+
+		self.cursor = self.connection.cursor("cursor"+hex(id(self)))
+		self.cursor.execute(self.query, self.pars)
+		self._prefetched = self.cursor.fetchmany(1000)
+
+	def _iterDBTuples(self):
+		"""iterates over the tuples as returned from the database.
+
+		This takes care of setting _queryStatus and cleaning up after the
+		result set is exhausted.  Cleanup also happens when the consumer
+		stops iterating early (e.g., because a client has hung up) and the
+		iterator is closed or garbage collected.
+		"""
+		self.execute()
+		cursor, nextRows = self.cursor, self._prefetched
+		self._prefetched = None
+
+		try:
+			nRows, overflowed = 0, False
+			while nextRows:
+				if (self.matchLimit is not None 
+						and nRows+len(nextRows)>self.matchLimit):
+					nextRows = nextRows[:self.matchLimit-nRows]
+					overflowed = True
+				nRows += len(nextRows)
+				for row in nextRows:
+					yield row
+				if overflowed:
+					break
+				nextRows = cursor.fetchmany(1000)
+
+			if self.matchLimit is None:
+				# we cannot know; this is what taprunner has always had
+				self.setMeta("_queryStatus", "OVERFLOW")
+			elif overflowed:
+				self.setMeta("_queryStatus", "Overflowed")
+			else:
+				self.setMeta("_queryStatus", "Ok")
+		finally:
+			try:
+				cursor.close()
+			except base.DBError:
+				# connection already gone; nothing to clean up
+				pass
+			self.cleanup()
+
 	def __iter__(self):
 		"""actually runs the query and returns rows (dictionaries).
 
 		You can only iterate once.  At exhaustion, the connection will
 		be closed.
 		"""
-		if self.connection is None:
-			raise base.ReportableError("QueryTable already exhausted.")
-
-		nRows = 0
-		cursor = self.connection.cursor("cursor"+hex(id(self)))
-		cursor.execute(self.query)
-		while True:
-			nextRows = cursor.fetchmany(1000)
-			if not nextRows:
-				break
-			for row in nextRows:
-				nRows += 1
-				yield self.tableDef.makeRowFromTuple(row)
-		cursor.close()
-
-		if self.matchLimit and self.matchLimit==nRows:
-			self.setMeta("_queryStatus", "OVERFLOW")
+		makeRow = self.tableDef.makeRowFromTuple
+		for row in self._iterDBTuples():
+			yield makeRow(row)
+
+	def iterTuples(self):
+		"""actually runs the query and returns rows as tuples in the
+		sequence of the table definition's columns.
+
+		This is an alternative to iterating over the table for serialisers
+		that do not need row dictionaries; unless the table definition has
+		fixups, the tuples are what the database cursor returns.  As with
+		__iter__, you can only do this once.
+		"""
+		if self.tableDef.fixupFunction:
+			keys = self.tableDef.dictKeys
+			for row in self:
+				yield tuple(row[key] for key in keys)
 		else:
-			self.setMeta("_queryStatus", "OVERFLOW")
-		self.cleanup()
+			for row in self._iterDBTuples():
+				yield row
 
 	def __len__(self):
 		# Avoid unnecessary failures when doing list(QueryTable())
@@ -102,7 +172,7 @@ class QueryTable(table.BaseTable, dbtable.DBMethodsMixin):
 			except base.DBError:  
 				# Connection already closed or similarly ignorable
 				pass
-		self.connection = None
+		self.connection = self.cursor = None
 
 	def getPlan(self):
 		"""returns a parsed query plan for the current query.
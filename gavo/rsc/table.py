@@ -133,6 +133,12 @@ class _Feeder(object):
 		self.table.addRow(row)
 		self.nAffected += 1
 
+	def addChunk(self, rows):
+		"""adds a sequence of rows to the table.
+		"""
+		for row in rows:
+			self.add(row)
+
 	def flush(self):
 		self._assertActive()
 		# no-op for ram feeder
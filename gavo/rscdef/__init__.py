@@ -35,7 +35,8 @@ from gavo.rscdef.mixins import MixinDef
 
 from gavo.rscdef.procdef import ProcDef, ProcApp
 
-from gavo.rscdef.rmkdef import RowmakerDef, ParmakerDef, MapRule
+from gavo.rscdef.rmkdef import (RowmakerDef, ParmakerDef, MapRule, 
+	ColumnChunk)
 
 from gavo.rscdef.rmkfuncs import (addProcDefObject, IgnoreThisRow,
 	getFlatName)
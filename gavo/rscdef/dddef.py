@@ -227,6 +227,15 @@ class Make(base.Structure, scripting.ScriptingMixin):
 		copyable=True,
 		strip=True)
 
+	_bulkCopy = base.BooleanAttribute("bulkCopy",
+		default=False,
+		description="Feed on-disk tables using binary COPY rather than INSERT"
+		" statements.  This is much faster for large tables but bypasses"
+		" rules (and thus some dupePolicies) and fails for types without"
+		" binary I/O (e.g., pgsphere's); DaCHS falls back to INSERTs"
+		" (with a warning) in these cases.",
+		copyable=True)
+
 	def __repr__(self):
 		return "Make(table=%r, rowmaker=%r)"%(
 			self.table and self.table.id, self.rowmaker and self.rowmaker.id)
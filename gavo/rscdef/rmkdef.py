@@ -13,10 +13,13 @@ a row suitable for inclusion into a table.
 
 import bisect
 import fnmatch
+import itertools
 import re
 import sys
 import traceback
 
+import numpy
+
 from gavo import base
 from gavo import utils
 from gavo.rscdef import common
@@ -32,6 +35,92 @@ class Error(base.Error):
 	pass
 
 
+class ColumnChunk(dict):
+	"""A block of rows in column-oriented form.
+
+	This is a dictionary mapping keys to sequences (preferably numpy arrays)
+	of length nRows or to scalars, which then are the value for all rows
+	in the chunk.  Grammars able to do so yield these from their row
+	iterators' iterChunks methods, and batch rowmakers consume and
+	produce them.
+	"""
+	def __init__(self, nRows, columns=()):
+		dict.__init__(self, columns)
+		self.nRows = nRows
+
+	def isColumn(self, val):
+		"""returns true if val is a sequence of values for our rows
+		(rather than a value for all rows).
+		"""
+		if isinstance(val, numpy.ndarray):
+			return val.ndim>0 and len(val)==self.nRows
+		return isinstance(val, list) and len(val)==self.nRows
+
+	def iterRows(self):
+		"""iterates over row dictionaries made from the chunk.
+
+		One-dimensional numpy arrays are turned into python values; for
+		array-valued columns, the rows contain numpy arrays.
+		"""
+		keys, cols = [], []
+		for key, val in self.iteritems():
+			if self.isColumn(val):
+				if isinstance(val, numpy.ndarray) and val.ndim==1:
+					val = val.tolist()
+				cols.append(val)
+			else:
+				cols.append(itertools.repeat(val, self.nRows))
+			keys.append(key)
+
+		for values in itertools.izip(*cols):
+			yield dict(itertools.izip(keys, values))
+
+	def getHead(self, nRows):
+		"""returns a ColumnChunk with the first nRows rows of this one.
+		"""
+		if nRows>=self.nRows:
+			return self
+		return ColumnChunk(nRows, (
+			(key, val[:nRows] if self.isColumn(val) else val)
+			for key, val in self.iteritems()))
+
+
+_NUMPY_CONVERTIBLE = frozenset(["smallint", "integer", "bigint", "real",
+	"double precision"])
+
+def _batchConvert(values, sqlType):
+	"""returns values converted to sqlType.
+
+	This is used by batch rowmakers for maps with a source.  Numeric
+	numpy arrays are converted using numpy; everything else is converted
+	element by element with base.sqltypeToPython.
+	"""
+	if (isinstance(values, numpy.ndarray) 
+			and values.ndim==1
+			and sqlType in _NUMPY_CONVERTIBLE
+			and values.dtype.kind in "biuf"):
+		return values.astype(base.sqltypeToNumpy(sqlType))
+
+	converter = base.sqltypeToPython(sqlType)
+	if converter is utils.identity:
+		return values
+	if isinstance(values, numpy.ndarray):
+		values = values.tolist()
+	if not isinstance(values, list):
+		return converter(values)
+	return [converter(v) for v in values]
+
+
+def _batchEquals(values, other):
+	"""returns a mask of where values is equal to other.
+
+	This is used by batch rowmakers for nullExprs.
+	"""
+	if isinstance(values, list):
+		return [v==other for v in values]
+	return numpy.asarray(values==other)
+
+
 class MappedExpression(base.Structure):
 	"""a base class for map and var.
 
@@ -148,6 +237,40 @@ class MappedExpression(base.Structure):
 				self.key)
 		return code
 
+	def isVectorisable(self):
+		"""returns true if getBatchCode can generate code for this mapping.
+
+		Catching exceptions per value is impossible over whole columns,
+		and we can only mask out NULLs in results, not in vars.
+		"""
+		return (self.nullExcs is base.NotGiven
+			and (self.nullExpr is base.NotGiven or self.destDict=="result"))
+
+	def getBatchCode(self, columns):
+		"""returns python source code for this mapping operating on
+		ColumnChunks.
+
+		The code for maps with a source uses batchConvert_, nullExprs
+		are turned into masks in the nulls_ dictionary.
+		"""
+		if self.content_:
+			code = ['%s["%s"] = %s'%(self.destDict, self.key, self.content_)]
+		else:
+			colDef = columns.getColumnByName(self.key)
+			code = ['%s["%s"] = batchConvert_(vars["%s"], %s)'%(
+				self.destDict, 
+				self.key, 
+				self.source.replace("\\", r"\\").replace('"', '\\"'),
+				repr(str(colDef.type)))]
+
+		if self.nullExpr is not base.NotGiven:
+			code.append('\nnulls_["%s"] = batchEquals_(%s["%s"], %s)'%(
+				self.key,
+				self.destDict,
+				self.key,
+				self.nullExpr))
+		return "".join(code)
+
 
 class MapRule(MappedExpression):
 	"""A mapping rule.
@@ -358,6 +481,14 @@ class RowmakerDef(base.Structure, RowmakerMacroMixin):
 		" record to be dropped by the rowmaker, i.e., for this specific"
 		" table.  If you need to drop a row for all tables being fed,"
 		" use a trigger on the grammar.", copyable=True)
+	_vectorised = base.BooleanAttribute("vectorised", default=False,
+		description="Evaluate vars and maps once per chunk of rows, with @key"
+		" referring to numpy arrays (or lists) of all values in the chunk,"
+		" when the grammar can deliver such chunks (e.g., fitsTableGrammar)."
+		" Expressions must then work on whole columns (numpy is available"
+		" for that).  Rowmakers with applys, ignoreOn, or nullExcs, or"
+		" with nullExprs on vars still run row by row.",
+		copyable=True)
 	_original = base.OriginalAttribute()
 
 	@classmethod
@@ -426,6 +557,28 @@ class RowmakerDef(base.Structure, RowmakerMacroMixin):
 		"""
 		return self._getSourceFromColset(tableDef.columns)
 
+	def canVectorise(self):
+		"""returns true if this rowmaker can be compiled into a BatchRowmaker.
+		"""
+		return (self.vectorised
+			and not self.apps
+			and not self.ignoreOn
+			and all(m.isVectorisable() for m in self.maps)
+			and all(v.isVectorisable() for v in self.vars))
+
+	def _getBatchSource(self, tableDef):
+		"""returns the source code and the line map for a batch mapper to
+		tableDef's columns.
+		"""
+		source, lineMap, line = [], {}, 1
+		for item, desc in itertools.chain(
+				((v, "assigning "+v.key) for v in self.vars),
+				((m, "building "+m.key) for m in self.maps)):
+			source.append(item.getBatchCode(tableDef.columns))
+			lineMap[line] = desc
+			line += source[-1].count("\n")+1
+		return "\n".join(source), lineMap
+
 	def _getGlobals(self, tableDef):
 		globals = {}
 		for a in self.apps:
@@ -499,10 +652,38 @@ class RowmakerDef(base.Structure, RowmakerMacroMixin):
 		return utils.memoizeOn(tableDef, self, self._realCompileForTableDef,
 			tableDef)
 
+	def _realCompileBatchForTableDef(self, tableDef):
+		"""helps compileBatchForTableDef.
+		"""
+		rmk = self._buildForTable(tableDef)
+		source, lineMap = rmk._getBatchSource(tableDef)
+		globals = rmk._getGlobals(tableDef)
+		globals["batchConvert_"] = _batchConvert
+		globals["batchEquals_"] = _batchEquals
+		globals["numpy"] = numpy
+		return BatchRowmaker(common.replaceProcDefAt(source), 
+			self.id, globals, tableDef.getDefaults(), lineMap)
+
+	def compileBatchForTableDef(self, tableDef):
+		"""returns a BatchRowmaker for tableDef or None if this rowmaker 
+		cannot or should not run on ColumnChunks (see canVectorise).
+		"""
+		if not self.canVectorise():
+			return None
+		# memoizeOn(tableDef, self, ...) already holds the row-by-row
+		# rowmaker, so we need a cache attribute of our own.  It starts
+		# with _cache so utils.forgetMemoized clears it.
+		cacheName = "_cacheBatchRowmaker%s"%id(self)
+		if getattr(tableDef, cacheName, None) is None:
+			setattr(tableDef, cacheName, 
+				self._realCompileBatchForTableDef(tableDef))
+		return getattr(tableDef, cacheName)
+
 	def copyShallowly(self):
 		return base.makeStruct(self.__class__, maps=self.maps[:], 
 			vars=self.vars[:], idmaps=self.idmaps[:], 
-			apps=self.apps[:], ignoreOn=self.ignoreOn)
+			apps=self.apps[:], ignoreOn=self.ignoreOn,
+			vectorised=self.vectorised)
 
 
 class ParmakerDef(RowmakerDef):
@@ -621,3 +802,42 @@ class Rowmaker(object):
 			raise
 		except Exception, ex:
 			self._guessError(ex, locals["vars"], sys.exc_info()[2])
+
+
+class BatchRowmaker(Rowmaker):
+	"""A Rowmaker working on ColumnChunks.
+
+	These are called with a ColumnChunk and the target table and return a
+	list of row dictionaries.  Vars and maps are evaluated once per chunk,
+	so @key in their expressions refers to all values of key in the
+	chunk.
+	"""
+	def __call__(self, chunk, table):
+		try:
+			locals = {
+				"vars": ColumnChunk(chunk.nRows, chunk),
+				"result": ColumnChunk(chunk.nRows),
+				"nulls_": {},
+				"_self": self,
+				"targetTable": table
+			}
+			for k in self.keySet-set(chunk):
+				locals["vars"][k] = self.defaults[k]
+			exec self.code in self.globals, locals
+
+			rows = list(locals["result"].iterRows())
+			for key, mask in locals["nulls_"].iteritems():
+				mask = numpy.asarray(mask)
+				if mask.ndim==0:
+					indices = xrange(len(rows)) if mask else []
+				else:
+					indices = numpy.flatnonzero(mask)
+				for index in indices:
+					rows[index][key] = None
+
+			self.rowsMade += len(rows)
+			return rows
+		except base.ValidationError:
+			raise
+		except Exception, ex:
+			self._guessError(ex, locals["vars"], sys.exc_info()[2])
@@ -477,6 +477,16 @@ class DBCore(TableBasedCore):
 		"A group by clause.  You shouldn't generally need this, and if"
 		" you use it, you must give an outputTable to your core.",
 		default=None)
+	_streaming = base.BooleanAttribute("streaming", description="Pass"
+		" results on to the renderer as they come from the database rather"
+		" than collecting them in memory first?  This only has an effect"
+		" with renderers that can handle that (currently, the DAL"
+		" renderers writing VOTables).  Use this for services that"
+		" may return very many rows.", default=False, copyable=True)
+
+	# derived cores that need the entire result table (e.g., because they
+	# post-process it) must set this to False.
+	streamable = True
 
 	def wantsTableWidget(self):
 		return self.sortKey is None and self.limit is None
@@ -490,8 +500,51 @@ class DBCore(TableBasedCore):
 		"""
 		return service.getCurOutputFields(queryMeta)
 
+	def _runStreamingQuery(self, resultTableDef, fragment, pars, queryMeta,
+			**kwargs):
+		"""returns a data instance containing a QueryTable for querying
+		our table.
+
+		The QueryTable has its own connection, which is closed when
+		the result has been delivered.
+		"""
+		conn = base.getDBConnection("trustedquery")
+		try:
+			queriedTable = rsc.TableForDef(self.queriedTable, nometa=True,
+				create=False, connection=conn)
+
+			if fragment and pars:
+				resultTableDef.addMeta("info", repr(pars),
+					infoName="queryPars", infoValue=fragment)
+
+			iqArgs = {"limits": queryMeta.asSQL(), "distinct": self.distinct,
+				"groupBy": self.groupBy}
+			iqArgs.update(kwargs)
+			resultTableDef, query, pars = queriedTable.getQuery(
+				resultTableDef, fragment, pars, **iqArgs)
+
+			res = rsc.QueryTable(resultTableDef, query, conn,
+				pars=pars, autoClose=True, matchLimit=queryMeta.get("dbLimit"))
+			res.configureConnection([], timeout=queryMeta["timeout"])
+			try:
+				# run the query now so errors show up before we start streaming
+				res.execute()
+			except:
+				mapDBErrors(*sys.exc_info())
+		except:
+			conn.close()
+			raise
+
+		# the columns already are what the service wants; wrapping the
+		# table keeps the service from trying to adapt it.
+		return rsc.wrapTable(res, rdSource=self.queriedTable)
+
 	def _runQuery(self, resultTableDef, fragment, pars, queryMeta,
 			**kwargs):
+		if self.streaming and self.streamable and queryMeta.get("canStream"):
+			return self._runStreamingQuery(
+				resultTableDef, fragment, pars, queryMeta, **kwargs)
+
 		with base.getTableConn()  as conn:
 			queriedTable = rsc.TableForDef(self.queriedTable, nometa=True,
 				create=False, connection=conn)
@@ -528,6 +581,10 @@ class DBCore(TableBasedCore):
 	def run(self, service, inputTable, queryMeta):
 		"""does the DB query and returns an InMemoryTable containing
 		the result.
+
+		If streaming is enabled and the renderer has declared it can
+		handle streamed results (by setting canStream in queryMeta), the 
+		result instead is a data instance wrapping a QueryTable.
 		"""
 		resultTableDef = self._makeResultTableDef(
 			service, inputTable, queryMeta)
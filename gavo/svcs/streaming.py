@@ -176,8 +176,11 @@ def streamOut(writeStreamTo, request):
 	return request.deferred
 
 
-def streamVOTable(request, data, **contextOpts):
+def streamVOTable(request, data, cleanup=None, **contextOpts):
 	"""streams out the payload of an SvcResult as a VOTable.
+
+	If you pass a function in cleanup, it is called when writing has
+	ended, whether or not it succeeded.
 	"""
 	def writeVOTable(outputFile):
 		"""writes a VOTable representation of the SvcResult instance data
@@ -189,9 +192,13 @@ def streamVOTable(request, data, **contextOpts):
 		if "version" not in contextOpts:
 			contextOpts["version"] = data.queryMeta.get("VOTableVersion")
 
-		votablewrite.writeAsVOTable(
-			data.original, outputFile,
-			ctx=votablewrite.VOTableContext(**contextOpts))
+		try:
+			votablewrite.writeAsVOTable(
+				data.original, outputFile,
+				ctx=votablewrite.VOTableContext(**contextOpts))
+		finally:
+			if cleanup is not None:
+				cleanup()
 		return ""
 
 	return streamOut(writeVOTable, request)
@@ -8,7 +8,6 @@ DC administration interface.
 #c COPYING file in the source distribution.
 
 
-import os
 import sys
 
 from gavo import base
@@ -191,41 +190,27 @@ def declaredel(querier, args):
 
 @exposedFunction([Arg(help="rd#table-id of the table containing the"
 	" products that should get cached previews", dest="tableId"),
-	Arg("-w", type=str,
-		help="width to compute the preview for", dest="width", default="200"),],
-	help="Precompute previews for the product interface columns in a table.")
+	Arg("-j", "--parallel", type=int, dest="nParallel", default=4,
+		help="number of processes computing previews (default: 4)"),
+	Arg("-f", "--force", action="store_true", dest="force",
+		help="also recompute previews already in the cache"),],
+	help="Compute previews for the products in a table that have automatic"
+	" previews not yet in the preview cache (run this after imports or"
+	" from cron).")
 def cacheprev(querier, args):
-	from gavo.web.productrender import PreviewCacheManager
-	from twisted.internet import reactor
+	from gavo.protocols import products
 
-	basePath = base.getConfig("inputsDir")
 	td = base.resolveId(None, args.tableId)
-	rows = querier.queryToDicts(
-		td.getSimpleQuery(["accref", "mime"]))
-
-	def runNext(token):
-		try:
-			row = rows.next()
-			res = PreviewCacheManager.getPreviewFor(row["mime"],
-				[str(os.path.join(basePath, row["accref"])), str(args.width)]
-			)
-
-			if getattr(res, "result", None): # don't add a callback on a 
-					# fired deferred or you'll exhaust the stack
-				reactor.callLater(0.1, runNext, "continue")
-			else:
-				res.addCallback(runNext)
-			return res
-		except StopIteration:
-			pass
-		except:
-			import traceback
-			traceback.print_exc()
-		reactor.stop()
-		return ""
-
-	reactor.callLater(0, runNext, "startup")
-	reactor.run()
+	rows = base.resolveCrossId(products.PRODUCTS_TDID).doSimpleQuery(
+		fragments="sourceTable=%(tableName)s",
+		params={"tableName": td.getQName()})
+
+	generated, failed = products.precomputePreviews(rows,
+		nParallel=args.nParallel, force=args.force)
+
+	for accref, errMsg in failed:
+		base.ui.notifyWarning("No preview for %s: %s"%(accref, errMsg))
+	print "%d previews computed, %d failed."%(len(generated), len(failed))
 
 
 @exposedFunction([Arg(help="rd#table-id of the table to look at",
@@ -10,6 +10,7 @@ Dropping resources.  For now, you can only drop entire RDs.
 
 from gavo import api
 from gavo import base
+from gavo import rsc
 from gavo import utils
 from gavo.protocols import tap
 from gavo.user import common
@@ -46,6 +47,7 @@ def _do_dropTable(tableName, conn):
 
 	if q.getTableType(tableName) is not None:
 		q.dropTable(tableName, cascade=True)
+	rsc.notifyTablemetaChanged(conn)
 
 
 def dropTable():
@@ -118,6 +120,7 @@ def _do_dropRD(opts, rdId, selectedIds=()):
 					querier.query(
 						"delete from %s where sourceRd=%%(sourceRD)s"%tableName,
 						{"sourceRD": rdId})
+			rsc.notifyTablemetaChanged(querier.connection)
 
 		restoreObscore(querier.connection)
 
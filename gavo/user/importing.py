@@ -167,6 +167,15 @@ def main():
 			" for the duration of the input, i.e., potentially days.  The price"
 			" is that users will see empty tables during the import.",
 			dest="commitAfterMeta", action="store_true", default=False)
+		parser.add_option("-j", "--parallel", help="parse sources and run"
+			" rowmakers in N worker processes.  This only works for grammars"
+			" and rowmakers that do not use the database; also, newSource"
+			" scripts are run only when a source's rows are ingested.",
+			dest="parallel", action="store", type="int", default=None,
+			metavar="N")
+		parser.add_option("-B", "--bulk-copy", help="feed database tables"
+			" using COPY rather than INSERT where possible.",
+			dest="bulkCopy", action="store_true", default=False)
 
 		(opts, args) = parser.parse_args()
 
@@ -71,8 +71,49 @@ class AnnotationMaker(object):
 			self.column.annotations[destKey] = resultRow[srcKey]
 
 
-def annotateDBTable(td, extended=True, requireValues=False):
-	"""returns the TableDef td with domain annotations for its columns.
+# tables estimated to have more rows than this are sampled
+# by annotateDBTable unless exact statistics are requested.
+DEFAULT_SAMPLE_ROWS = 1000000
+
+
+def serverCanSample(conn):
+	"""returns true if the database server behind conn supports TABLESAMPLE.
+
+	That is the case from postgres 9.5 on.
+	"""
+	try:
+		return tuple(int(part) 
+			for part in conn.getServerVersion().split("."))>=(9, 5)
+	except ValueError:
+		# unparseable version; don't risk it.
+		return False
+
+
+def getSamplePercent(conn, td, sampleRows):
+	"""returns the percentage of the table td that needs to be sampled
+	to look at about sampleRows rows.
+
+	None is returned if the whole table should be scanned, i.e., if the
+	server cannot sample, td is not a plain table, has never been analyzed,
+	or is small enough.  The row count is the planner's estimate from 
+	pg_class.
+	"""
+	if not serverCanSample(conn):
+		return None
+
+	res = list(conn.query("SELECT reltuples, relkind FROM pg_class"
+		" WHERE oid=%(name)s::regclass", {"name": td.getQName()}))
+	if not res or res[0][1]!='r':
+		return None
+	estRows = res[0][0]
+	if estRows<=sampleRows:
+		return None
+	return 100.*sampleRows/estRows
+
+
+def annotateDBTable(td, extended=True, requireValues=False, 
+		exact=False, sampleRows=DEFAULT_SAMPLE_ROWS):
+	"""adds domain annotations to the columns of the TableDef td.
 
 	td must be an existing on-Disk table.
 
@@ -84,6 +125,12 @@ def annotateDBTable(td, extended=True, requireValues=False):
 	Without extended, only min and max are annotated.  With
 	requireValues, only numeric columns that already have a values child
 	are annotated.
+
+	Unless exact is passed, tables with more than about sampleRows rows
+	are not scanned completely; instead, the annotations are computed
+	from a block sample (TABLESAMPLE SYSTEM) of about sampleRows rows.
+	The function returns the percentage of the table sampled, or None
+	if the annotations were computed from the whole table.
 	"""
 	outputFields, annotators = [], []
 	nameMaker = base.VOTNameMaker()
@@ -122,20 +169,35 @@ def annotateDBTable(td, extended=True, requireValues=False):
 				hint="This is probably because it is an in-memory table.  Add"
 				" onDisk='True' to make tables reside in the database.")
 
-		limitsTable = dbtable.getTableForQuery(outputFields, "")
-		resultRow = limitsTable.rows[0]
+		samplePercent = None
+		if not exact:
+			samplePercent = getSamplePercent(conn, td, sampleRows)
+
+		if samplePercent is None:
+			limitsTable = dbtable.getTableForQuery(outputFields, "")
+			resultRow = limitsTable.rows[0]
+		else:
+			resultRow = dict(zip(
+				[f.name for f in outputFields],
+				list(conn.query("SELECT %s FROM %s TABLESAMPLE SYSTEM (%s)"%(
+					", ".join(f.select for f in outputFields),
+					td.getQName(),
+					repr(samplePercent))))[0]))
 
 	for annotator in annotators:
 		annotator.annotate(resultRow)
+	return samplePercent
 
 
 _PROP_SEQ = ("min", "avg", "max", "hasnulls")
 
-def printTableInfo(td):
+def printTableInfo(td, exact=False):
 	"""tries to obtain various information on the properties of the
 	database table described by td.
+
+	Large tables are sampled unless exact is True (see annotateDBTable).
 	"""
-	annotateDBTable(td)
+	samplePercent = annotateDBTable(td, exact=exact)
 	propTable = [("col",)+_PROP_SEQ]
 	for col in td:
 		row = [col.name]
@@ -147,6 +209,9 @@ def printTableInfo(td):
 				row.append("-")
 		propTable.append(tuple(row))
 	print utils.formatSimpleTable(propTable)
+	if samplePercent is not None:
+		print ("\nThese are estimates from a %.2g%% sample of the table;"
+			" use --exact for exact values."%samplePercent)
 
 
 def parseCmdline():
@@ -154,10 +219,13 @@ def parseCmdline():
 		description="Displays various stats about the table referred to in"
 			" the argument.")
 	parser.add_argument("tableId", help="Table id (of the form rdId#tableId)")
+	parser.add_argument("--exact", help="Scan the entire table even if it"
+		" is large (this may take a long time).",
+		action="store_true", dest="exact")
 	return parser.parse_args()
 
 
 def main():
 	args = parseCmdline()
 	td = api.getReferencedElement(args.tableId, api.TableDef)
-	printTableInfo(td)
+	printTableInfo(td, exact=args.exact)
@@ -295,21 +295,29 @@ class _ValuesChanger(Manipulator):
 		return parsedElement
 
 
-def iterLimitsForTable(tableDef):
+def iterLimitsForTable(tableDef, sample=False):
 	"""returns a list of values to fill in into tableDef.
 
 	This will be empty if the table doesn't exist.  Otherwise, it will be
 	a tuple (table-id, column-name, min, max) for every column with
 	a reasonably numeric type that has a min and max values.
+
+	With sample, the limits of large tables are estimated from a sample
+	(see info.annotateDBTable).  Since the limits end up in the RD,
+	the default is to scan the whole table.
 	"""
-	info.annotateDBTable(tableDef, extended=False, requireValues=True)
+	samplePercent = info.annotateDBTable(tableDef, extended=False, 
+		requireValues=True, exact=not sample)
+	if samplePercent is not None:
+		base.ui.notifyWarning("Limits for %s estimated from a %.2g%% sample."%(
+			tableDef.getQName(), samplePercent))
 	for col in tableDef:
 		if col.annotations:
 			min, max = col.annotations["min"], col.annotations["max"]
 			yield (tableDef.id, col.name, min, max)
 
 
-def iterLimitsForRD(rd):
+def iterLimitsForRD(rd, sample=False):
 	"""returns a list of values to fill in for an entire RD.
 
 	See iterLimitsForTable.
@@ -317,7 +325,7 @@ def iterLimitsForRD(rd):
 	for td in rd.tables:
 		if td.onDisk:
 			try:
-				for limits in iterLimitsForTable(td):
+				for limits in iterLimitsForTable(td, sample):
 					yield limits
 			except base.ReportableError, msg:
 				base.ui.notifyError("Skipping %s: %s"%(td.id, utils.safe_str(msg)))
@@ -344,6 +352,9 @@ def parseCmdLine():
 	parser.add_argument("itemId", help="Cross-RD reference of a table or"
 		" RD to update, as in ds/q or ds/q#mytable; only RDs in inputsDir"
 		" can be updated.")
+	parser.add_argument("--sample", help="Estimate the limits of large"
+		" tables from a sample rather than scanning them completely (the"
+		" limits may then be too narrow).", action="store_true", dest="sample")
 	return parser.parse_args()
 
 
@@ -353,11 +364,11 @@ def main():
 	item = api.getReferencedElement(args.itemId)
 
 	if isinstance(item, api.TableDef):
-		changes = iterLimitsForTable(item)
+		changes = iterLimitsForTable(item, args.sample)
 		rd = item.rd
 
 	elif isinstance(item, api.RD):
-		changes = iterLimitsForRD(item)
+		changes = iterLimitsForRD(item, args.sample)
 		rd = item
 
 	else:
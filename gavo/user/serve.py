@@ -39,6 +39,8 @@ from gavo.web import root
 
 def setupServer(rootPage):
 	config.setMeta("upSince", utils.formatISODT(datetime.datetime.utcnow()))
+	base.caches.setMemoryLimit(
+		base.getConfig("web", "cacheMemoryLimit") or None)
 	base.ui.notifyWebServerUp()
 	if base.DEBUG:
 		# we don't want periodic stuff to happen when in debug mode, since
@@ -118,6 +120,8 @@ def _reloadConfig():
 	root.loadUserVanity(root.ArchiveService)
 	config.makeFallbackMeta(reload=True)
 	config.loadConfig()
+	base.caches.setMemoryLimit(
+		base.getConfig("web", "cacheMemoryLimit") or None)
 
 	base.ui.notifyInfo("Cleared caches on SIGHUP")
 
@@ -34,7 +34,7 @@ class _COMMIT(object):
 	"""
 
 
-CURRENT_SCHEMAVERSION = 15
+CURRENT_SCHEMAVERSION = 16
 
 
 class AnnotatedString(str):
@@ -451,6 +451,21 @@ class To15Upgrader(Upgrader):
 				connection.execute("ALTER TABLE %s"
 					" ADD COLUMN creationTime TIMESTAMP"%tableName)
 
+
+class To16Upgrader(Upgrader):
+	version = 15
+
+	@classmethod
+	def u_10_add_uws_scheduling_columns(cls, connection):
+		"""adding submitter and costEstimate columns to UWS jobs tables."""
+		q = base.UnmanagedQuerier(connection)
+		for tableName in [
+				"dc.datalinkjobs", "uws.userjobs", "tap_schema.tapjobs"]:
+			if q.getTableType(tableName) is not None:
+				connection.execute("ALTER TABLE %s"
+					" ADD COLUMN submitter TEXT,"
+					" ADD COLUMN costEstimate REAL"%tableName)
+
 # next upgrade: drop DM declaration for Obscore 1.0
 
 def iterStatements(startVersion, endVersion=CURRENT_SCHEMAVERSION, 
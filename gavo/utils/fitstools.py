@@ -19,9 +19,11 @@ places where you use pyfits in a core (or a similar spot).
 
 from __future__ import with_statement
 
+import copy
 import datetime
 import gzip
 import itertools
+import mmap
 import os
 import re
 import struct
@@ -556,6 +558,45 @@ def getAxisLengths(hdr):
 	return [hdr["NAXIS%d"%i] for i in range(1, hdr["NAXIS"]+1)]
 
 
+def _computeCutout(header, cuts):
+	"""returns a new header and pixel ranges for cutting out cuts from
+	an image described by header.
+
+	cuts is as for cutoutFITS.  The pixel ranges are a list of
+	(first, last+1) pairs of 0-based pixel indices, one per axis in FITS 
+	order.
+	"""
+	cutDict = dict((c[0], c[1:]) for c in cuts)
+	ranges = []
+	newHeader = header.copy()
+
+	for index, length in enumerate(getAxisLengths(header)):
+		firstPix, lastPix = cutDict.get(index+1, (None, None))
+
+		if firstPix is None:
+			firstPix = 1
+		if lastPix is None:
+			lastPix = length
+		firstPix = min(max(1, firstPix), length)
+		lastPix = min(length, max(1, lastPix))
+
+		if (firstPix, lastPix)==(1, length):
+			ranges.append((0, length))
+		else:
+			firstPix -= 1
+			newAxisLength = lastPix-firstPix
+			if newAxisLength==0:
+				newAxisLength = 1
+				lastPix = firstPix+1
+			ranges.append((int(firstPix), int(lastPix)))
+
+			newHeader["NAXIS%d"%(index+1)] = newAxisLength
+			refpixKey = "CRPIX%d"%(index+1)
+			newHeader.set(refpixKey, newHeader[refpixKey]-firstPix)
+
+	return newHeader, ranges
+
+
 def cutoutFITS(hdu, *cuts):
 	"""returns a cutout of hdu restricted to cuts.
 
@@ -579,39 +620,154 @@ def cutoutFITS(hdu, *cuts):
 
 	Note that this will lose all extensions the orginal FITS file might have
 	had.
+
+	If hdu is a DirectCutout, the result is a DirectCutout, too.
 	"""
-	cutDict = dict((c[0], c[1:]) for c in cuts)
-	slices = []
-	newHeader = hdu.header.copy()
+	if isinstance(hdu, DirectCutout):
+		return hdu.cutout(*cuts)
 
-	for index, length in enumerate(getAxisLengths(hdu.header)):
-		firstPix, lastPix = cutDict.get(index+1, (None, None))
+	newHeader, ranges = _computeCutout(hdu.header, cuts)
+	slices = [slice(first, last, 1) for first, last in reversed(ranges)]
+	newHDU = pyfits.PrimaryHDU(data=hdu.data[tuple(slices)].copy(order='C'),
+		header=newHeader)
+	return newHDU
 
-		if firstPix is None:
-			firstPix = 1
-		if lastPix is None:
-			lastPix = length
-		firstPix = min(max(1, firstPix), length)
-		lastPix = min(length, max(1, lastPix))
 
-		if (firstPix, lastPix)==(1, length):
-			slices.append(slice(None, None, None))
-		else:
-			firstPix -= 1
-			newAxisLength = lastPix-firstPix
-			if newAxisLength==0:
-				newAxisLength = 1
-				lastPix = firstPix+1
-			slices.append(slice(int(firstPix), int(lastPix), 1))
+_BITPIX_TYPES = {
+	8: "u1",
+	16: ">i2",
+	32: ">i4",
+	64: ">i8",
+	-32: ">f4",
+	-64: ">f8",}
 
-			newHeader["NAXIS%d"%(index+1)] = newAxisLength
-			refpixKey = "CRPIX%d"%(index+1)
-			newHeader.set(refpixKey, newHeader[refpixKey]-firstPix)
 
-	slices.reverse()
-	newHDU = pyfits.PrimaryHDU(data=hdu.data[tuple(slices)].copy(order='C'),
-		header=newHeader)
-	return newHDU
+class DirectCutout(object):
+	"""a cutout from the primary HDU of a plain FITS file.
+
+	This is an alternative to opening the file with pyfits and using
+	cutoutFITS for large images.  Only the header is read on construction.
+	The data is read only when the data attribute is accessed or when
+	iterBytes is called, and then just the parts of the file that
+	are within the cutout, through an mmap of the file.  Since pyfits
+	is not involved, you do not need to hold the fitsLock when using 
+	DirectCutouts.
+
+	DirectCutouts have header and data attributes like pyfits HDUs, where
+	data is not scaled (as with pyfits' do_not_scale_image_data).  You can
+	change both header and data, and iterBytes will return the changed
+	versions.  Use cutout (or cutoutFITS) to cut out further; this 
+	returns a new DirectCutout and never reads data.
+
+	Initially, the cutout is the entire image.  The constructor raises
+	a FITSError if srcPath cannot be cut out from directly (e.g., because
+	it is compressed or has no image in the primary HDU).
+	"""
+	def __init__(self, srcPath):
+		self.srcPath = srcPath
+		with open(srcPath, "rb") as f:
+			if f.read(2)=="\x1f\x8b":
+				raise FITSError("Cannot cut out directly from compressed FITS files")
+			f.seek(0)
+			self.header = readPrimaryHeaderQuick(f)
+			self.dataOffset = f.tell()
+
+		if (not self.header.get("NAXIS") 
+				or self.header.get("GROUPS")
+				or self.header.get("BITPIX") not in _BITPIX_TYPES):
+			raise FITSError("Cannot cut out directly from %s"%srcPath)
+
+		self.srcLengths = getAxisLengths(self.header)
+		self.ranges = [(0, length) for length in self.srcLengths]
+		self._data = None
+
+	def cutout(self, *cuts):
+		"""returns a new DirectCutout restricted to cuts.
+
+		cuts are as for cutoutFITS, where pixel coordinates are relative to
+		the current cutout.
+		"""
+		newHeader, ranges = _computeCutout(self.header, cuts)
+		res = copy.copy(self)
+		res.header = newHeader
+		res.ranges = [(oldFirst+first, oldFirst+last)
+			for (oldFirst, _), (first, last) in zip(self.ranges, ranges)]
+		res._data = None
+		return res
+
+	def iterByteRanges(self):
+		"""iterates over (offset, length) pairs of the parts of the source 
+		file making up the cutout's data.
+
+		The ranges are returned in file order; they are as large as the
+		cutout allows.
+		"""
+		strides = [abs(self.header["BITPIX"])//8]
+		for length in self.srcLengths[:-1]:
+			strides.append(strides[-1]*length)
+
+		# the ranges cover the full fastest-varying axes and a part of the
+		# axis after them; the remaining, slower, axes are iterated over.
+		contAxis = 0
+		while (contAxis<len(self.ranges)-1 
+				and self.ranges[contAxis]==(0, self.srcLengths[contAxis])):
+			contAxis += 1
+		first, last = self.ranges[contAxis]
+		runOffset = self.dataOffset+first*strides[contAxis]
+		runLength = (last-first)*strides[contAxis]
+
+		outerAxes = range(len(self.ranges)-1, contAxis, -1)
+		for indices in itertools.product(*[
+				xrange(*self.ranges[axis]) for axis in outerAxes]):
+			yield (runOffset+sum(index*strides[axis] 
+					for index, axis in zip(indices, outerAxes)),
+				runLength)
+
+	def _iterDataBytes(self, chunkSize):
+		"""iterates over the bytes of the cutout's data in chunks of
+		about chunkSize bytes.
+		"""
+		if self._data is not None:
+			yield numpy.asarray(self._data, 
+				dtype=_BITPIX_TYPES[self.header["BITPIX"]]).tostring()
+			return
+
+		with open(self.srcPath, "rb") as f:
+			fileMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			parts, partsLength = [], 0
+			for offset, length in self.iterByteRanges():
+				parts.append(fileMap[offset:offset+length])
+				partsLength += length
+				if partsLength>=chunkSize:
+					yield "".join(parts)
+					parts, partsLength = [], 0
+			yield "".join(parts)
+		finally:
+			fileMap.close()
+
+	def iterBytes(self, chunkSize=2**20):
+		"""iterates over the bytes of a FITS file containing the cutout.
+		"""
+		yield serializeHeader(self.header)
+		dataLength = 0
+		for chunk in self._iterDataBytes(chunkSize):
+			dataLength += len(chunk)
+			yield chunk
+		yield "\0"*(-dataLength%FITS_BLOCK_SIZE)
+
+	@property
+	def data(self):
+		if self._data is None:
+			self._data = numpy.fromstring(
+				"".join(self._iterDataBytes(2**20)),
+				dtype=_BITPIX_TYPES[self.header["BITPIX"]]
+				).reshape([last-first for first, last in reversed(self.ranges)])
+		return self._data
+
+	@data.setter
+	def data(self, data):
+		self._data = data
 
 
 def shrinkWCSHeader(oldHeader, factor):
@@ -796,6 +952,137 @@ def iterScaledRows(inFile, factor=None, destSize=None, hdr=None, slow=False,
 			(newRow/factor).reshape((destRowLength, factor))))
 
 
+def _iterArrayBlocks(pixels, nRows, blockRows):
+	"""iterates over blocks of blockRows rows from the first nRows rows
+	of the 2D array pixels.
+	"""
+	for startRow in xrange(0, nRows, blockRows):
+		yield pixels[startRow:min(startRow+blockRows, nRows)]
+
+
+def _iterStreamedBlocks(inFile, hdr, nRows, blockRows):
+	"""iterates over blocks of blockRows rows from the first nRows rows
+	of the image described by hdr, read from inFile.
+
+	inFile must be positioned at the start of the data; it is read
+	sequentially, so this works for gzip files, too.
+	"""
+	dtype = numpy.dtype(_BITPIX_TYPES[hdr["BITPIX"]])
+	rowLength = hdr["NAXIS1"]
+	rowBytes = rowLength*dtype.itemsize
+	for startRow in xrange(0, nRows, blockRows):
+		toRead = min(blockRows, nRows-startRow)*rowBytes
+		data = inFile.read(toRead)
+		if len(data)!=toRead:
+			raise FITSError("Truncated FITS data")
+		yield numpy.frombuffer(data, dtype).reshape((-1, rowLength))
+
+
+def _getBlockSource(inFile, extInd):
+	"""helps readScaledImage by returning the header of the image to
+	scale and a function f(nRows, blockRows) iterating over blocks of its 
+	pixels.
+
+	Plain FITS images in real files are memory-mapped, those in gzip files
+	are read sequentially.  Everything else is decoded by pyfits (under the
+	FITS lock).
+	"""
+	if extInd==0 and isinstance(inFile, file):
+		isGzipped = inFile.read(2)=="\x1f\x8b"
+		inFile.seek(0)
+		if isGzipped:
+			inFile = gzip.GzipFile(fileobj=inFile, mode="rb")
+
+	if extInd==0 and isinstance(inFile, (file, gzip.GzipFile)):
+		hdr = readPrimaryHeaderQuick(inFile)
+		if (hdr.get("NAXIS", 0)>=2
+				and not hdr.get("GROUPS")
+				and hdr.get("BITPIX") in _BITPIX_TYPES):
+			if isinstance(inFile, file):
+				pixels = numpy.memmap(inFile, 
+					dtype=_BITPIX_TYPES[hdr["BITPIX"]], 
+					mode="r", 
+					offset=inFile.tell(), 
+					shape=(hdr["NAXIS2"], hdr["NAXIS1"]))
+				return hdr, lambda nRows, blockRows: _iterArrayBlocks(
+					pixels, nRows, blockRows)
+			else:
+				return hdr, lambda nRows, blockRows: _iterStreamedBlocks(
+					inFile, hdr, nRows, blockRows)
+
+		# presumably a tile-compressed image; let pyfits sort it out
+		inFile.seek(0)
+
+	with fitsLock():
+		hdus = pyfits.open(inFile, do_not_scale_image_data=True)
+		if extInd==0 and len(hdus)>1 and isinstance(
+				hdus[1], pyfits.CompImageHDU):
+			extInd = 1
+		hdr = hdus[extInd].header.copy()
+		pixels = numpy.array(hdus[extInd].data)
+		hdus.close()
+
+	while pixels.ndim>2:
+		pixels = pixels[0]
+	return hdr, lambda nRows, blockRows: _iterArrayBlocks(
+		pixels, nRows, blockRows)
+
+
+def _getScaledBlock(block, factor, destRowLength, bscale, bzero):
+	"""returns the float32 array made by averaging over factor x factor
+	pixels of block.
+
+	The number of rows in block must be a multiple of factor.
+	"""
+	block = numpy.asarray(block[:, :destRowLength*factor], 'float32')
+	if bscale!=1 or bzero!=0:
+		block = block*bscale+bzero
+	return block.reshape((-1, factor, destRowLength, factor)
+		).mean(axis=3).mean(axis=1)
+
+
+def readScaledImage(inFile, factor=None, destSize=None, extInd=0,
+		blockBytes=2**24):
+	"""returns a float32 numpy array of the 2D image in the FITS stream inFile
+	scaled down by the integer factor.
+
+	This is a vectorised alternative to iterScaledRows; factor, destSize,
+	and extInd work as there, and the result is what
+	numpy.array(list(iterScaledRows(...))) returns.  Of 3D and higher
+	images, the first plane is scaled.
+
+	The image is processed in blocks of about blockBytes bytes.  Plain FITS
+	images in real files are memory-mapped, gzipped ones are streamed, and
+	just the remaining cases (e.g., tile-compressed images) are decoded by
+	pyfits.  This function acquires the FITS lock for that itself, so you
+	should not hold it when calling readScaledImage.
+	"""
+	hdr, makeBlocks = _getBlockSource(inFile, extInd)
+
+	if factor is None:
+		if destSize is None:
+			raise excs.DataError(
+				"readScaledImage needs either factor or destSize.")
+		size = max(hdr["NAXIS1"], hdr["NAXIS2"])
+		factor = max(1, size//destSize+1)
+	factor = int(factor)
+	assert factor>0
+
+	destRowLength = hdr["NAXIS1"]//factor
+	nRows = hdr["NAXIS2"]//factor*factor
+	rowBytes = hdr["NAXIS1"]*abs(hdr["BITPIX"])//8
+	blockRows = factor*max(1, blockBytes//(rowBytes*factor))
+	bscale, bzero = hdr.get("BSCALE", 1), hdr.get("BZERO", 0)
+
+	res = numpy.empty((nRows//factor, destRowLength), 'float32')
+	destRow = 0
+	for block in makeBlocks(nRows, blockRows):
+		scaled = _getScaledBlock(block, factor, destRowLength, bscale, bzero)
+		res[destRow:destRow+len(scaled)] = scaled
+		destRow += len(scaled)
+	return res
+
+
 def iterScaledBytes(inFileName, factor, extraCards={}):
 	"""iterates over the bytes for a simple FITS file generated by scaling 
 	down the 2D image inFileName by factor.
@@ -15,13 +15,18 @@ from gavo.votable import common
 from gavo.votable.model import VOTable
 
 
-def getRowEncoderSource(tableDefinition, encoderModule):
+def getRowEncoderSource(tableDefinition, encoderModule, mappers=None):
 	"""returns the source for a function encoding rows of tableDefition
 	in the format implied encoderModule
 
 	tableDefinition is a VOTable.TABLE instance, encoderModule
 	is one of the enc_whatever modules (this function needs getLinesFor
 	and getPostamble from them).
+
+	mappers, if given, is a sequence of functions, one per field, that are
+	applied to the raw values before encoding them; utils.identity or None
+	entries are left out of the code.  The functions are expected as map<n>
+	in the codec's globals (buildEncoder arranges for that).
 	"""
 
 	source = [
@@ -36,9 +41,13 @@ def getRowEncoderSource(tableDefinition, encoderModule):
 
 	for index, field in enumerate(
 			tableDefinition.iterChildrenOfType(VOTable.FIELD)):
+		if mappers and mappers[index] not in (None, utils.identity):
+			fetchVal = "map%d(tableRow[%d])"%(index, index)
+		else:
+			fetchVal = "tableRow[%d]"%index
 		source.extend([
 			"  try:",
-			"    val = tableRow[%d]"%index])
+			"    val = "+fetchVal])
 		source.extend(indentList(encoderModule.getLinesFor(field), "    "))
 		source.extend([
 			"  except common.VOTableError:",
@@ -64,10 +73,18 @@ def buildCodec(source, env):
 	return utils.compileFunction(source, "codec", useGlobals=ns)
 
 
-def buildEncoder(tableDefinition, encoderModule):
+def buildEncoder(tableDefinition, encoderModule, mappers=None):
+	"""returns a function encoding rows of tableDefinition with encoderModule.
+
+	See getRowEncoderSource for what mappers is.
+	"""
+	env = encoderModule.getGlobals(tableDefinition).copy()
+	if mappers:
+		env.update(("map%d"%index, mapper)
+			for index, mapper in enumerate(mappers))
 	return buildCodec(
-		getRowEncoderSource(tableDefinition, encoderModule),
-		encoderModule.getGlobals(tableDefinition))
+		getRowEncoderSource(tableDefinition, encoderModule, mappers),
+		env)
 
 
 def buildDecoder(tableDefinition, decoderModule):
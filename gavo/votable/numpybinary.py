@@ -0,0 +1,244 @@
+"""
+Vectorised decoding of BINARY and BINARY2 data using numpy.
+
+When all fields of a table have a fixed width, all records in a BINARY
+or BINARY2 stream have the same length, and we can map whole blocks of
+them onto a numpy record array in one go rather than have the
+generated decoders from dec_binary and dec_binary2 pick them apart
+value by value.  NULL detection (BINARY2 flags, nullvalues, NaNs)
+is done on whole columns, too.
+
+numpy is optional for the votable library; check isApplicable before
+using anything else from here.
+"""
+
+#c Copyright 2008-2017, the GAVO project
+#c
+#c This program is free software, covered by the GNU GPL.  See the
+#c COPYING file in the source distribution.
+
+
+try:
+	import numpy
+except ImportError:
+	# keep numpy optional
+	numpy = None
+
+from gavo.votable import coding
+from gavo.votable import common
+from gavo.votable.model import VOTable
+
+
+# map from VOTable datatypes to numpy type designators for their
+# (big-endian) BINARY representation.
+_numericTypes = {
+	"unsignedByte": "u1",
+	"short": ">i2",
+	"int": ">i4",
+	"long": ">i8",
+	"float": ">f4",
+	"double": ">f8",
+	"floatComplex": ">c8",
+	"doubleComplex": ">c16",
+}
+
+# map from VOTable string datatypes to the bytes per character
+_charWidths = {
+	"char": 1,
+	"unicodeChar": 2,
+}
+
+_floatTypes = frozenset(["float", "double"])
+_complexTypes = frozenset(["floatComplex", "doubleComplex"])
+
+
+def _isFixedWidth(field):
+	"""returns True if field always takes up the same number of bytes in
+	BINARY and we know how to map it to numpy.
+	"""
+	if field.datatype not in _numericTypes and field.datatype not in _charWidths:
+		return False
+	if field.hasVarLength():
+		return False
+	try:
+		return field.getLength()>0
+	except ValueError: # bad arraysize; let the normal decoders complain
+		return False
+
+
+def isApplicable(tableDefinition):
+	"""returns True if BINARY(2) data for the VOTable.TABLE instance
+	tableDefinition can be decoded by a RecordDecoder.
+	"""
+	if numpy is None:
+		return False
+	fields = list(tableDefinition.iterChildrenOfType(VOTable.FIELD))
+	return bool(fields) and all(_isFixedWidth(f) for f in fields)
+
+
+class RecordDecoder(object):
+	"""a decoder for blocks of BINARY or BINARY2 records.
+
+	Construct it with a VOTable.TABLE instance for which isApplicable
+	returns True and a flag whether the records are preceded by BINARY2
+	NULL flags.
+
+	getRecords turns a string of records into a numpy record array.  It
+	has one field per VOTable FIELD, named as in votable.makeDtype;
+	for BINARY2, there is an additional first field _nullFlags with
+	the raw NULL flag bytes.  Values in there are just as in the
+	stream; use getNullMask to figure out which ones are NULL, or
+	getRows to obtain rows as the classic decoders return them.
+	"""
+	def __init__(self, tableDefinition, hasNullFlags):
+		# simple imports the parser, which imports us; hence, import it here.
+		from gavo.votable import simple
+
+		self.fields = list(tableDefinition.iterChildrenOfType(VOTable.FIELD))
+		self.names = [d[0] for d in simple.makeDtype(self.fields)]
+		self.hasNullFlags = hasNullFlags
+
+		dtype = []
+		if hasNullFlags:
+			dtype.append(("_nullFlags", "u1", ((len(self.fields)+7)/8,)))
+		for name, field in zip(self.names, self.fields):
+			if field.datatype in _charWidths:
+				dtype.append((name,
+					"S%d"%(_charWidths[field.datatype]*field.getLength())))
+			elif field.isScalar():
+				dtype.append((name, _numericTypes[field.datatype]))
+			else:
+				dtype.append((name, _numericTypes[field.datatype],
+					(field.getLength(),)))
+		self.dtype = numpy.dtype(dtype)
+		self.recordSize = self.dtype.itemsize
+
+		self.nullvalues = [self._getNullvalue(f) for f in self.fields]
+
+	def _getNullvalue(self, field):
+		"""returns the python value signifying NULL for field, or None.
+
+		As in dec_binary, only NaNs are NULL for floating point types.
+		"""
+		if field.datatype in _charWidths:
+			return coding.getNullvalue(field, repr)
+		elif field.datatype in _floatTypes or field.datatype in _complexTypes:
+			return None
+		else:
+			nullvalue = coding.getNullvalue(field, int)
+			if nullvalue is not None:
+				nullvalue = int(nullvalue)
+			return nullvalue
+
+	def getRecords(self, data):
+		"""returns a numpy record array for the records in the string data.
+
+		data must contain a whole number of records.
+		"""
+		return numpy.frombuffer(data, dtype=self.dtype)
+
+	def _getFlaggedNulls(self, records):
+		"""returns a boolean array of shape (len(records), len(self.fields))
+		that is True where BINARY2 NULL flags are set.
+		"""
+		return numpy.unpackbits(records["_nullFlags"], axis=1
+			)[:,:len(self.fields)].astype(bool)
+
+	def _getValueNulls(self, column, index):
+		"""returns a boolean array flagging NULLs in the numeric column
+		for the index-th field.
+
+		For array-valued fields, NULL array elements are flagged.
+		"""
+		datatype, nullvalue = self.fields[index].datatype, self.nullvalues[index]
+		if datatype in _floatTypes:
+			return numpy.isnan(column)
+		elif datatype in _complexTypes:
+			return numpy.isnan(column.real)|numpy.isnan(column.imag)
+		elif nullvalue is not None:
+			return column==nullvalue
+		else:
+			return numpy.zeros(column.shape, dtype=bool)
+
+	def _getStrings(self, records, index):
+		"""returns a list of python strings for the index-th field.
+
+		We don't let numpy convert the strings, as it would strip trailing
+		nul characters.
+		"""
+		column = records[self.names[index]]
+		width = column.dtype.itemsize
+		raw = column.tostring()
+		vals = [raw[offset:offset+width]
+			for offset in xrange(0, len(raw), width)]
+
+		if self.fields[index].datatype=="unicodeChar":
+			try:
+				vals = [v.decode("utf-16be") for v in vals]
+			except UnicodeDecodeError, ex:
+				raise common.BadVOTableLiteral("unicodeChar", ex.object)
+		return vals
+
+	def _getColumnValues(self, records, index):
+		"""returns a list of python values for the index-th field, with
+		NULL values replaced by None.
+
+		BINARY2 NULL flags are not taken into account here.
+		"""
+		field = self.fields[index]
+		if field.datatype in _charWidths:
+			vals = self._getStrings(records, index)
+			nullvalue = self.nullvalues[index]
+			if nullvalue is not None:
+				vals = [None if v==nullvalue else v for v in vals]
+			return vals
+
+		column = records[self.names[index]]
+		vals = column.tolist()
+		nulls = self._getValueNulls(column, index)
+		if field.isScalar():
+			for rowIndex in numpy.flatnonzero(nulls):
+				vals[rowIndex] = None
+		else:
+			for rowIndex, elIndex in zip(*numpy.nonzero(nulls)):
+				vals[rowIndex][elIndex] = None
+		return vals
+
+	def getNullMask(self, records):
+		"""returns a boolean array of shape (len(records), len(self.fields))
+		that is True where a value is NULL.
+
+		This is a combination of the BINARY2 NULL flags and, for scalar
+		fields and strings, nullvalues and NaNs.  NULL elements in arrays
+		are not reflected here.
+		"""
+		if self.hasNullFlags:
+			nulls = self._getFlaggedNulls(records)
+		else:
+			nulls = numpy.zeros((len(records), len(self.fields)), dtype=bool)
+
+		for index, field in enumerate(self.fields):
+			if field.datatype in _charWidths:
+				nullvalue = self.nullvalues[index]
+				if nullvalue is not None:
+					nulls[:,index] |= numpy.array(
+						[v==nullvalue for v in self._getStrings(records, index)],
+						dtype=bool)
+			elif field.isScalar():
+				nulls[:,index] |= self._getValueNulls(
+					records[self.names[index]], index)
+		return nulls
+
+	def getRows(self, records):
+		"""returns a list of rows, each a list of python values, for records.
+
+		These are the same rows the dec_binary(2) decoders would produce.
+		"""
+		rows = map(list, zip(*[self._getColumnValues(records, index)
+			for index in range(len(self.fields))]))
+
+		if self.hasNullFlags:
+			for rowIndex, fieldIndex in zip(
+					*numpy.nonzero(self._getFlaggedNulls(records))):
+				rows[rowIndex][fieldIndex] = None
+		return rows
@@ -16,6 +16,7 @@ from gavo.votable import common
 from gavo.votable import dec_binary
 from gavo.votable import dec_binary2
 from gavo.votable import dec_tabledata
+from gavo.votable import numpybinary
 
 
 class DataIterator(object):
@@ -165,11 +166,45 @@ class _StreamData(object):
 		self.lastRes = self.curChunk[self.fPos:self.fPos+nBytes]
 		self.fPos += nBytes
 		return self.lastRes
+
+	def readRecords(self, recordSize, nBytes):
+		"""returns a string containing as many complete records of recordSize
+		bytes as fit into nBytes (but at least one).
+
+		At the end of the stream, an empty string is returned.  If the
+		stream ends with an incomplete record, an IOError is raised.
+		"""
+		nBytes = max(nBytes, recordSize)
+		while not self._eof and len(self.curChunk)-self.fPos<nBytes:
+			self._fillBuffer(nBytes)
+
+		available = min(len(self.curChunk)-self.fPos, nBytes)
+		if 0<available<recordSize:
+			raise IOError("Incomplete record at end of stream")
+		end = self.fPos+available-available%recordSize
+		self.lastRes = self.curChunk[self.fPos:end]
+		self.fPos = end
+		return self.lastRes
 	
 	def atEnd(self):
 		return self._eof and self.fPos==len(self.curChunk)
 
 
+def _openStream(nodeIterator):
+	"""returns a _StreamData instance for the base64-encoded STREAM element
+	that must come next in nodeIterator.
+	"""
+	for type, tag, payload in nodeIterator:
+		if type!="data":
+			break
+	if not (type=="start" 
+			and tag=="STREAM"
+			and payload.get("encoding")=="base64"):
+		raise common.VOTableError("Can only read BINARY data from base64"
+			" encoded streams")
+	return _StreamData(nodeIterator)
+
+
 class BinaryIteratorBase(DataIterator):
 	"""A base class used by Rows to actually iterate over rows
 	in BINARY(2) serialization.
@@ -181,16 +216,7 @@ class BinaryIteratorBase(DataIterator):
 	# I need to override __iter__ since we're not actually doing XML parsing
 	# here; almost all of our work is done within the stream element.
 	def __iter__(self):
-		for type, tag, payload in self.nodeIterator:
-			if type!="data":
-				break
-		if not (type=="start" 
-				and tag=="STREAM"
-				and payload.get("encoding")=="base64"):
-			raise common.VOTableError("Can only read BINARY data from base64"
-				" encoded streams")
-		
-		inF = _StreamData(self.nodeIterator)
+		inF = _openStream(self.nodeIterator)
 		while not inF.atEnd():
 			row = self._decodeRawRow(inF)
 			if row is not None:
@@ -205,15 +231,65 @@ class Binary2Iterator(BinaryIteratorBase):
 	decoderModule = dec_binary2
 
 
+class NumpyBinaryIterator(object):
+	"""An internal class used by Rows to iterate over rows in BINARY(2)
+	serialization when all fields have a fixed width.
+
+	This decodes blocks of about blockBytes bytes at a time using
+	numpybinary.RecordDecoder.  Construct it with hasNullFlags=True
+	for BINARY2.
+	"""
+	blockBytes = 2**20
+
+	def __init__(self, tableDefinition, nodeIterator, hasNullFlags):
+		self.nodeIterator = nodeIterator
+		self.decoder = numpybinary.RecordDecoder(tableDefinition, hasNullFlags)
+	
+	def _iterRecords(self):
+		inF = _openStream(self.nodeIterator)
+		while True:
+			data = inF.readRecords(self.decoder.recordSize, self.blockBytes)
+			if not data:
+				break
+			yield self.decoder.getRecords(data)
+
+	def iterBlocks(self):
+		"""iterates over pairs of (records, nullMask) for blocks of rows.
+
+		See numpybinary.RecordDecoder's getRecords and getNullMask for what
+		these are.
+		"""
+		for records in self._iterRecords():
+			yield records, self.decoder.getNullMask(records)
+
+	def __iter__(self):
+		for records in self._iterRecords():
+			for row in self.decoder.getRows(records):
+				yield row
+
+
+def _makeBinaryIterator(elementName, tableDefinition, nodeIterator):
+	"""returns an iterable over the rows in a BINARY or BINARY2 element.
+
+	Where possible, this is a NumpyBinaryIterator.
+	"""
+	if numpybinary.isApplicable(tableDefinition):
+		return NumpyBinaryIterator(tableDefinition, nodeIterator,
+			elementName=='BINARY2')
+	elif elementName=='BINARY':
+		return BinaryIterator(tableDefinition, nodeIterator)
+	else:
+		return Binary2Iterator(tableDefinition, nodeIterator)
+
+
 def _makeTableIterator(elementName, tableDefinition, nodeIterator):
 	"""returns an iterator for the rows contained within node.
 	"""
 	if elementName=='TABLEDATA':
 		return iter(TableDataIterator(tableDefinition, nodeIterator))
-	elif elementName=='BINARY':
-		return iter(BinaryIterator(tableDefinition, nodeIterator))
-	elif elementName=='BINARY2':
-		return iter(Binary2Iterator(tableDefinition, nodeIterator))
+	elif elementName=='BINARY' or elementName=='BINARY2':
+		return iter(_makeBinaryIterator(
+			elementName, tableDefinition, nodeIterator))
 
 	else:
 		raise common.VOTableError("Unknown table serialization: %s"%
@@ -230,15 +306,55 @@ class Rows(object):
 
 	In reality, __iter__ just dispatches to the various deserializers.
 	"""
+	_serialization = None
+
 	def __init__(self, tableDefinition, nodeIterator):
 		self.tableDefinition, self.nodeIterator = tableDefinition, nodeIterator
 	
+	def _getSerialization(self):
+		"""returns the name of the element containing the table data.
+
+		Since this consumes the element's start event, the result is
+		cached.
+		"""
+		if self._serialization is None:
+			for type, tag, payload in self.nodeIterator:
+				if type=="data": # ignore whitespace (or other stuff...)
+					pass
+				elif tag=="INFO":
+					pass   # XXX TODO: What do we do with those INFOs?
+				else:
+					self._serialization = tag
+					break
+		return self._serialization
+
 	def __iter__(self):
-		for type, tag, payload in self.nodeIterator:
-			if type=="data": # ignore whitespace (or other stuff...)
-				pass
-			elif tag=="INFO":
-				pass   # XXX TODO: What do we do with those INFOs?
-			else:
-				return _makeTableIterator(tag, 
-					self.tableDefinition, self.nodeIterator)
+		return _makeTableIterator(self._getSerialization(), 
+			self.tableDefinition, self.nodeIterator)
+
+	def canIterBlocks(self):
+		"""returns True if iterBlocks will work for this table.
+
+		You can still iterate over the rows normally if this returns False.
+		"""
+		return (self._getSerialization() in ('BINARY', 'BINARY2')
+			and numpybinary.isApplicable(self.tableDefinition))
+
+	def iterBlocks(self):
+		"""iterates over (records, nullMask) pairs for blocks of rows.
+
+		records is a numpy record array, nullMask a boolean array with
+		a row for each record and a column for each field (see 
+		numpybinary.RecordDecoder).
+
+		This only works for BINARY and BINARY2 data in tables in which all
+		fields have a fixed width, and numpy must be available.  In other
+		cases, a VOTableError is raised.
+		"""
+		elementName = self._getSerialization()
+		if not self.canIterBlocks():
+			raise common.VOTableError("Cannot decode %s data in blocks"%
+				elementName, hint="Block decoding needs numpy, BINARY or BINARY2"
+				" serialization, and fixed-width fields only.")
+		return NumpyBinaryIterator(self.tableDefinition, self.nodeIterator,
+			elementName=='BINARY2').iterBlocks()
@@ -64,12 +64,17 @@ class OverflowElement(stanxml.Stub):
 	material to be inserted when exactly row limit (or more) rows
 	have been written to the table.
 
+	If the table knows whether it overflowed when it has been written, 
+	pass a function returning that as isOverflowed; it is used instead of 
+	comparing the number of rows with the limit.
+
 	All automatic namespace processing is turned off for the overflow
 	element.  This should not be a problem if you're embedding VOTable
 	elements into VOTables.
 	"""
-	def __init__(self, rowLimit, overflowStan):
+	def __init__(self, rowLimit, overflowStan, isOverflowed=None):
 		self.rowLimit, self.overflowStan = rowLimit, overflowStan
+		self.isOverflowed = isOverflowed
 		self.rowsDelivered = None
 		# disable namespace generation for write (ugly; fix this when
 		# we've improved XML generation in xmlstan)
@@ -82,12 +87,16 @@ class OverflowElement(stanxml.Stub):
 		self.rowsDelivered = numRows
 	
 	def write(self, outputFile):
-		if self.rowLimit<=self.rowsDelivered:
+		if self.isOverflowed is None:
+			overflowed = self.rowLimit<=self.rowsDelivered
+		else:
+			overflowed = self.isOverflowed()
+		if overflowed:
 			write(self.overflowStan, outputFile, xmlDecl=False)
 
 
 def DelayedTable(tableDefinition, rowIterator, contentElement,
-		overflowElement=None, **attrs):
+		overflowElement=None, mappers=None, **attrs):
 	"""returns tableDefinition such that when serialized, it contains
 	the data from rowIterator 
 
@@ -97,12 +106,17 @@ def DelayedTable(tableDefinition, rowIterator, contentElement,
 
 	See the OverflowElement class for overflowElement.
 
+	mappers, if given, is a sequence of functions applied to the
+	respective values of the rows before encoding; they are compiled
+	into the row encoder (see coding.getRowEncoderSource).
+
 	attrs are optional attributes to the content element.
 	"""
 	if contentElement not in _encoders:
 		raise common.VOTableError("Unsupported content element %s"%contentElement,
 			hint="Try something like TABLEDATA or BINARY")
-	encodeRow = coding.buildEncoder(tableDefinition, _encoders[contentElement])
+	encodeRow = coding.buildEncoder(tableDefinition, _encoders[contentElement],
+		mappers)
 
 	def iterSerialized():
 		numRows = 0
@@ -3,6 +3,9 @@ A simple caching system for nevow pages.
 
 The basic idea is to monkeypatch the request object in order to
 snarf content and headers.
+
+Cached pages keep both the plain and a gzip-compressed body so that
+cache hits never need to compress.
 """
 
 #c Copyright 2008-2017, the GAVO project
@@ -11,11 +14,15 @@ snarf content and headers.
 #c COPYING file in the source distribution.
 
 
+import gzip
+import hashlib
 import time
+from cStringIO import StringIO
 
 from nevow import compression
 from nevow import inevow
 from nevow import rend
+from twisted.web import http
 
 from gavo import utils
 
@@ -25,10 +32,8 @@ def instrumentRequestForCaching(request, finishAction):
 	the content written for a successful page render.
 	"""
 	request = inevow.IRequest(request)
-	# For now, we don't cache compressed responses
-	if isinstance(request, compression.CompressingRequestWrapper):
-		return
-
+	# with compressing requests, we patch the wrapper and hence
+	# see the uncompressed content.
 	builder = CacheItemBuilder(finishAction)
 	origWrite, origFinishRequest = request.write, request.finishRequest
 
@@ -63,16 +68,56 @@ class CacheItemBuilder(object):
 			self.finishAction(request, "".join(self.contentBuffer))
 
 
+def _gzipContent(content):
+	"""returns content gzip-compressed, or None if compression does not
+	make content smaller.
+	"""
+	buf = StringIO()
+	f = gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6, mtime=0)
+	f.write(content)
+	f.close()
+	res = buf.getvalue()
+	if len(res)<len(content):
+		return res
+	return None
+
+
+def _acceptsGzip(request):
+	"""returns true if request says its client can deal with gzip-encoded
+	responses.
+	"""
+	return compression.parseAcceptEncoding(
+		request.getHeader("accept-encoding") or "").get("gzip", 0)>0
+
+
 class CachedPage(rend.Page):
+	"""a page kept in memory.
+
+	We keep the content both as is and gzip-compressed and deliver
+	the compressed variant to clients that accept it.  The variants have
+	different ETags.
+	"""
 	def __init__(self, content, headers, lastModified):
 		self.content = content
+		self.gzipContent = _gzipContent(content)
+		self.etag = hashlib.md5(content).hexdigest()
 		self.creationStamp = time.time()
 		headers["x-cache-creation"] = str(self.creationStamp)
 		self.changeStamp = self.lastModified = lastModified
-		if "last-modified" in headers:
-			del headers["last-modified"]
+		headers = dict(headers)
+		for name in ["last-modified", "content-length", "content-encoding",
+				"etag"]:
+			if name in headers:
+				del headers[name]
 		self.headers = headers.items()
 
+	def getSize(self):
+		"""returns an estimate of the number of bytes this page occupies.
+		"""
+		return (len(self.content)
+			+len(self.gzipContent or "")
+			+sum(len(k)+len(v) for k, v in self.headers))
+
 	def renderHTTP(self, ctx):
 		request = inevow.IRequest(ctx)
 		if self.lastModified:
@@ -80,7 +125,21 @@ class CachedPage(rend.Page):
 		for key, value in self.headers:
 			request.setHeader(key, value)
 		request.setHeader('date', utils.formatRFC2616Date())
-		return self.content
+
+		content, etag = self.content, self.etag
+		if self.gzipContent is not None:
+			request.setHeader("vary", "Accept-Encoding")
+			if _acceptsGzip(request):
+				request.setHeader("content-encoding", "gzip")
+				content, etag = self.gzipContent, self.etag+"-gz"
+
+		etag = '"%s"'%etag
+		request.setHeader("etag", etag)
+		if etag in (request.getHeader("if-none-match") or ""):
+			request.setResponseCode(http.NOT_MODIFIED)
+			return ''
+		request.setHeader("content-length", str(len(content)))
+		return content
 
 
 def enterIntoCacheAs(key, destDict):
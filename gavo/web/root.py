@@ -16,7 +16,6 @@ from twisted.python import threadable
 threadable.init()
 
 from nevow import appserver
-from nevow import compression
 from nevow import inevow
 from nevow import rend
 from nevow import tags as T
@@ -83,11 +82,17 @@ def _authorizeCORS(request):
 		request.setHeader("Access-Control-Allow-Origin", origin)
 		
 	
+def _makePageCache(rdId):
+	return base.caches.LRUCache(name="pages of "+rdId,
+		ttl=base.getConfig("web", "pageCacheTTL") or None,
+		sizeOf=lambda page: page.getSize())
+
 # A cache for RD-specific page caches.  Each of these maps segments
 # (tuples) to a finished text document.  The argument is the id of the
 # RD responsible for generating that data.  This ensures that pre-computed
-# data is cleared when the RD is reloaded.
-base.caches.makeCache("getPageCache", lambda rdId: {})
+# data is cleared when the RD is reloaded.  The page caches themselves
+# are LRUCaches and hence count against [web]cacheMemoryLimit.
+base.caches.makeCache("getPageCache", _makePageCache)
 
 
 class ArchiveService(rend.Page):
@@ -184,8 +189,9 @@ class ArchiveService(rend.Page):
 		
 		cache = base.caches.getPageCache(service.rd.sourceId)
 		segments = tuple(segments)
-		if segments in cache:
-			return compression.CompressingResourceWrapper(cache[segments])
+		cachedPage = cache.get(segments)
+		if cachedPage is not None:
+			return cachedPage
 
 		caching.instrumentRequestForCaching(request,
 			caching.enterIntoCacheAs(segments, cache))
@@ -18,6 +18,7 @@ from nevow import rend
 from twisted.internet import threads
 
 from gavo import base
+from gavo import formats
 from gavo import svcs
 from gavo import utils
 from gavo.protocols import tap
@@ -36,16 +37,54 @@ def getTAPVersion():
 	return base.caches.getRD(tap.RD_ID).getProperty("TAP_VERSION")
 
 
+# the request arguments passed to taprunner.prepareSyncQuery
+_DIRECT_SYNC_PARAMETERS = frozenset(["request", "lang", "query",
+	"maxrec", "format", "version"])
+
+
 class TAPQueryResource(rend.Page):
 	"""the resource executing sync TAP queries.
 
-	While not really going through UWS, this does create a UWS job and
-	tears it down later.
+	Unless [async]directSyncTAP is off, queries without uploads are run
+	directly and their results streamed out as they come from the
+	database.  Other queries, while not really going through UWS, create
+	a UWS job that is torn down after the result is delivered.
 	"""
 	def __init__(self, service, ctx):
 		self.service = service
 		rend.Page.__init__(self)
 
+	def _canStreamDirectly(self, request):
+		return (base.getConfig("async", "directSyncTAP")
+			and not any(request.args.get("upload", [])))
+
+	def _prepareDirect(self, ctx):
+		# this is what uws.UWSJob._setParamsFromDict would make of
+		# the arguments
+		parameters = {}
+		for key, value in inevow.IRequest(ctx).args.iteritems():
+			if key in _DIRECT_SYNC_PARAMETERS and " ".join(value):
+				parameters[key] = " ".join(value)
+
+		format, data = taprunner.prepareSyncQuery(parameters)
+		return (format, parameters.get("format")), data
+
+	def _streamDirect(self, res, ctx):
+		request = inevow.IRequest(ctx)
+		(format, rawFormat), data = res
+
+		def writeTable(outputFile):
+			taprunner.writeResultCached(format, data, outputFile)
+
+		request.setHeader("content-type", 
+			str(formats.getMIMEFor(format, rawFormat)))
+		# if request has an accumulator, we're testing.
+		if hasattr(request, "accumulator"):
+			writeTable(request)
+			return ""
+		else:
+			return streaming.streamOut(writeTable, request)
+
 	def _doRender(self, ctx):
 		jobId = tap.WORKER_SYSTEM.getNewIdFromRequest(
 			inevow.IRequest(ctx), self.service)
@@ -78,6 +117,11 @@ class TAPQueryResource(rend.Page):
 			tap.WORKER_SYSTEM.destroy(jobId)
 
 	def renderHTTP(self, ctx):
+		if self._canStreamDirectly(inevow.IRequest(ctx)):
+			return threads.deferToThread(self._prepareDirect, ctx
+				).addCallback(self._streamDirect, ctx
+				).addErrback(self._formatError)
+
 		try:
 			return threads.deferToThread(self._doRender, ctx
 				).addCallback(self._formatResult, ctx
@@ -144,6 +144,9 @@ class DALRenderer(grend.ServiceBasedPage):
 #					" this service: %s"%self.version)
 
 		dali.mangleUploads(request)
+		if "RESPONSEFORMAT" not in request.args:
+			# our VOTable output can deal with streamed core results
+			queryMeta["canStream"] = True
 		return self.runService(request.args, queryMeta
 			).addCallback(self._formatOutput, ctx)
 
@@ -195,7 +198,20 @@ class DALRenderer(grend.ServiceBasedPage):
 			request.setHeader('content-disposition', 
 				'attachment; filename="votable.xml"')
 			request.setHeader("content-type", self.resultType)
-			return streaming.streamVOTable(request, data)
+
+			contextOpts = {}
+			table = data.original.getPrimaryTable()
+			if getattr(table, "matchLimit", None) is not None:
+				# a streamed result; whether it overflowed is only known at its end.
+				contextOpts["overflowElement"] = votable.OverflowElement(
+					table.matchLimit, 
+					V.INFO(name="QUERY_STATUS", value="OVERFLOW"),
+					isOverflowed=lambda: base.getMetaText(
+						table, "_queryStatus")=="Overflowed")
+				# the table has a database connection of its own; make sure
+				# it is closed even if the client hangs up before the end.
+				contextOpts["cleanup"] = table.cleanup
+			return streaming.streamVOTable(request, data, **contextOpts)
 
 	def _handleRandomFailure(self, failure, ctx):
 		if base.DEBUG:
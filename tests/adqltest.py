@@ -1924,6 +1924,17 @@ class GlueTest(testhelpers.VerboseTest):
 		self.assertEqual(td.columns[0].values.nullLiteral, "-32768")
 
 
+	def testNormalizeQuery(self):
+		self.assertEqual(adqlglue._normalizeQuery(
+			"  SELECT  *\n FROM x WHERE a='b  c' AND \"q  r\"=1 "),
+			"SELECT * FROM x WHERE a='b  c' AND \"q  r\"=1")
+
+	def testNormalizeQueryWithComment(self):
+		self.assertEqual(adqlglue._normalizeQuery(
+			"SELECT * -- x\nFROM  y\n"),
+			"SELECT * -- x\nFROM  y")
+
+
 class QueryTest(testhelpers.VerboseTest):
 	"""performs some actual queries to test the whole thing.
 	"""
@@ -1944,6 +1955,17 @@ class QueryTest(testhelpers.VerboseTest):
 	def runQuery(self, query, **kwargs):
 		return adqlglue.query(self.querier, query, **kwargs)
 
+	def testMorphCached(self):
+		query = "select alpha from %s where mag<0"%self.tableName
+		stats = adqlglue._getMorphCache().getStats()
+		pg1, table1 = adqlglue.morphADQL(query)
+		pg2, table2 = adqlglue.morphADQL("  "+query.replace(" ", "\n"))
+		self.assertEqual(pg1, pg2)
+		self.failIf(table1 is table2)
+		self.failUnless(table1.tableDef is table2.tableDef)
+		self.assertEqual(
+			adqlglue._getMorphCache().getStats()["hits"], stats["hits"]+1)
+
 	def testPlainSelect(self):
 		res = self.runQuery(
 			"select alpha, delta from %s where mag<0"%
@@ -12,6 +12,8 @@ import contextlib
 import datetime
 import os
 import sys
+import threading
+import time
 import unittest
 
 import numpy
@@ -153,6 +155,82 @@ class ConnectionsTest(testhelpers.VerboseTest):
 			self.assertEqual(list(cursor)[0][0], prevVal)
 			cursor.close()
 
+	def testRuntimeValuesTracked(self):
+		conn = base.getDBConnection("trustedquery")
+		try:
+			settings = [("enable_seqscan", False), ("statement_timeout", 2000)]
+			self.assertEqual(set(conn.setRuntimeValues(settings)),
+				set(["enable_seqscan", "statement_timeout"]))
+			self.assertEqual(list(conn.query("SELECT"
+				" current_setting('enable_seqscan'),"
+				" current_setting('statement_timeout')")),
+				[("off", "2s")])
+
+			self.assertEqual(conn.setRuntimeValues(settings), {})
+			self.assertEqual(conn.setRuntimeValues(
+				[("enable_seqscan", True), ("statement_timeout", 2000)]),
+				{"enable_seqscan": "off"})
+
+			conn.rollback()
+			self.assertEqual(len(conn.setRuntimeValues(settings)), 2)
+		finally:
+			conn.close()
+
+
+class ConnectionPoolTest(testhelpers.VerboseTest):
+	def setUp(self):
+		self.pool = sqlsupport.CustomConnectionPool(0, 1, "trustedquery")
+		self.pool.waitTimeout = 0.2
+
+	def tearDown(self):
+		self.pool.closeall()
+
+	def testTimeout(self):
+		conn = self.pool.getconn()
+		self.assertRaisesWithMsg(sqlsupport.psycopg2.pool.PoolError,
+			"No trustedquery connection became available within 0.2 seconds",
+			self.pool.getconn,
+			())
+		self.pool.putconn(conn)
+		self.assertEqual(self.pool.getStats()["timeouts"], 1)
+
+	def testWaiting(self):
+		conn = self.pool.getconn()
+		self.pool.waitTimeout = 10
+		returner = threading.Timer(0.1, self.pool.putconn, (conn,))
+		returner.start()
+		self.assertTrue(self.pool.getconn() is conn)
+		returner.join()
+		stats = self.pool.getStats()
+		self.assertEqual(stats["inUse"], 1)
+		self.assertEqual(stats["connects"], 1)
+		self.assertEqual(sum(count for _, count in stats["waitHistogram"]), 2)
+
+	def testRecycling(self):
+		self.pool.minconn, self.pool.maxUses = 1, 1
+		conn = self.pool.getconn()
+		self.pool.putconn(conn)
+		self.assertTrue(conn.closed)
+		newConn = self.pool.getconn()
+		self.assertFalse(newConn is conn)
+		self.pool.putconn(newConn)
+		self.assertEqual(self.pool.getStats()["recycled"], 2)
+
+	def testValidation(self):
+		self.pool.minconn, self.pool.validateAfter = 1, -1
+		conn = self.pool.getconn()
+		self.pool.putconn(conn)
+		with base.getTableConn() as otherConn:
+			list(otherConn.query("SELECT pg_terminate_backend(%(pid)s)",
+				{"pid": conn.get_backend_pid()}))
+		time.sleep(0.1)
+
+		newConn = self.pool.getconn()
+		self.assertFalse(newConn is conn)
+		self.assertEqual(list(newConn.query("SELECT 1")), [(1,)])
+		self.pool.putconn(newConn)
+		self.assertEqual(self.pool.getStats()["unhealthy"], 1)
+
 
 @contextlib.contextmanager
 def digestedTable(connection, name, columns, values):
@@ -400,6 +478,23 @@ class TestMetaTableADQL(TestWithTableCreation):
 		self.assertEqual(srcRd.split("/")[-1], 'test')
 		self.assertEqual(adql, True)
 
+	def testIndexNotified(self):
+		mth = rsc.MetaTableHandler()
+		try:
+			self.assertEqual(
+				mth.getTableDefForTable("test.adqltable").id, "adqltable")
+			self.failUnless("test.adqltable" in mth.getTAPTables())
+
+			self.table.cleanFromMeta()
+			self.conn.commit()
+			# give postgres a moment to deliver the notification
+			time.sleep(0.2)
+			self.failIf("test.adqltable" in mth.getTAPTables())
+		finally:
+			self.table.addToMeta()
+			self.conn.commit()
+			mth.close()
+
 
 class TestPgSphere(testhelpers.VerboseTest):
 	"""tests for the python interface to pgsphere.
@@ -444,6 +539,58 @@ class TestPgSphere(testhelpers.VerboseTest):
 			pgsphere.SMoc.fromASCII('29/2-5,20-29,123,444,17-21,33-39,332-339,0-1'))
 	
 
+class CopyFeederTest(testhelpers.VerboseTest):
+	resources = [("conn", tresc.dbConnection)]
+
+	def _getTable(self, columns, create=True):
+		td = base.parseFromString(rscdef.TableDef, 
+			'<table id="copytest" onDisk="True" temporary="True">%s</table>'
+			%columns)
+		return rsc.TableForDef(td, connection=self.conn, create=create)
+
+	def testRoundtrip(self):
+		table = self._getTable('<column name="a" type="integer"/>'
+			'<column name="b" type="unicode"/><column name="c" type="timestamp"/>'
+			'<column name="d" type="double precision[]"/>')
+		rows = [
+			{"a": 1, "b": u"\xe4rger", "c": datetime.datetime(2017, 10, 3, 12),
+				"d": [1.5, None]},
+			{"a": None, "b": None, "c": None, "d": None}]
+		try:
+			with table.getFeeder(bulkCopy=True) as feeder:
+				self.assertEqual(feeder.__class__.__name__, "_CopyFeeder")
+				for row in rows:
+					feeder.add(row)
+			self.assertEqual(feeder.getAffected(), 2)
+			self.assertEqual(list(table.iterQuery(table.tableDef, "")), rows)
+		finally:
+			self.conn.rollback()
+
+	def testFallback(self):
+		table = self._getTable('<column name="a" type="spoint"/>')
+		try:
+			with testhelpers.messageCollector() as msgs:
+				feeder = table.getFeeder(bulkCopy=True)
+			self.assertEqual(feeder.__class__.__name__, "_Feeder")
+			self.assertEqual(msgs.events[0][1][0], "Not using COPY to feed copytest:"
+				" cannot serialise column a (type spoint)")
+		finally:
+			self.conn.rollback()
+
+	def testRawFallback(self):
+		# there's no raw type in postgres, so don't create the table
+		table = self._getTable('<column name="a" type="integer"/>'
+			'<column name="b" type="raw"/>', create=False)
+		try:
+			with testhelpers.messageCollector() as msgs:
+				feeder = table.getFeeder(bulkCopy=True)
+			self.assertEqual(feeder.__class__.__name__, "_Feeder")
+			self.assertEqual(msgs.events[0][1][0], "Not using COPY to feed copytest:"
+				" cannot serialise column b (type raw)")
+		finally:
+			self.conn.rollback()
+
+
 class TestWithDataImport(testhelpers.VerboseTest):
 	"""base class for tests importing data up front.
 
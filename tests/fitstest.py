@@ -283,6 +283,29 @@ class ScalingTest(testhelpers.VerboseTest):
 		self.assertEqual(len(pixelRows[0]), 2)
 		self.assertEqual(int(pixelRows[0][-1]), 8621)
 
+	def _assertLikeScaledRows(self, scaled, factor):
+		expected = list(fitstools.iterScaledRows(open(self._getExFits()), factor))
+		self.assertEqual(scaled.shape, (len(expected), len(expected[0])))
+		for row, expectedRow in zip(scaled, expected):
+			for val, expectedVal in zip(row, expectedRow):
+				self.assertAlmostEqual(val, expectedVal, places=2)
+
+	def testReadScaledImage(self):
+		with open(self._getExFits()) as f:
+			self._assertLikeScaledRows(fitstools.readScaledImage(f, 2), 2)
+
+	def testReadScaledImageSmallBlocks(self):
+		with open(self._getExFits()) as f:
+			self._assertLikeScaledRows(
+				fitstools.readScaledImage(f, destSize=5, blockBytes=10), 5)
+
+	def testReadScaledImageGzipped(self):
+		with open(self._getExFits()) as f:
+			content = f.read()
+		with testhelpers.testFile("ex.fits.gz", content, writeGz=True
+				) as gzName:
+			with open(gzName) as f:
+				self._assertLikeScaledRows(fitstools.readScaledImage(f, 5), 5)
 
 
 class ReadHeaderTest(testhelpers.VerboseTest):
@@ -361,6 +384,60 @@ class FITSCutoutTest(testhelpers.VerboseTest):
 		self.assertEqual(res.header["CRPIX1"], 37.)
 
 
+class DirectCutoutTest(testhelpers.VerboseTest):
+	def setUp(self):
+		self.srcPath = os.path.join(base.getConfig("inputsDir"),
+			"data", "excube.fits")
+		self.origHDU = pyfits.open(self.srcPath, 
+			do_not_scale_image_data=True)[0]
+
+	def _assertSameCutout(self, *cuts):
+		expected = fitstools.cutoutFITS(self.origHDU, *cuts)
+		found = fitstools.DirectCutout(self.srcPath).cutout(*cuts)
+		for axis in range(1, 4):
+			for key in ["NAXIS%d"%axis, "CRPIX%d"%axis]:
+				self.assertEqual(found.header[key], expected.header[key])
+		self.assertEqual(found.data.tolist(), expected.data.tolist())
+		return found
+
+	def testNoCut(self):
+		self._assertSameCutout()
+
+	def testSimpleCutout(self):
+		self._assertSameCutout((1, 2, 3))
+
+	def testMultiCutout(self):
+		self._assertSameCutout((1, 6, 8), (2, 3, 3), (3, 2, 4))
+
+	def testOuterCutout(self):
+		self._assertSameCutout((3, 3, 10000))
+
+	def testNestedCutout(self):
+		cutout = fitstools.cutoutFITS(
+			fitstools.DirectCutout(self.srcPath), (1, 3, 9), (3, 2, 4))
+		cutout = fitstools.cutoutFITS(cutout, (1, 4, 6), (3, 2, 2))
+		expected = fitstools.cutoutFITS(self.origHDU, (1, 6, 8), (3, 3, 3))
+		self.assertEqual(cutout.header["CRPIX1"], expected.header["CRPIX1"])
+		self.assertEqual(cutout.data.tolist(), expected.data.tolist())
+
+	def testSerialisation(self):
+		cutout = self._assertSameCutout((1, 6, 8), (3, 2, 4))
+		serialised = "".join(cutout.iterBytes())
+		self.assertEqual(len(serialised)%fitstools.FITS_BLOCK_SIZE, 0)
+		hdu = pyfits.open(cStringIO.StringIO(serialised),
+			do_not_scale_image_data=True)[0]
+		self.assertEqual(hdu.header["NAXIS1"], 3)
+		self.assertEqual(hdu.data.tolist(), cutout.data.tolist())
+
+	def testCompressedRejected(self):
+		with testhelpers.testFile("compressed.fits.gz", 
+				"\x1f\x8bwhatever") as srcPath:
+			self.assertRaisesWithMsg(fitstools.FITSError,
+				"Cannot cut out directly from compressed FITS files",
+				fitstools.DirectCutout,
+				(srcPath,))
+
+
 class WCSAxisTest(testhelpers.VerboseTest):
 	def testTransformations(self):
 		ax = fitstools.WCSAxis("test", 4, 9, 0.5)
@@ -18,9 +18,12 @@ from numpy import rec
 from gavo.helpers import testhelpers
 
 from gavo import base
+from gavo import utils
 from gavo import votable
 from gavo.utils import pgsphere
 from gavo.votable import common
+from gavo.votable import numpybinary
+from gavo.votable import tableparser
 from gavo.votable import V
 from gavo.utils.plainxml import iterparse
 
@@ -901,6 +904,83 @@ class Binary2RoundtripTest(testhelpers.VerboseTest):
 	]
 
 
+class NumpyBinaryTest(testhelpers.VerboseTest):
+	"""tests for block-wise decoding of fixed-width BINARY(2) data.
+	"""
+	fields = [
+		V.FIELD(name="a", datatype="short")[V.VALUES(null="-1")],
+		V.FIELD(name="b", datatype="double"),
+		V.FIELD(name="c", datatype="char", arraysize="3"),
+		V.FIELD(name="d", datatype="unicodeChar", arraysize="2"),
+		V.FIELD(name="e", datatype="int", arraysize="2"),
+		V.FIELD(name="f", datatype="floatComplex")]
+	rows = [[i%7 or None, i%5 and i/4. or None, "x%02d"%(i%100),
+		u"\xe4%d"%(i%10), [i, -i], i%3 and complex(i, -i) or None]
+		for i in range(2000)]
+
+	def _getVOTable(self, serialization):
+		return votable.asString(V.VOTABLE[V.RESOURCE[votable.DelayedTable(
+			V.TABLE[self.fields], self.rows, serialization)]])
+
+	def _parseWithoutNumpy(self, literal):
+		origNumpy = numpybinary.numpy
+		numpybinary.numpy = None
+		try:
+			return list(votable.parseString(literal).next())
+		finally:
+			numpybinary.numpy = origNumpy
+
+	def _assertLikeGenericDecoder(self, serialization):
+		literal = self._getVOTable(serialization)
+		origBlockBytes = tableparser.NumpyBinaryIterator.blockBytes
+		tableparser.NumpyBinaryIterator.blockBytes = 1000
+		try:
+			res = list(votable.parseString(literal).next())
+		finally:
+			tableparser.NumpyBinaryIterator.blockBytes = origBlockBytes
+		self.assertEqual(res, self._parseWithoutNumpy(literal))
+		self.assertEqual(res[:3], self.rows[:3])
+
+	def testBINARY(self):
+		self._assertLikeGenericDecoder(V.BINARY)
+
+	def testBINARY2(self):
+		self._assertLikeGenericDecoder(V.BINARY2)
+
+	def testBlocks(self):
+		blocks = list(votable.parseString(
+			self._getVOTable(V.BINARY2)).next().iterBlocks())
+		records, nullMask = blocks[0]
+		self.assertEqual(list(records["a"][1:3]), [1, 2])
+		self.assertEqual(list(records["e"][2]), [2, -2])
+		self.assertEqual(nullMask[:3].tolist(), [
+			[True, True, False, False, False, True],
+			[False, False, False, False, False, False],
+			[False, False, False, False, False, False]])
+		self.assertEqual(sum(len(r) for r, _ in blocks), 2000)
+
+	def testNoBlocksForVarLength(self):
+		table = votable.parseString(votable.asString(
+			V.VOTABLE[V.RESOURCE[votable.DelayedTable(
+				V.TABLE[V.FIELD(name="a", datatype="char", arraysize="*")],
+				[["abc"]], V.BINARY)]])).next()
+		self.assertRaisesWithMsg(votable.VOTableError,
+			"Cannot decode BINARY data in blocks",
+			lambda: list(table.iterBlocks()),
+			())
+
+	def testTruncated(self):
+		table = votable.parseString(
+			'<VOTABLE><RESOURCE><TABLE><FIELD datatype="int"/>'
+			'<DATA><BINARY><STREAM encoding="base64">'+
+			"\x00\x00\x00\x01\x00\x00".encode("base64")+
+			'</STREAM></BINARY></DATA></TABLE></RESOURCE></VOTABLE>').next()
+		self.assertRaisesWithMsg(IOError,
+			"Incomplete record at end of stream",
+			list,
+			(table,))
+
+
 class NDArrayTest(testhelpers.VerboseTest):
 	"""tests for the (non-existing) support for multi-D arrays.
 	"""
@@ -1183,6 +1263,32 @@ class StackUnwindingTest(testhelpers.VerboseTest):
 		self.failUnless("</RESOURCE></VOTABLE>" in result)
 
 
+class MappedEncoderTest(testhelpers.VerboseTest):
+	def _getTabledata(self, mappers):
+		return votable.asString(V.VOTABLE[
+			V.RESOURCE(type="results")[
+				votable.DelayedTable(
+					V.TABLE[
+						V.FIELD(name="a", datatype="int"),
+						V.FIELD(name="b", datatype="char", arraysize="*")],
+					[(1, "x"), (2, None)], V.TABLEDATA,
+					mappers=mappers)]])
+
+	def testMappersApplied(self):
+		result = self._getTabledata([lambda v: v*10, lambda v: v or "null"])
+		self.failUnless("<TR><TD>10</TD><TD>x</TD></TR>" in result)
+		self.failUnless("<TR><TD>20</TD><TD>null</TD></TR>" in result)
+
+	def testIdentityLeftOut(self):
+		result = self._getTabledata([utils.identity, None])
+		self.failUnless("<TR><TD>1</TD><TD>x</TD></TR>" in result)
+	
+	def testMapperErrorReported(self):
+		result = self._getTabledata([lambda v: 1/0, None])
+		self.failUnless("content is probably incomplete" in result)
+		self.failUnless("division by zero" in result)
+
+
 class ParamTypecodeGuessingTest(testhelpers.SimpleSampleComparisonTest):
 
 	functionToRun = staticmethod(votable.guessParamAttrsForValue)
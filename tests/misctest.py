@@ -542,6 +542,81 @@ class ObscorePublishedTest(testhelpers.VerboseTest):
 		self.assertEqual(res, [{'obs_creator_did': u'replaced'}])
 
 
+class _MaterializedObscore(testhelpers.TestResource):
+
+	resources = [('conn', tresc.dbConnection)]
+
+	def make(self, dependents):
+		from gavo import rsc
+		conn = dependents["conn"]
+		obscoreRD = base.caches.getRD("//obscore")
+		base.setConfig("ivoa", "materializeObscore", "True")
+		self.store = rsc.makeData(obscoreRD.getById("materialize"),
+			connection=conn)
+		rsc.makeData(obscoreRD.getById("create"), connection=conn)
+
+		dd = base.parseFromString(rscdesc.RD,
+			_obscoreRDTrunk%'productType="\'image\'"').getById("import")
+		dd.rd.sourceId = "__testing__"
+		self.data = rsc.makeData(dd, forceSource=[{"accref": "foo/mat"}],
+			connection=conn)
+		return conn
+
+	def clean(self, conn):
+		from gavo import rsc
+		base.setConfig("ivoa", "materializeObscore", "False")
+		try:
+			self.data.drop(self.data.dd, connection=conn)
+			rsc.makeData(base.caches.getRD("//obscore").getById("create"),
+				connection=conn)
+			self.store.dropTables(rsc.parseNonValidating)
+			conn.commit()
+		except:
+			conn.rollback()
+			raise
+
+
+class MaterializedObscoreTest(testhelpers.VerboseTest):
+
+	resources = [('conn', _MaterializedObscore())]
+
+	def testRowsMaterialized(self):
+		self.assertEqual(list(self.conn.query("select obs_id, obscore_source"
+			" from ivoa._obscorestore where obs_id='foo/mat'")),
+			[("foo/mat", "test.glob")])
+
+	def testViewOnStore(self):
+		viewDef = list(self.conn.query(
+			"select pg_get_viewdef('ivoa.obscore'::regclass)"))[0][0]
+		self.failUnless("_obscorestore" in viewDef)
+		self.assertEqual(list(self.conn.query("select dataproduct_type"
+			" from ivoa.obscore where obs_id='foo/mat'")), [("image",)])
+
+
+class ObscoreReimportTest(tresc.TestWithDBConnection):
+	"""tests for re-importing and dropping obscore-published tables.
+	"""
+	def _getSources(self):
+		return list(self.conn.query("select tableName"
+			" from ivoa._obscoresources where tableName='test.glob'"))
+
+	def testReimportAndDrop(self):
+		from gavo import rsc
+		dd = base.parseFromString(rscdesc.RD,
+			_obscoreRDTrunk%'productType="\'image\'"').getById("import")
+		dd.rd.sourceId = "__testing__"
+		rsc.makeData(dd, forceSource=[{"accref": "foo/re1"}],
+			connection=self.conn)
+		data = rsc.makeData(dd, forceSource=[{"accref": "foo/re2"}],
+			connection=self.conn)
+		self.assertEqual(self._getSources(), [("test.glob",)])
+		self.assertEqual(list(self.conn.query("select obs_id from ivoa.obscore"
+			" where obs_id like 'foo/re%%'")), [("foo/re2",)])
+
+		data.drop(dd, connection=self.conn)
+		self.assertEqual(self._getSources(), [])
+
+
 class _ModifiedObscoreTables(testhelpers.TestResource):
 	
 	def make(self, dependents):
@@ -1024,6 +1099,38 @@ class PgValidatorTest(testhelpers.VerboseTest):
 		base.sqltypeToPgValidator("spoint")("wurst")
 
 
+class PgBinaryTest(testhelpers.VerboseTest):
+	def testInteger(self):
+		self.assertEqual(base.sqltypeToPgBinary("integer")(-2), 
+			"\xff\xff\xff\xfe")
+
+	def testTimestamp(self):
+		self.assertEqual(base.sqltypeToPgBinary("timestamp")(
+			datetime.datetime(2000, 1, 1, 0, 0, 1)),
+			"\x00\x00\x00\x00\x00\x0fB@")
+
+	def testUnicode(self):
+		self.assertEqual(base.sqltypeToPgBinary("unicode")(u"\xe4"), "\xc3\xa4")
+
+	def testArray(self):
+		self.assertEqual(base.sqltypeToPgBinary("smallint[]")([1, None]),
+			"\x00\x00\x00\x01\x00\x00\x00\x01\x00\x00\x00\x15"
+			"\x00\x00\x00\x02\x00\x00\x00\x01"
+			"\x00\x00\x00\x02\x00\x01\xff\xff\xff\xff")
+
+	def testRejecting(self):
+		self.assertRaisesWithMsg(base.ConversionError,
+			"No Postgres binary COPY type for spoint",
+			base.sqltypeToPgBinary,
+			("spoint",))
+
+	def testRejectingRaw(self):
+		self.assertRaisesWithMsg(base.ConversionError,
+			"No Postgres binary COPY type for raw",
+			base.sqltypeToPgBinary,
+			("raw",))
+
+
 from gavo.user import validation
 
 class GavoTableValTest(testhelpers.VerboseTest):
@@ -1145,6 +1252,27 @@ class RDManiTest(testhelpers.VerboseTest):
 				(u'hcdtest', u'ssa_redshift', -0.001, 0.7),
 				(u'hcdtest', u'ssa_timeExt', None, None)])
 
+	def testSampledLimits(self):
+		from gavo.user import info
+		td = self.ssaTable.tableDef.copy(None)
+		samplePercent = info.annotateDBTable(td, sampleRows=1)
+		self.failUnless(0<samplePercent<100)
+		sampledMin = td.getColumnByName("accsize").annotations["min"]
+		self.failUnless(sampledMin is None or 213<=sampledMin<=225)
+
+	def testSamplingNeedsServer(self):
+		from gavo.user import info
+
+		class FakeConn(object):
+			def __init__(self, version):
+				self.version = version
+			def getServerVersion(self):
+				return self.version
+
+		self.assertEqual([info.serverCanSample(FakeConn(v)) 
+				for v in ["9.4", "9.5", "10.1", "weird"]],
+			[False, True, True, False])
+
 	def testGetChangedRD(self):
 		res = rdmanipulator.getChangedRD(self.ssaTable.tableDef.rd.sourceId,
 			rdmanipulator.iterLimitsForTable(
@@ -1162,5 +1290,56 @@ class RDManiTest(testhelpers.VerboseTest):
 			in res)
 
 
+class LRUCacheTest(testhelpers.VerboseTest):
+	def testItemLimit(self):
+		cache = base.caches.LRUCache(maxItems=2, budget=None)
+		cache["a"], cache["b"] = 1, 2
+		cache["a"]
+		cache["c"] = 3
+		self.assertEqual(set(cache.keys()), set(["a", "c"]))
+		self.assertEqual(cache.getStats()["evictions"], 1)
+
+	def testByteLimit(self):
+		cache = base.caches.LRUCache(maxBytes=10, budget=None)
+		cache["a"] = "x"*6
+		cache["b"] = "y"*3
+		self.assertEqual(cache.currentBytes, 9)
+		cache["c"] = "z"*3
+		self.failIf("a" in cache)
+		self.assertEqual(cache.currentBytes, 6)
+
+	def testCounters(self):
+		cache = base.caches.LRUCache(budget=None)
+		cache["a"] = "x"
+		self.failUnless("a" in cache)
+		cache["a"]
+		self.assertEqual(cache.get("b"), None)
+		stats = cache.getStats()
+		self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+	def testTTL(self):
+		cache = base.caches.LRUCache(ttl=-1, budget=None)
+		cache["a"] = "x"
+		self.assertRaises(KeyError, lambda: cache["a"])
+		self.assertEqual(cache.currentBytes, 0)
+
+	def testBudget(self):
+		budget = base.caches.MemoryBudget(10)
+		c1 = base.caches.LRUCache(budget=budget)
+		c2 = base.caches.LRUCache(budget=budget)
+		c1["a"] = "x"*4
+		c2["b"] = "y"*4
+		c1["c"] = "z"*4
+		self.assertEqual(c1.keys(), ["c"])
+		self.assertEqual(c2.keys(), ["b"])
+		self.assertEqual(budget.getTotalBytes(), 8)
+
+	def testMakeCache(self):
+		base.caches.makeCache("getTestLRU", lambda key: key*2, maxItems=1)
+		self.assertEqual(base.caches.getTestLRU("ab"), "abab")
+		self.assertEqual(base.caches.getTestLRU("cd"), "cdcd")
+		base.caches.clearForName("cd")
+
+
 if __name__=="__main__":
 	testhelpers.main(KVLMakeTest)
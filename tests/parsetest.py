@@ -94,6 +94,58 @@ class SimpleParseTest(testhelpers.VerboseTest):
 			self.assertTrue(msg.endswith("tests/testInput.txt')"))
 
 
+class ParallelParseTest(testhelpers.VerboseTest):
+	"""tests for parsing sources in worker processes.
+	"""
+	def _getDD(self):
+		return base.parseFromString(rscdef.DataDescriptor, '<data>'
+			'<sources pattern="testInput*.txt"/>'
+			'<columnGrammar><col key="val1">3</col>'
+			'<col key="val2">6-10</col></columnGrammar>'
+			'<table id="foo"><column name="x" type="integer"/>'
+			'<column name="y" type="text"/>'
+			'</table><rowmaker id="bla_foo">'
+			'<map dest="y" src="val2"/>'
+			'<map dest="x" src="val1"/>'
+			'</rowmaker><make table="foo" rowmaker="bla_foo"/></data>')
+
+	def testBasic(self):
+		with _inputFile("testInput1.txt", "xx1xxabc, xxxx\n"):
+			with _inputFile("testInput2.txt", "xx2xxdef, xxxx\nxx3xxghi\n"):
+				data = rsc.makeData(self._getDD(),
+					rsc.parseNonValidating.change(parallel=2))
+				self.assertEqual(sorted(data.getPrimaryTable().rows), [
+					{'y': u'abc,', 'x': 1},
+					{'y': u'def,', 'x': 2},
+					{'y': u'ghi', 'x': 3}])
+
+	def testNotifying(self):
+		with _inputFile("testInput1.txt", "xx1xxabc, xxxx\n"):
+			with _inputFile("testInput2.txt", "xx2xxdef, xxxx\nxx3xxghi\n"):
+				oldRead = base.ui.totalRead
+				rsc.makeData(self._getDD(),
+					rsc.parseNonValidating.change(parallel=2))
+				self.assertEqual(base.ui.totalRead-oldRead, 3)
+
+	def testMaxRows(self):
+		with _inputFile("testInput1.txt", "xx1xxabc, xxxx\nxx2xxdef\n"):
+			with _inputFile("testInput2.txt", "xx3xxghi\n"):
+				data = rsc.makeData(self._getDD(),
+					rsc.parseNonValidating.change(parallel=2, 
+						maxRows=base.ui.totalRead+1))
+				self.assertEqual(data.getPrimaryTable().rows, [
+					{'y': u'abc,', 'x': 1}])
+
+	def testRaising(self):
+		with _inputFile("testInput1.txt", "xx1xxabc, xxxx\n"):
+			with _inputFile("testInput2.txt", "xxxxxabc, xxxx\n"):
+				self.assertRaisesWithMsg(base.ValidationError,
+					"Field x: While building x in bla_foo: invalid"
+					" literal for int() with base 10: 'x'",
+					rsc.makeData,
+					(self._getDD(), rsc.parseNonValidating.change(parallel=2)))
+
+
 class RowsetTest(testhelpers.VerboseTest):
 	def assertQueryReturns(self, query, expected):
 		cursor = self.conn.cursor()
@@ -192,6 +192,32 @@ class RaccrefTest(_TestWithProductsTable):
 		prod = products.RAccref.fromString("data/a.imp?preview=true")
 		self.assertEqual(prod.params, {"preview": True})
 
+	def testBulkProductsRows(self):
+		rows = products.getProductsRows(
+			["data/a.imp", "data/b.imp", "junkomatix/@@ridiculosa"])
+		self.assertEqual(set(rows), set(["data/a.imp", "data/b.imp"]))
+		self.assertEqual(rows["data/a.imp"]["owner"], "X_test")
+
+	def testProductsRowShared(self):
+		products.RAccref("data/a.imp").productsRow["mime"] = "junk/changed"
+		self.assertEqual(
+			products.RAccref("data/a.imp").productsRow["mime"],
+			"text/plain")
+		self.assertFalse(products._getCachedProductsRow("data/a.imp") is None)
+
+		base.ui.notifyDBTableModified("dc.products")
+		self.assertEqual(products._getCachedProductsRow("data/a.imp"), None)
+
+	def testPrefetchedRowsUsed(self):
+		with products.productsRowsPrefetched(["data/a.imp"]) as rows:
+			rows["data/a.imp"]["mime"] = "text/x-prefetched"
+			self.assertEqual(
+				products.RAccref("data/a.imp").productsRow["mime"],
+				"text/x-prefetched")
+		self.assertEqual(
+			products.RAccref("data/a.imp").productsRow["mime"],
+			"text/plain")
+
 
 class ProductsCoreTest(_TestWithProductsTable):
 	def _getProductFor(self, accref, moreFields={}):
@@ -342,6 +368,55 @@ class AutoPreviewTest(testhelpers.VerboseTest):
 			self.assertEqual(prod.read(200), "Abc, die Katze")
 
 
+class PreviewCacheLimitTest(testhelpers.VerboseTest):
+	def setUp(self):
+		self.origPath = products.PreviewCacheManager.cachePath
+		self.origLimit = base.getConfig("web", "previewCacheSize")
+		products.PreviewCacheManager.cachePath = os.path.join(
+			base.getConfig("tempDir"), "prevlimit")
+		os.mkdir(products.PreviewCacheManager.cachePath)
+		products.PreviewCacheManager._cacheBytes = None
+		base.setConfig("web", "previewCacheSize", "25")
+
+	def tearDown(self):
+		cachePath = products.PreviewCacheManager.cachePath
+		for name in os.listdir(cachePath):
+			os.unlink(os.path.join(cachePath, name))
+		os.rmdir(cachePath)
+		products.PreviewCacheManager.cachePath = self.origPath
+		products.PreviewCacheManager._cacheBytes = None
+		base.setConfig("web", "previewCacheSize", str(self.origLimit))
+
+	def _save(self, accref, data, mtime):
+		cacheName = products.PreviewCacheManager.getCacheName(accref)
+		products.PreviewCacheManager.saveToCache(data, cacheName)
+		if os.path.exists(cacheName):
+			os.utime(cacheName, (mtime, mtime))
+
+	def testEviction(self):
+		evictionsBefore = products.PreviewCacheManager.getStats()["evictions"]
+		self._save("a/old", "x"*10, 1)
+		self._save("a/used", "y"*10, 2)
+		# getting a preview makes it recently used
+		self.assertFalse(products.PreviewCacheManager.getCachedPreviewPath(
+			"a/used") is None)
+		self._save("a/new", "z"*10, 3)
+
+		self.assertEqual(products.PreviewCacheManager.getCachedPreviewPath(
+			"a/old"), None)
+		self.assertFalse(products.PreviewCacheManager.getCachedPreviewPath(
+			"a/used") is None)
+		self.assertEqual(
+			products.PreviewCacheManager.getStats()["evictions"]-evictionsBefore,
+			1)
+
+	def testStats(self):
+		stats = products.PreviewCacheManager.getStats()
+		for key in ["hits", "misses", "generated", "hitRate", 
+				"meanGenerationTime", "maxGenerationTime"]:
+			self.assertTrue(key in stats)
+
+
 class MangledFITSProductsTest(testhelpers.VerboseTest):
 	resources = [("fitsTable", tresc.fitsTable)]
 
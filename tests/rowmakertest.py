@@ -10,6 +10,9 @@ Tests for the various structures in rscdef.
 
 import datetime
 import os
+import struct
+
+import numpy
 
 from gavo.helpers import testhelpers
 
@@ -330,6 +333,109 @@ class VarTest(testhelpers.VerboseTest):
 		self.assertEqual(mapper({}, None), {'si': None})
 
 
+class BatchRowmakerTest(testhelpers.VerboseTest):
+	"""tests for vectorised rowmakers.
+	"""
+	def _getMapper(self, tableCode, rowmakerCode):
+		dd = base.parseFromString(rscdef.DataDescriptor,
+			'<data><table id="foo">%s</table>'
+			'<make table="foo"><rowmaker id="_foo" vectorised="True">%s</rowmaker>'
+			'</make></data>'%(tableCode, rowmakerCode))
+		td = dd.getTableDefById("foo")
+		return dd.makes[0].rowmaker.compileBatchForTableDef(td)
+
+	def _getChunk(self, **columns):
+		return rscdef.ColumnChunk(3, columns)
+
+	def testChunkRows(self):
+		self.assertEqual(list(rscdef.ColumnChunk(2,
+			{"a": numpy.array([1, 2]), "b": "x"}).iterRows()),
+			[{"a": 1, "b": "x"}, {"a": 2, "b": "x"}])
+
+	def testChunkHead(self):
+		chunk = rscdef.ColumnChunk(3, {"a": numpy.array([1, 2, 3]), "b": "x"})
+		self.assertEqual(list(chunk.getHead(2).iterRows()),
+			[{"a": 1, "b": "x"}, {"a": 2, "b": "x"}])
+		self.failUnless(chunk.getHead(3) is chunk)
+
+	def testBasic(self):
+		mapper = self._getMapper('<column name="x" type="integer"/>'
+			'<column name="y" type="real"/><column name="z" type="text"/>',
+			'<var name="t">@a*2</var>'
+			'<map dest="x" src="a"/><map dest="y">@t+0.5</map>'
+			'<map dest="z">"const"</map>')
+		self.assertEqual(mapper(self._getChunk(a=numpy.array([1., 2., 3.])), None),
+			[{"x": 1, "y": 2.5, "z": "const"},
+			{"x": 2, "y": 4.5, "z": "const"},
+			{"x": 3, "y": 6.5, "z": "const"}])
+
+	def testConversion(self):
+		mapper = self._getMapper('<column name="x" type="text"/>',
+			'<map dest="x" src="a"/>')
+		self.assertEqual(mapper(self._getChunk(
+				a=numpy.array(["ab", "c", "d"])), None),
+			[{"x": u"ab"}, {"x": u"c"}, {"x": u"d"}])
+
+	def testNullExpr(self):
+		mapper = self._getMapper('<column name="x" type="integer"/>',
+			'<map dest="x" src="a" nullExpr="-1"/>')
+		self.assertEqual(mapper(self._getChunk(a=numpy.array([1, -1, 3])), None),
+			[{"x": 1}, {"x": None}, {"x": 3}])
+
+	def testMessages(self):
+		mapper = self._getMapper('<column name="x" type="integer"/>',
+			'<map dest="x">@b</map>')
+		self.assertRaisesWithMsg(base.ValidationError,
+			"Field x: While building x in _foo: Key 'b' not found in a mapping.",
+			mapper, (self._getChunk(a=numpy.array([1, -1, 3])), None))
+
+	def testApplyFallsBack(self):
+		self.assertEqual(self._getMapper('<column name="x" type="integer"/>',
+			'<apply><code>pass</code></apply>'), None)
+
+	def testSeparateCaches(self):
+		dd = base.parseFromString(rscdef.DataDescriptor,
+			'<data><table id="foo"><column name="x" type="integer"/></table>'
+			'<make table="foo"><rowmaker vectorised="True"><map dest="x" src="a"/>'
+			'</rowmaker></make></data>')
+		td, rowmaker = dd.getTableDefById("foo"), dd.makes[0].rowmaker
+		self.failIf(isinstance(rowmaker.compileForTableDef(td),
+			rmkdef.BatchRowmaker))
+		self.failUnless(isinstance(rowmaker.compileBatchForTableDef(td),
+			rmkdef.BatchRowmaker))
+		self.failIf(isinstance(rowmaker.compileForTableDef(td),
+			rmkdef.BatchRowmaker))
+
+	def _makeVectorisedData(self, 
+			parseOptions=rsc.parseNonValidating):
+		with testhelpers.testFile("vecinput.bin", "".join(
+				struct.pack("!id", i, i/2.) for i in range(12000))) as srcName:
+			dd = base.parseFromString(rscdef.DataDescriptor,
+				'<data><sources pattern="%s"/>'
+				'<binaryGrammar><binaryRecordDef binfmt="big">s(i)t(d)'
+				'</binaryRecordDef></binaryGrammar>'
+				'<table id="foo"><column name="x" type="integer"/>'
+				'<column name="y" type="double precision"/></table>'
+				'<make table="foo"><rowmaker vectorised="True">'
+				'<map dest="x" src="s"/><map dest="y">@t*2</map>'
+				'</rowmaker></make></data>'%srcName)
+			return rsc.makeData(dd, parseOptions)
+
+	def testMakeData(self):
+		oldRead = base.ui.totalRead
+		rows = self._makeVectorisedData().getPrimaryTable().rows
+		self.assertEqual(len(rows), 12000)
+		self.assertEqual(rows[0], {"x": 0, "y": 0.})
+		self.assertEqual(rows[-1], {"x": 11999, "y": 11999.})
+		self.assertEqual(base.ui.totalRead-oldRead, 12000)
+
+	def testMakeDataMaxRows(self):
+		rows = self._makeVectorisedData(rsc.parseNonValidating.change(
+			maxRows=base.ui.totalRead+10)).getPrimaryTable().rows
+		self.assertEqual(len(rows), 10)
+		self.assertEqual(rows[-1], {"x": 9, "y": 9.})
+
+
 class SimpleMapsTest(testhelpers.VerboseTest):
 	def testBasic(self):
 		dd, td = makeDD('<column name="si" type="smallint"/>'
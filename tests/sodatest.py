@@ -566,7 +566,12 @@ def _dissectSODAFile(sodaFile):
 
 	It also calls cleanup(), if it's there -- basically, that's stuff
 	nevow does for us in actual action.
+
+	Streamed FITS cutouts are serialised here.
 	"""
+	if hasattr(sodaFile, "cutout"):
+		return sodaFile.type, "".join(sodaFile.cutout.iterBytes())
+
 	content = sodaFile.fp.getContent()
 	sodaFile.fp.remove()
 	if hasattr(sodaFile, "cleanup"):
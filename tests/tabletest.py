@@ -520,6 +520,28 @@ class QueryTableTest(testhelpers.VerboseTest):
 			list,
 			(table,))
 
+	def testMatchLimitOverflow(self):
+		table = rsc.QueryTable(self.basetable.tableDef, 
+			"SELECT * FROM %s LIMIT %%(limit)s"%self.basetable.tableDef.getQName(),
+			connection=self.conn, pars={"limit": 2}, matchLimit=1)
+		self.assertEqual(len(list(table)), 1)
+		self.assertEqual(base.getMetaText(table, "_queryStatus"), "Overflowed")
+
+	def testMatchLimitOk(self):
+		table = rsc.QueryTable(self.basetable.tableDef, 
+			"SELECT * FROM %s LIMIT 1"%self.basetable.tableDef.getQName(),
+			connection=self.conn, matchLimit=1)
+		self.assertEqual(len(list(table)), 1)
+		self.assertEqual(base.getMetaText(table, "_queryStatus"), "Ok")
+
+	def testNoMatchLimit(self):
+		# taprunner relies on this
+		table = rsc.QueryTable(self.basetable.tableDef, 
+			"SELECT * FROM %s LIMIT 1"%self.basetable.tableDef.getQName(),
+			connection=self.conn)
+		self.assertEqual(len(list(table)), 1)
+		self.assertEqual(base.getMetaText(table, "_queryStatus"), "OVERFLOW")
+
 	def testRefusesRows(self):
 		self.assertRaisesWithMsg(base.Error,
 			"QueryTables cannot be constructed with rows.",
@@ -36,6 +36,7 @@ from gavo import utils
 from gavo import votable
 from gavo.helpers import testtricks
 from gavo.protocols import tap
+from gavo.protocols import tapcache
 from gavo.protocols import taprunner
 from gavo.protocols import uws
 from gavo.protocols import uwsactions
@@ -250,6 +251,104 @@ class TAPTransitionsTest(testhelpers.VerboseTest):
 			tap.WORKER_SYSTEM.destroy(jobId)
 
 
+class _RecordingTransport(object):
+	def __init__(self):
+		self.written = []
+	
+	def write(self, data):
+		self.written.append(data)
+
+
+class WorkerPoolProtocolTest(testhelpers.VerboseTest):
+	def _getProtocol(self):
+		proto = tap.WorkerPoolProtocol(tap.WORKER_SYSTEM)
+		proto.transport = _RecordingTransport()
+		return proto
+
+	def testAssignment(self):
+		proto = self._getProtocol()
+		self.assertEqual(proto.assignJob("abc"), None)
+		proto.outReceived("idle 23\nidle 2")
+		proto.outReceived("4\n")
+		self.assertEqual(proto.idlePIDs, [23, 24])
+		self.assertEqual(proto.assignJob("abc"), 23)
+		self.assertEqual(proto.transport.written, ["23 abc\n"])
+		self.assertEqual(proto.jobsForPIDs, {23: "abc"})
+
+	def testIdleEnded(self):
+		proto = self._getProtocol()
+		proto.outReceived("idle 23\nidle 24\nended 23\n")
+		self.assertEqual(proto.idlePIDs, [24])
+
+	def testHungJobErrored(self):
+		proto = self._getProtocol()
+		jobId = tap.WORKER_SYSTEM.getNewJobId(
+			parameters={"query": "bogus", "request": "doQuery",
+			"LANG": "ADQL"})
+		try:
+			with tap.WORKER_SYSTEM.changeableJob(jobId) as wjob:
+				wjob.change(phase=uws.EXECUTING)
+			proto.outReceived("idle 23\n")
+			proto.assignJob(jobId)
+			proto.outReceived("ended 23\n")
+			job = tap.WORKER_SYSTEM.getJob(jobId)
+			self.assertEqual(job.phase, uws.ERROR)
+			self.assertEqual(proto.jobsForPIDs, {})
+		finally:
+			tap.WORKER_SYSTEM.destroy(jobId)
+
+	def testPreloadKeepsMTHUsable(self):
+		taprunner._preloadForPool()
+		self.assertEqual(base.caches.getMTH(None).getTableDefForTable(
+			"tap_schema.tables").id, "tables")
+
+
+class ResultCacheTest(testhelpers.VerboseTest):
+	def setUp(self):
+		testhelpers.VerboseTest.setUp(self)
+		self.cacheDir = os.path.join(base.getConfig("tempDir"), "rescache")
+		self.cache = tapcache.ResultCache(self.cacheDir, 30)
+
+	def tearDown(self):
+		for name in os.listdir(self.cacheDir):
+			os.unlink(os.path.join(self.cacheDir, name))
+		os.rmdir(self.cacheDir)
+		testhelpers.VerboseTest.tearDown(self)
+
+	def _record(self, key, token, content):
+		destF = StringIO()
+		with self.cache.recording(key, token, destF) as f:
+			f.write(content)
+		self.assertEqual(destF.getvalue(), content)
+
+	def testRoundtrip(self):
+		self._record("abc", (("a.b", "23", None),), "<RESOURCE>x</RESOURCE>")
+		destF = StringIO()
+		tapcache.copyFromCache(
+			self.cache.open("abc", (("a.b", "23", None),)), "votable", destF)
+		self.assertEqual(destF.getvalue(), 
+			"<RESOURCE>"+tapcache.CACHE_INFO+"x</RESOURCE>")
+
+	def testTokenMismatch(self):
+		self._record("abc", (("a.b", "23", None),), "x")
+		self.assertEqual(self.cache.open("abc", (("a.b", "24", None),)), None)
+
+	def testFailedWriteNotCached(self):
+		def fail():
+			with self.cache.recording("abc", (), StringIO()) as f:
+				f.write("x")
+				raise ValueError("Write failed")
+		self.assertRaises(ValueError, fail)
+		self.assertEqual(os.listdir(self.cacheDir), [])
+
+	def testEviction(self):
+		self._record("old", (), "x"*20)
+		os.utime(os.path.join(self.cacheDir, "old.dat"), (1, 1))
+		self._record("new", (), "y"*20)
+		self.assertEqual(self.cache.open("old", ()), None)
+		self.assertEqual(self.cache.open("new", ()).read(), "y"*20)
+
+
 class UploadSyntaxOKTest(testhelpers.VerboseTest):
 	__metaclass__ = testhelpers.SamplesBasedAutoTest
 	def _runTest(self, sample):
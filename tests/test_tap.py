@@ -40,6 +40,7 @@ from gavo.helpers import trialhelpers
 
 from gavo import base
 from gavo import rscdesc
+from gavo.protocols import tap
 from gavo.protocols import scs  # for table's q3c mixin
 from gavo.web import weberrors
 from gavo.web.taprender import TAPRenderer
@@ -179,6 +180,22 @@ class SyncQueryTest(TAPRenderTest):
 				'"queryStatus": "OVERFLOW"'])
 
 
+	def testNoJobCreated(self):
+		nJobs = len(list(tap.WORKER_SYSTEM.getIdsAndPhases()))
+
+		def assertNoNewJobs(res):
+			self.assertEqual(
+				len(list(tap.WORKER_SYSTEM.getIdsAndPhases())), nJobs)
+			return res
+
+		return self.assertGETHasStrings("/sync", {
+				"REQUEST": "doQuery",
+				"LANG": "ADQL",
+				"QUERY": 'SELECT alpha, delta FROM test.adql WHERE alpha<3',
+				"FORMAT": "text/csv"
+			}, ['2.0,14.0']
+			).addCallback(assertNoNewJobs)
+
 	def testBin2Table(self):
 		return self.assertGETHasStrings("/sync", {
 				"REQUEST": "doQuery",
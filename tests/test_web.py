@@ -13,6 +13,7 @@ import atexit
 import time
 import os
 import re
+import zlib
 
 from twisted.internet import reactor
 
@@ -24,6 +25,7 @@ from gavo import svcs
 from gavo import utils
 from gavo import votable
 from gavo.imp import formal
+from gavo.web import caching
 
 base.DEBUG = True
 from gavo.user.logui import LoggingUI
@@ -425,6 +427,39 @@ class BuiltinResTest(trialhelpers.ArchiveTest):
 			["PNG", "IEND"])
 
 
+class CachedPageTest(trialhelpers.RenderTest):
+	def _render(self, acceptEncoding=None):
+		page = caching.CachedPage("abc"*1000, 
+			{"content-type": "text/plain", "content-length": "3000"}, None)
+
+		def mogrify(req):
+			if acceptEncoding:
+				req.requestHeaders.setRawHeaders("accept-encoding", [acceptEncoding])
+
+		return trialhelpers._doRender(page, 
+			trialhelpers.getRequestContext("/", requestMogrifier=mogrify))
+
+	def testPlain(self):
+		def assertPlain(result):
+			content, request = result
+			self.assertEqual(content, "abc"*1000)
+			self.assertEqual(request.headers_out["content-length"], "3000")
+			self.assertEqual(request.headers_out["vary"], "Accept-Encoding")
+			self.failIf("content-encoding" in request.headers_out)
+
+		return self._render().addCallback(assertPlain)
+
+	def testGzip(self):
+		def assertGzipped(result):
+			content, request = result
+			self.assertEqual(request.headers_out["content-encoding"], "gzip")
+			self.assertEqual(
+				zlib.decompress(content, 16+zlib.MAX_WBITS), "abc"*1000)
+			self.failUnless(request.headers_out["etag"].endswith('-gz"'))
+
+		return self._render("gzip, deflate").addCallback(assertGzipped)
+
+
 class ConstantRenderTest(trialhelpers.ArchiveTest):
 	def testVOPlot(self):
 		return self.assertGETHasStrings("/__system__/run/voplot/fixed",
@@ -555,6 +590,29 @@ class SCSTest(trialhelpers.ArchiveTest):
 			['name="warning"', 'query limit was reached']
 			).addCallback(assertMaxrecHonored)
 
+	def _getStreamedRows(self, res):
+		return list(votable.parseString(res[0]).next())
+
+	def testStreamingOverflow(self):
+		def assertOverflowed(res):
+			self.assertEqual(len(self._getStreamedRows(res)), 1)
+			self.failUnless('<INFO name="QUERY_STATUS" value="OVERFLOW"' in res[0])
+
+		return trialhelpers.runQuery(self.renderer, "GET",
+			"/data/cores/scsstream/scs.xml", 
+			{"RA": ["1"], "DEC": ["2"], "SR": ["180"], "MAXREC": ["1"]}
+			).addCallback(assertOverflowed)
+
+	def testStreamingComplete(self):
+		def assertComplete(res):
+			self.assertEqual(len(self._getStreamedRows(res)), 2)
+			self.failIf('value="OVERFLOW"' in res[0])
+
+		return trialhelpers.runQuery(self.renderer, "GET",
+			"/data/cores/scsstream/scs.xml", 
+			{"RA": ["1"], "DEC": ["2"], "SR": ["180"]}
+			).addCallback(assertComplete)
+
 	def testSCSDefaultSort(self):
 		def assertSorted(res):
 			self.assertEqual([r[1] for r in votable.parseString(res[0]).next()],
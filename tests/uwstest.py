@@ -10,6 +10,7 @@ If it's TAP we're talking about, use taptest.py.
 #c COPYING file in the source distribution.
 
 
+import contextlib
 import datetime
 import Queue
 import threading
@@ -298,6 +299,10 @@ def _makeUWSRequest(inArgs, inMethod="GET", inFields={}):
 		def getUser(cls):
 			return None
 
+		@classmethod
+		def getClientIP(cls):
+			return "127.0.0.1"
+
 		@classmethod
 		def setHeader(cls, key, value):
 			pass
@@ -406,5 +411,94 @@ class UserUWSTest(testhelpers.VerboseTest):
 			worker1.destroy(jobId)
 
 
+def _makeSchedRow(jobId, submitter, costEstimate=None, minutes=0):
+	t0 = datetime.datetime(2017, 10, 1)
+	return {"jobId": jobId, "submitter": submitter,
+		"costEstimate": costEstimate,
+		"creationTime": t0+datetime.timedelta(minutes=minutes),
+		"destructionTime": t0+datetime.timedelta(days=2, minutes=-minutes)}
+
+
+class SchedulerTest(testhelpers.VerboseTest):
+	def testDestructionOrder(self):
+		self.assertEqual(uws.QueueScheduler().getStartOrder([
+				_makeSchedRow("a", "x", minutes=1),
+				_makeSchedRow("b", "x", minutes=2),
+				_makeSchedRow("c", "y", minutes=0)], []),
+			["b", "a", "c"])
+
+	def testFairShare(self):
+		queued = [_makeSchedRow("x%d"%i, "x", minutes=i) for i in range(4)
+			]+[_makeSchedRow("y0", "y", minutes=10)]
+		self.assertEqual(uws.FairShareScheduler().getStartOrder(queued, []),
+			["x0", "y0", "x1", "x2", "x3"])
+
+	def testRunningCounts(self):
+		queued = [_makeSchedRow("x0", "x"), _makeSchedRow("y0", "y", minutes=1)]
+		self.assertEqual(uws.FairShareScheduler().getStartOrder(queued, 
+				[_makeSchedRow("r", "x")]),
+			["y0", "x0"])
+
+	def testCheapFirst(self):
+		queued = [_makeSchedRow("exp", "x", 1e7),
+			_makeSchedRow("cheap", "x", 20, minutes=5),
+			_makeSchedRow("similar", "x", 50, minutes=6)]
+		self.assertEqual(uws.FairShareScheduler().getStartOrder(queued, []),
+			["cheap", "similar", "exp"])
+
+	def testCaps(self):
+		queued = [_makeSchedRow("x%d"%i, "x", minutes=i) for i in range(3)
+			]+[_makeSchedRow("y0", "y")]
+		running = [_makeSchedRow("r", "x")]
+		sched = uws.FairShareScheduler(maxPerSubmitter=2)
+		self.assertEqual(sched.getStartOrder(queued, running), ["y0", "x0"])
+		self.assertEqual(sched.getStartOrder(queued, running, ignoreCaps=True),
+			["y0", "x0", "x1", "x2"])
+
+
+class _EstimatingUWS(uws.UWSWithQueueing):
+	"""a UWSWithQueueing just good enough for _fillCostEstimates.
+	"""
+	def __init__(self):
+		self._costsTried = set()
+		self.estimated, self.stored = [], {}
+
+	def estimateJobCost(self, jobId):
+		self.estimated.append(jobId)
+		return {"cheap": 20.}.get(jobId)
+
+	@contextlib.contextmanager
+	def changeableJob(self, jobId):
+		class FakeJob(object):
+			def change(job, **kwargs):
+				self.stored[jobId] = kwargs
+		yield FakeJob()
+
+
+class CostEstimateTest(testhelpers.VerboseTest):
+	def testEstimatesOnce(self):
+		worker = _EstimatingUWS()
+		queued = [_makeSchedRow("cheap", "x"), _makeSchedRow("unknown", "x"),
+			_makeSchedRow("known", "x", 1e3)]
+		worker._fillCostEstimates(queued)
+		self.assertEqual(queued[0]["costEstimate"], 20.)
+		self.assertEqual(worker.stored, {"cheap": {"costEstimate": 20.}})
+
+		queued[0]["costEstimate"] = None
+		worker._fillCostEstimates(queued)
+		self.assertEqual(worker.estimated, ["cheap", "unknown"])
+
+	def testForgetsDequeued(self):
+		worker = _EstimatingUWS()
+		worker._fillCostEstimates([_makeSchedRow("unknown", "x")])
+		worker._fillCostEstimates([])
+		self.assertEqual(worker._costsTried, set())
+
+	def testJobListTitle(self):
+		self.assertEqual(uwsactions._getSchedulingTitle(0, 1234.5),
+			"queue position 1, estimated cost 1.23e+03")
+		self.assertEqual(uwsactions._getSchedulingTitle(None, None), None)
+
+
 if __name__=="__main__":
 	testhelpers.main(JobHandlingTest)
@@ -224,5 +224,37 @@ class STCMappingTest(_MapperTestBase):
 		self.failUnless(res["pos"].startswith("Position FK5"))
 
 
+class TupleIterationTest(testhelpers.VerboseTest):
+	def _getTable(self):
+		td = base.parseFromString(rscdef.TableDef, """<table>
+			<column name="pos" type="spoint"/>
+			<column name="x" type="integer"/></table>""")
+		table = rsc.TableForDef(td)
+		table.iterTuples = lambda: iter([
+			(pgsphere.SPoint(0.2, 0.6), 1), (None, 2)])
+		return table
+
+	def testMappedTuples(self):
+		sm = valuemappers.SerManager(self._getTable())
+		self.failUnless(sm.canIterTuples())
+		res = list(sm.getMappedTuples())
+		self.failUnless(res[0][0].startswith("Position UNKNOWNFrame"))
+		self.assertEqual(res[0][1], 1)
+		self.assertEqual(res[1], (None, 2))
+
+	def testUnmappedTuples(self):
+		sm = valuemappers.SerManager(self._getTable())
+		res = list(sm.getUnmappedTuples())
+		self.assertEqual(res[1], (None, 2))
+		self.failUnless(isinstance(res[0][0], pgsphere.SPoint))
+
+	def testFromDicts(self):
+		table = rsc.TableForDef(self._getTable().tableDef,
+			rows=[{"pos": None, "x": 3}])
+		sm = valuemappers.SerManager(table)
+		self.failIf(sm.canIterTuples())
+		self.assertEqual(list(sm.getUnmappedTuples()), [(None, 3)])
+
+
 if __name__=="__main__":
 	testhelpers.main(HTMLMapperTest)
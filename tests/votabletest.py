@@ -368,6 +368,50 @@ class NastyImportTest(tresc.TestWithDBConnection):
 				['Position ICRS 2 3', '2005-05-06T21:10:19', '2005-05-06T21:10:19']], 
 			test, nameMaker=votableread.AutoQuotedNameMaker())
 
+	def testBulkBinary(self):
+		V = votable.V
+		vot = votable.asString(V.VOTABLE[V.RESOURCE[votable.DelayedTable(
+			V.TABLE[
+				V.FIELD(name="ra", datatype="double", ucd="pos.eq.ra;meta.main"),
+				V.FIELD(name="dec", datatype="double", ucd="pos.eq.dec;meta.main"),
+				V.FIELD(name="d", datatype="char", arraysize="*",
+					xtype="adql:TIMESTAMP")],
+			[[i, i/10., "2005-05-06T21:10:%02d"%i] for i in range(25)]
+				+[[None, None, None]],
+			V.BINARY)]])
+		table = votableread.uploadVOTable("junk", StringIO(vot), self.conn,
+			batchSize=10)
+
+		data = list(table.iterQuery(table.tableDef, "",
+			limits=("ORDER BY ra", {})))
+		self.assertEqual(len(data), 26)
+		self.assertEqual(data[3], {"ra": 3., "dec": 0.3,
+			"d": datetime.datetime(2005, 5, 6, 21, 10, 3)})
+		self.assertEqual(data[-1], {"ra": None, "dec": None, "d": None})
+		self.assertEqual(len(table.tableDef.indices), 1)
+
+	def testBulkBlocks(self):
+		V = votable.V
+		vot = votable.asString(V.VOTABLE[V.RESOURCE[votable.DelayedTable(
+			V.TABLE[
+				V.FIELD(name="id", datatype="short"),
+				V.FIELD(name="ra", datatype="double", ucd="pos.eq.ra;meta.main"),
+				V.FIELD(name="dec", datatype="float", ucd="pos.eq.dec;meta.main"),
+				V.FIELD(name="n", datatype="long")],
+			[[i, i/10., -i/2., 2**40+i] for i in range(25)]
+				+[[25, None, None, None]],
+			V.BINARY2)]])
+		table = votableread.uploadVOTable("junk", StringIO(vot), self.conn,
+			batchSize=10)
+
+		data = list(table.iterQuery(table.tableDef, "",
+			limits=("ORDER BY id", {})))
+		self.assertEqual(len(data), 26)
+		self.assertEqual(data[3], {"id": 3, "ra": 0.3, "dec": -1.5,
+			"n": 2**40+3})
+		self.assertEqual(data[-1], {"id": 25, "ra": None, "dec": None,
+			"n": None})
+
 
 class MetaTest(testhelpers.VerboseTest):
 	"""tests for inclusion of some meta items.